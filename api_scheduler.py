@@ -0,0 +1,444 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from spotipy.exceptions import SpotifyException
+from config import SPOTIFY_API_RATE, SPOTIFY_API_BURST
+from job_queue import JOBS_DB_PATH
+import telemetry
+
+# Files de priorité : les requêtes interactives passent toujours avant la synchronisation en masse
+LANE_INTERACTIVE = 'interactive'
+LANE_BACKGROUND = 'background'
+LANES = [LANE_INTERACTIVE, LANE_BACKGROUND]
+
+# Nombre de nouvelles tentatives lorsque Spotify répond 429 (Too Many Requests)
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+# État partagé par tous les processus (CLI, pages Streamlit, workers de la file de tâches, processus
+# d'extraction) : seau à jetons, demandes en attente et statistiques, dans la base de la file de tâches
+SCHEDULER_DB_PATH = JOBS_DB_PATH
+
+# Une demande dont le processus n'a pas donné signe de vie depuis ce délai est abandonnée (processus tué)
+TICKET_TIMEOUT = 10.0
+# Intervalle entre deux battements de cœur d'une demande en attente (secondes)
+HEARTBEAT_INTERVAL = 2.0
+# Intervalle maximal entre deux vérifications d'une demande en attente (secondes)
+POLL_INTERVAL = 0.2
+# Nombre d'attentes récentes conservées par voie pour le 95e centile
+RECENT_WAITS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_bucket (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    tokens REAL NOT NULL,
+    last_refill REAL NOT NULL,
+    paused_until REAL NOT NULL DEFAULT 0,
+    rate REAL NOT NULL,
+    burst REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS api_tickets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lane TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    cost REAL NOT NULL,
+    finish_tag REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_api_tickets_head ON api_tickets(priority, finish_tag, id);
+CREATE TABLE IF NOT EXISTS api_lanes (
+    lane TEXT PRIMARY KEY,
+    virtual_time REAL NOT NULL DEFAULT 0,
+    granted INTEGER NOT NULL DEFAULT 0,
+    total_wait REAL NOT NULL DEFAULT 0,
+    max_wait REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS api_user_finish (
+    lane TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    finish_tag REAL NOT NULL,
+    PRIMARY KEY (lane, user_id)
+);
+CREATE TABLE IF NOT EXISTS api_user_weights (
+    user_id TEXT PRIMARY KEY,
+    weight REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS api_waits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lane TEXT NOT NULL,
+    wait REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_api_waits_lane ON api_waits(lane, id);
+"""
+
+
+# Objets hérités du processus parent lors d'un fork (connexions SQLite, ordonnanceur) : conservés sans
+# être utilisés ni fermés, leur fermeture dans l'enfant pourrait toucher aux verrous du parent
+_inherited = []
+
+
+def _reset_after_fork():
+    """Processus enfant (fork, ex: processus d'extraction) : repartir d'un ordonnanceur propre au processus"""
+    ApiScheduler._instance_lock = threading.Lock()
+    if ApiScheduler._instance is not None:
+        _inherited.append(ApiScheduler._instance)
+        ApiScheduler._instance = None
+
+
+class ApiScheduler:
+    """
+    Ordonnanceur des appels à l'API Spotify, commun à tous les processus de l'application
+
+    Le budget global (seau à jetons) est partagé entre deux files : interactive et arrière-plan.
+    Dans chaque file, les utilisateurs sont servis par file d'attente équitable pondérée (WFQ) :
+    une grosse extraction ne peut pas monopoliser le budget au détriment des autres utilisateurs.
+
+    Le seau, les files et les statistiques sont stockés dans SQLite et modifiés dans des transactions
+    BEGIN IMMEDIATE : une extraction dans un worker et les pages Streamlit consomment le même budget,
+    et une demande interactive d'un processus passe avant les demandes d'arrière-plan des autres.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        """Retourne l'ordonnanceur du processus (son état est partagé avec les autres processus)"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self, rate=SPOTIFY_API_RATE, burst=SPOTIFY_API_BURST, db_path=None):
+        """
+        Le budget n'est initialisé que par le premier processus : les suivants rejoignent le seau existant
+        sans le modifier (voir set_rate pour changer le budget de toute l'application).
+
+        Parameters:
+            rate (float): Nombre de requêtes autorisées par seconde en régime permanent, pour toute l'application
+            burst (int): Nombre de requêtes pouvant partir en rafale
+            db_path (str): Base SQLite de l'état partagé (par défaut SCHEDULER_DB_PATH)
+        """
+        self._db_path = db_path or SCHEDULER_DB_PATH
+        # Une connexion par thread (les connexions sqlite3 ne se partagent pas entre threads)
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO api_bucket (id, tokens, last_refill, rate, burst) "
+                         "VALUES (1, ?, ?, ?, ?)", (float(burst), time.time(), float(rate), float(burst)))
+            conn.executemany("INSERT OR IGNORE INTO api_lanes (lane) VALUES (?)", [(lane,) for lane in LANES])
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid != os.getpid():
+            # Connexion héritée du processus parent (fork) : SQLite interdit de l'utiliser dans l'enfant
+            _inherited.append(conn)
+            conn = None
+        if conn is None:
+            os.makedirs(os.path.dirname(self._db_path), exist_ok=True)
+            conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction en écriture : les autres processus attendent sa fin pour lire ou modifier l'état"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _refill(conn, now):
+        """
+        État du seau à l'instant `now`, jetons accumulés depuis le dernier remplissage compris
+
+        Simple lecture : le seau n'est réécrit que lorsqu'un appel est autorisé (voir _grant).
+        """
+        bucket = conn.execute("SELECT * FROM api_bucket WHERE id = 1").fetchone()
+        elapsed = max(now - bucket['last_refill'], 0.0)
+        return {'tokens': min(bucket['burst'], bucket['tokens'] + elapsed * bucket['rate']),
+                'rate': bucket['rate'], 'burst': bucket['burst'], 'paused_until': bucket['paused_until']}
+
+    def set_rate(self, rate, burst=None):
+        """Modifie le budget d'appels de toute l'application"""
+        with self._transaction() as conn:
+            now = time.time()
+            bucket = self._refill(conn, now)
+            burst = float(burst) if burst is not None else bucket['burst']
+            conn.execute("UPDATE api_bucket SET rate = ?, burst = ?, tokens = ?, last_refill = ? WHERE id = 1",
+                         (float(rate), burst, min(bucket['tokens'], burst), now))
+
+    def set_user_weight(self, user_id, weight):
+        """Définit le poids d'un utilisateur (un poids de 2 obtient deux fois plus de requêtes)"""
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO api_user_weights (user_id, weight) VALUES (?, ?)",
+                         (user_id, float(weight)))
+
+    def penalize(self, retry_after):
+        """Suspend toutes les requêtes de tous les processus pendant `retry_after` secondes (réponse 429)"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE api_bucket SET paused_until = MAX(paused_until, ?), tokens = 0, last_refill = ? "
+                         "WHERE id = 1", (time.time() + retry_after, time.time()))
+
+    def _grant(self, conn, now, lane, cost, finish_tag, wait):
+        """
+        Consomme les jetons d'un appel si le seau le permet (dans la transaction de l'appelant)
+
+        Returns:
+            bool: True si l'appel est autorisé
+        """
+        bucket = self._refill(conn, now)
+        if now < bucket['paused_until'] or bucket['tokens'] < cost:
+            return False
+        conn.execute("UPDATE api_bucket SET tokens = ?, last_refill = ? WHERE id = 1", (bucket['tokens'] - cost, now))
+        self._record_wait(conn, lane, finish_tag, wait)
+        return True
+
+    def _enqueue(self, user_id, lane, cost):
+        """
+        Sert immédiatement une demande que rien ne précède, sinon l'inscrit dans la file de sa voie
+
+        Returns:
+            int: Identifiant de la demande inscrite, ou None si l'appel est déjà autorisé
+        """
+        now = time.time()
+        priority = LANES.index(lane)
+        with self._transaction() as conn:
+            # Étiquette de fin virtuelle : un utilisateur ayant déjà beaucoup consommé passe après les autres
+            row = conn.execute("SELECT weight FROM api_user_weights WHERE user_id = ?", (user_id,)).fetchone()
+            weight = row['weight'] if row else 1.0
+            virtual_time = conn.execute("SELECT virtual_time FROM api_lanes WHERE lane = ?",
+                                        (lane,)).fetchone()['virtual_time']
+            row = conn.execute("SELECT finish_tag FROM api_user_finish WHERE lane = ? AND user_id = ?",
+                               (lane, user_id)).fetchone()
+            finish_tag = max(virtual_time, row['finish_tag'] if row else 0.0) + cost / weight
+            conn.execute("INSERT OR REPLACE INTO api_user_finish (lane, user_id, finish_tag) VALUES (?, ?, ?)",
+                         (lane, user_id, finish_tag))
+
+            # File vide devant la demande : inscription, autorisation et consommation en une transaction
+            ahead = conn.execute("SELECT 1 FROM api_tickets WHERE heartbeat_at >= ? "
+                                 "AND (priority < ? OR (priority = ? AND finish_tag <= ?)) LIMIT 1",
+                                 (now - TICKET_TIMEOUT, priority, priority, finish_tag)).fetchone()
+            if ahead is None and self._grant(conn, now, lane, cost, finish_tag, 0.0):
+                return None
+
+            cursor = conn.execute(
+                """INSERT INTO api_tickets (lane, priority, user_id, cost, finish_tag, enqueued_at, heartbeat_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (lane, priority, user_id, cost, finish_tag, now, now))
+            return cursor.lastrowid
+
+    def acquire(self, user_id, lane=LANE_BACKGROUND, cost=1.0):
+        """
+        Attend qu'un appel à l'API soit autorisé
+
+        Les demandes en attente surveillent la file par simples lectures (mode WAL, sans verrou d'écriture) :
+        seule la demande en tête ouvre une transaction, quand le seau contient assez de jetons. Le battement
+        de cœur d'une demande n'est écrit que toutes les HEARTBEAT_INTERVAL secondes.
+
+        Parameters:
+            user_id (str): Utilisateur pour lequel l'appel est effectué
+            lane (str): Voie de la requête (LANE_INTERACTIVE ou LANE_BACKGROUND)
+            cost (float): Nombre de jetons consommés par l'appel
+
+        Returns:
+            float: Temps d'attente en secondes
+        """
+        if lane not in LANES:
+            raise ValueError(f"Voie inconnue: {lane}. Options disponibles: {LANES}")
+
+        started = time.time()
+        ticket_id = self._enqueue(user_id, lane, cost)
+        if ticket_id is None:
+            return 0.0
+
+        last_heartbeat = started
+        try:
+            while True:
+                conn = self._connect()
+                now = time.time()
+                queue = conn.execute("SELECT id, enqueued_at, finish_tag, heartbeat_at FROM api_tickets "
+                                     "ORDER BY priority, finish_tag, id").fetchall()
+                position = next((i for i, row in enumerate(queue) if row['id'] == ticket_id), None)
+                stale_head = bool(queue) and queue[0]['heartbeat_at'] < now - TICKET_TIMEOUT
+
+                if position is None:
+                    # Demande retirée de la file (processus resté figé au-delà de TICKET_TIMEOUT) : la réinscrire
+                    ticket_id = self._enqueue(user_id, lane, cost)
+                    if ticket_id is None:
+                        return now - started
+                    last_heartbeat = time.time()
+                    continue
+
+                if stale_head or now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    with self._transaction() as conn:
+                        conn.execute("UPDATE api_tickets SET heartbeat_at = ? WHERE id = ?", (now, ticket_id))
+                        # Demandes de processus disparus : elles ne doivent pas bloquer la file
+                        conn.execute("DELETE FROM api_tickets WHERE heartbeat_at < ?", (now - TICKET_TIMEOUT,))
+                    last_heartbeat = now
+                    continue
+
+                bucket = self._refill(conn, now)
+                if position == 0:
+                    if now >= bucket['paused_until'] and bucket['tokens'] >= cost:
+                        with self._transaction() as conn:
+                            now = time.time()
+                            head = conn.execute("SELECT id, enqueued_at, finish_tag FROM api_tickets "
+                                                "ORDER BY priority, finish_tag, id LIMIT 1").fetchone()
+                            if head is not None and head['id'] == ticket_id and \
+                                    self._grant(conn, now, lane, cost, head['finish_tag'], now - head['enqueued_at']):
+                                conn.execute("DELETE FROM api_tickets WHERE id = ?", (ticket_id,))
+                                ticket_id = None
+                                return now - head['enqueued_at']
+                        continue
+                    # En tête de file : attendre la pause 429 ou le prochain jeton
+                    delay = max(bucket['paused_until'] - now, (cost - bucket['tokens']) / bucket['rate'])
+                else:
+                    # Derrière d'autres demandes : attendre à peu près le temps de les servir
+                    delay = position * cost / bucket['rate'] / 2
+                time.sleep(min(max(delay, POLL_INTERVAL / 4), POLL_INTERVAL))
+        finally:
+            if ticket_id is not None:
+                # Demande abandonnée (exception, interruption) : la retirer de la file
+                with self._transaction() as conn:
+                    conn.execute("DELETE FROM api_tickets WHERE id = ?", (ticket_id,))
+
+    @staticmethod
+    def _record_wait(conn, lane, finish_tag, wait):
+        conn.execute("""UPDATE api_lanes SET virtual_time = ?, granted = granted + 1, total_wait = total_wait + ?,
+                                             max_wait = MAX(max_wait, ?)
+                        WHERE lane = ?""", (finish_tag, wait, wait, lane))
+        cursor = conn.execute("INSERT INTO api_waits (lane, wait) VALUES (?, ?)", (lane, wait))
+        conn.execute("DELETE FROM api_waits WHERE lane = ? AND id <= ?", (lane, cursor.lastrowid - RECENT_WAITS))
+
+    def get_stats(self):
+        """
+        Retourne l'état de chaque voie, pour tous les processus
+
+        Returns:
+            dict: Par voie, profondeur de file, nombre d'appels servis et temps d'attente (secondes)
+        """
+        conn = self._connect()
+        stale = time.time() - TICKET_TIMEOUT
+        stats = {}
+        for lane in LANES:
+            row = conn.execute("SELECT * FROM api_lanes WHERE lane = ?", (lane,)).fetchone()
+            depth = conn.execute("SELECT COUNT(*) FROM api_tickets WHERE lane = ? AND heartbeat_at >= ?",
+                                 (lane, stale)).fetchone()[0]
+            recent = [r[0] for r in conn.execute("SELECT wait FROM api_waits WHERE lane = ? ORDER BY wait",
+                                                 (lane,))]
+            granted = row['granted'] if row else 0
+            stats[lane] = {
+                'queue_depth': depth,
+                'granted': granted,
+                'avg_wait': row['total_wait'] / granted if granted else 0.0,
+                'p95_wait': recent[int(0.95 * (len(recent) - 1))] if recent else 0.0,
+                'max_wait': row['max_wait'] if row else 0.0
+            }
+        return stats
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class ScheduledSpotify:
+    """
+    Enveloppe un client spotipy : chaque appel passe par l'ordonnanceur avant d'atteindre l'API
+    """
+
+    def __init__(self, sp, user_id, lane=LANE_BACKGROUND, scheduler=None):
+        """
+        Parameters:
+            sp (spotipy.Spotify): Client Spotify authentifié
+            user_id (str): Utilisateur pour lequel les appels sont effectués
+            lane (str): Voie utilisée par ce client (LANE_INTERACTIVE ou LANE_BACKGROUND)
+            scheduler (ApiScheduler): Ordonnanceur à utiliser (par défaut l'instance partagée)
+        """
+        self._sp = sp
+        self._user_id = user_id
+        self._lane = lane
+        self._scheduler = scheduler or ApiScheduler.get_instance()
+        _install_response_hook(sp)
+
+    def __getattr__(self, name):
+        attr = getattr(self._sp, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def scheduled_call(*args, **kwargs):
+            attempt = 0
+            wait = 0.0
+            while True:
+                wait += self._scheduler.acquire(self._user_id, self._lane)
+                started = time.monotonic()
+                _response_info.bytes = 0
+                _response_info.retries = 0
+                try:
+                    result = attr(*args, **kwargs)
+                    _record_call(name, args, time.monotonic() - started, attempt, wait)
+                    return result
+                except SpotifyException as e:
+                    if e.http_status != 429 or attempt >= MAX_RATE_LIMIT_RETRIES:
+                        _record_call(name, args, time.monotonic() - started, attempt, wait, error=True)
+                        raise
+                    # Limite atteinte : suspendre tout le monde le temps demandé par Spotify
+                    headers = e.headers or {}
+                    retry_after = int(headers.get('Retry-After', 1))
+                    print(f"Limite de l'API atteinte, nouvelle tentative dans {retry_after}s...")
+                    self._scheduler.penalize(retry_after)
+                    attempt += 1
+                except Exception:
+                    _record_call(name, args, time.monotonic() - started, attempt, wait, error=True)
+                    raise
+
+        return scheduled_call
+
+
+# Taille des réponses HTTP reçues et nouvelles tentatives de la session HTTP (erreurs serveur)
+# pour le thread courant pendant l'appel en cours
+_response_info = threading.local()
+
+
+def _count_response_bytes(response, *args, **kwargs):
+    """Crochet de la session requests de spotipy : ajoute la réponse aux mesures de l'appel en cours"""
+    length = response.headers.get('Content-Length')
+    _response_info.bytes = getattr(_response_info, 'bytes', 0) + (int(length) if length else len(response.content))
+    retries = getattr(response.raw, 'retries', None)
+    if retries is not None:
+        _response_info.retries = getattr(_response_info, 'retries', 0) + len(retries.history)
+
+
+def _install_response_hook(sp):
+    """Mesure la taille des réponses sur la session HTTP du client (une seule fois par session)"""
+    session = getattr(sp, '_session', None)
+    hooks = getattr(session, 'hooks', None)
+    if hooks is not None and _count_response_bytes not in hooks.setdefault('response', []):
+        hooks['response'].append(_count_response_bytes)
+
+
+def _record_call(method_name, args, latency, retries, wait, error=False):
+    """
+    Transmet les mesures d'un appel à la télémétrie si une exécution est en cours de mesure
+
+    La taille de la réponse vient de la réponse HTTP (octets reçus) ; elle vaut 0 si le client
+    n'utilise pas de session requests. Les nouvelles tentatives comptent les réponses 429 traitées par
+    l'ordonnanceur et celles faites par la session HTTP sur erreur serveur.
+    """
+    run = telemetry.current_run()
+    if run is None:
+        return
+    run.record_call(telemetry.endpoint_name(method_name, args), latency,
+                    response_bytes=getattr(_response_info, 'bytes', 0),
+                    retries=retries + getattr(_response_info, 'retries', 0), wait=wait, error=error)
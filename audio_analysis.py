@@ -0,0 +1,387 @@
+import os
+import glob
+import shutil
+import numpy as np
+import pandas as pd
+from config import DATA_DIR
+from data_lock import artifact_lock
+from storage import artifact_exists, load_artifact
+
+# Analyses audio détaillées (sections, segments, temps) : tableaux NumPy indexés par track_id
+ANALYSIS_DIR = os.path.join(DATA_DIR, "audio_analysis")
+# Lots compressés écrits pendant l'ingestion, fusionnés ensuite dans les tableaux consolidés
+CHUNKS_DIR = os.path.join(ANALYSIS_DIR, "chunks")
+INDEX_PATH = os.path.join(ANALYSIS_DIR, "index.csv")
+# Résumé par titre (une ligne par titre), lisible sans charger les tableaux
+SUMMARY_PATH = os.path.join(DATA_DIR, "audio_analysis.csv")
+# Verrou couvrant lots, tableaux consolidés, index et résumé : exclusif pour écrire, partagé pour lire
+AUDIO_ANALYSIS_LOCK = "audio_analysis"
+
+SEGMENT_COLUMNS = (['start', 'duration', 'confidence', 'loudness_start', 'loudness_max', 'loudness_max_time']
+                   + [f'pitch_{i}' for i in range(12)] + [f'timbre_{i}' for i in range(12)])
+BEAT_COLUMNS = ['start', 'duration', 'confidence']
+SECTION_COLUMNS = ['start', 'duration', 'confidence', 'loudness', 'tempo', 'tempo_confidence',
+                   'key', 'mode', 'time_signature']
+
+# Colonnes de chaque type de tableau
+KINDS = {
+    'segments': SEGMENT_COLUMNS,
+    'beats': BEAT_COLUMNS,
+    'sections': SECTION_COLUMNS
+}
+
+
+def _to_array(items, columns):
+    """
+    Convertit une liste d'éléments de l'API en tableau float32 (une ligne par élément)
+
+    Une colonne est construite en une seule conversion NumPy ; hauteurs (pitches) et timbre sont
+    convertis d'un bloc en tableaux (éléments x 12). Les valeurs manquantes deviennent NaN.
+    """
+    array = np.empty((len(items), len(columns)), dtype=np.float32)
+    if not items:
+        return array
+
+    vectors = {}
+    for j, column in enumerate(columns):
+        if column.startswith(('pitch_', 'timbre_')):
+            name, index = column.rsplit('_', 1)
+            key = 'pitches' if name == 'pitch' else 'timbre'
+            if key not in vectors:
+                vectors[key] = np.array([item.get(key) or [0] * 12 for item in items], dtype=np.float32)
+            array[:, j] = vectors[key][:, int(index)]
+        else:
+            array[:, j] = np.array([item.get(column) for item in items], dtype=np.float32)
+    return array
+
+
+def parse_audio_analysis(analysis):
+    """
+    Convertit la réponse de l'API audio-analysis en tableaux et en résumé
+
+    Returns:
+        tuple: (dict des tableaux par type, dict du résumé)
+    """
+    arrays = {
+        'segments': _to_array(analysis.get('segments', []), SEGMENT_COLUMNS),
+        'beats': _to_array(analysis.get('beats', []), BEAT_COLUMNS),
+        'sections': _to_array(analysis.get('sections', []), SECTION_COLUMNS)
+    }
+
+    track = analysis.get('track', {})
+    sections = arrays['sections']
+    summary = {
+        'duration': track.get('duration'),
+        'tempo': track.get('tempo'),
+        'loudness': track.get('loudness'),
+        'n_sections': len(sections),
+        'n_segments': len(arrays['segments']),
+        'n_beats': len(arrays['beats']),
+        # Variabilité entre sections : tempo et volume évoluent-ils au cours du titre ?
+        'section_tempo_std': float(np.nanstd(sections[:, 4])) if len(sections) else None,
+        'section_loudness_std': float(np.nanstd(sections[:, 3])) if len(sections) else None
+    }
+    return arrays, summary
+
+
+def _write_chunk(track_ids, arrays_list):
+    """Écrit un lot d'analyses dans un fichier NumPy compressé (appelé sous le verrou exclusif)"""
+    os.makedirs(CHUNKS_DIR, exist_ok=True)
+    content = {'track_ids': np.array(track_ids)}
+
+    for kind in KINDS:
+        parts = [arrays[kind] for arrays in arrays_list]
+        content[kind] = np.concatenate(parts) if parts else np.zeros((0, len(KINDS[kind])), dtype=np.float32)
+        content[f'{kind}_offsets'] = np.cumsum([0] + [len(part) for part in parts]).astype(np.int64)
+
+    # Numéro suivant celui du dernier lot : une autre ingestion a pu écrire des lots entre-temps
+    existing = sorted(glob.glob(os.path.join(CHUNKS_DIR, "chunk_*.npz")))
+    chunk_index = int(os.path.basename(existing[-1])[len("chunk_"):-len(".npz")]) + 1 if existing else 0
+    chunk_path = os.path.join(CHUNKS_DIR, f"chunk_{chunk_index:05d}.npz")
+    temp_path = chunk_path + ".tmp.npz"
+    np.savez_compressed(temp_path, **content)
+    os.replace(temp_path, chunk_path)
+
+
+def _known_track_ids():
+    """Titres déjà analysés (tableaux consolidés et lots en attente de fusion)"""
+    known = set()
+    with artifact_lock(AUDIO_ANALYSIS_LOCK):
+        if os.path.exists(INDEX_PATH):
+            known.update(pd.read_csv(INDEX_PATH, usecols=['track_id'])['track_id'])
+        for chunk_path in glob.glob(os.path.join(CHUNKS_DIR, "chunk_*.npz")):
+            with np.load(chunk_path) as chunk:
+                known.update(chunk['track_ids'].tolist())
+    return known
+
+
+def ingest_audio_analysis(track_ids=None, sp=None, chunk_size=50):
+    """
+    Récupère l'analyse audio de chaque titre et la stocke sous forme de tableaux NumPy
+
+    Les titres déjà analysés sont ignorés ; l'ingestion peut donc être interrompue et reprise.
+    Les appels passent par l'ordonnanceur de l'API (voie arrière-plan).
+
+    Parameters:
+        track_ids (list): Titres à analyser (par défaut tous les titres extraits)
+        sp (spotipy.Spotify): Client Spotify à utiliser (optionnel)
+        chunk_size (int): Nombre de titres par lot écrit sur disque
+
+    Returns:
+        int: Nombre de titres analysés
+    """
+    if track_ids is None:
+        if not artifact_exists("tracks"):
+            print("Aucun titre extrait. Lancez d'abord l'extraction.")
+            return 0
+        track_ids = load_artifact("tracks", columns=['track_id'])['track_id'].dropna().unique().tolist()
+
+    known = _known_track_ids()
+    pending = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in known]
+
+    if not pending:
+        print("Analyses audio déjà à jour.")
+        return 0
+
+    if sp is None:
+        # Importations différées : le client Spotify n'est nécessaire que pour l'ingestion
+        from spotify_auth import SpotifyAuth
+        from api_scheduler import LANE_BACKGROUND
+        sp = SpotifyAuth.get_instance().get_scheduled_client(LANE_BACKGROUND)
+
+    print(f"Récupération de l'analyse audio pour {len(pending)} titres...")
+
+    batch_ids, batch_arrays, summaries = [], [], []
+    ingested = 0
+
+    for track_id in pending:
+        try:
+            analysis = sp.audio_analysis(track_id)
+        except Exception as e:
+            print(f"Analyse audio indisponible pour {track_id}: {e}")
+            continue
+
+        if not analysis:
+            continue
+
+        arrays, summary = parse_audio_analysis(analysis)
+        summary['track_id'] = track_id
+        batch_ids.append(track_id)
+        batch_arrays.append(arrays)
+        summaries.append(summary)
+
+        if len(batch_ids) >= chunk_size:
+            _save_batch(batch_ids, batch_arrays, summaries)
+            ingested += len(batch_ids)
+            print(f"{ingested}/{len(pending)} analyses enregistrées")
+            batch_ids, batch_arrays, summaries = [], [], []
+
+    if batch_ids:
+        _save_batch(batch_ids, batch_arrays, summaries)
+        ingested += len(batch_ids)
+
+    consolidate()
+    return ingested
+
+
+def _save_batch(track_ids, arrays_list, summaries):
+    """Écrit un lot d'analyses et complète le résumé, sous le verrou exclusif des analyses audio"""
+    with artifact_lock(AUDIO_ANALYSIS_LOCK, exclusive=True):
+        _write_chunk(track_ids, arrays_list)
+        _append_summary(summaries)
+
+
+def _append_summary(summaries):
+    """Ajoute au résumé les titres qui n'y figurent pas encore (appelé sous le verrou exclusif)"""
+    summary_df = pd.DataFrame(summaries)
+    if os.path.exists(SUMMARY_PATH):
+        known = set(pd.read_csv(SUMMARY_PATH, usecols=['track_id'])['track_id'])
+        summary_df = summary_df[~summary_df['track_id'].isin(known)]
+        if summary_df.empty:
+            return
+    columns = ['track_id'] + [col for col in summary_df.columns if col != 'track_id']
+    summary_df[columns].to_csv(SUMMARY_PATH, mode='a', header=not os.path.exists(SUMMARY_PATH), index=False)
+
+
+def consolidate():
+    """
+    Fusionne les lots compressés dans les tableaux consolidés (un fichier .npy par type)
+
+    Les tableaux consolidés sont écrits directement sur disque (np.lib.format.open_memmap) :
+    la fusion ne charge jamais toutes les analyses en mémoire.
+    """
+    with artifact_lock(AUDIO_ANALYSIS_LOCK, exclusive=True):
+        _consolidate()
+
+
+def _consolidate():
+    chunk_paths = sorted(glob.glob(os.path.join(CHUNKS_DIR, "chunk_*.npz")))
+    if not chunk_paths:
+        return
+
+    store = AudioAnalysisStore() if os.path.exists(INDEX_PATH) else None
+    index_frames = [store.index.reset_index()] if store is not None else []
+
+    # Premier passage : tailles des tableaux finaux
+    totals = {kind: (store.array_length(kind) if store is not None else 0) for kind in KINDS}
+    for chunk_path in chunk_paths:
+        with np.load(chunk_path) as chunk:
+            for kind in KINDS:
+                totals[kind] += int(chunk[f'{kind}_offsets'][-1])
+
+    os.makedirs(ANALYSIS_DIR, exist_ok=True)
+    outputs = {
+        kind: np.lib.format.open_memmap(os.path.join(ANALYSIS_DIR, f"{kind}.npy.tmp"), mode='w+',
+                                        dtype=np.float32, shape=(totals[kind], len(KINDS[kind])))
+        for kind in KINDS
+    }
+
+    # Second passage : copie des données existantes puis des lots
+    positions = {kind: 0 for kind in KINDS}
+    if store is not None:
+        for kind in KINDS:
+            length = store.array_length(kind)
+            outputs[kind][:length] = store.array(kind)
+            positions[kind] = length
+
+    for chunk_path in chunk_paths:
+        with np.load(chunk_path) as chunk:
+            index_part = {'track_id': chunk['track_ids']}
+            for kind in KINDS:
+                data = chunk[kind]
+                offsets = chunk[f'{kind}_offsets']
+                outputs[kind][positions[kind]:positions[kind] + len(data)] = data
+                index_part[f'{kind}_start'] = positions[kind] + offsets[:-1]
+                index_part[f'{kind}_stop'] = positions[kind] + offsets[1:]
+                positions[kind] += len(data)
+            index_frames.append(pd.DataFrame(index_part))
+
+    for output in outputs.values():
+        output.flush()
+    outputs.clear()
+    if store is not None:
+        store.close()
+
+    for kind in KINDS:
+        os.replace(os.path.join(ANALYSIS_DIR, f"{kind}.npy.tmp"), os.path.join(ANALYSIS_DIR, f"{kind}.npy"))
+
+    index_df = pd.concat(index_frames, ignore_index=True).drop_duplicates('track_id', keep='last')
+    index_df.to_csv(INDEX_PATH + ".tmp", index=False)
+    os.replace(INDEX_PATH + ".tmp", INDEX_PATH)
+
+    shutil.rmtree(CHUNKS_DIR, ignore_errors=True)
+    print(f"Analyses audio consolidées: {len(index_df)} titres")
+
+
+class AudioAnalysisStore:
+    """
+    Accès en lecture aux analyses audio consolidées
+
+    Les tableaux sont ouverts à la demande en mémoire mappée (np.load(mmap_mode='r')) :
+    seules les lignes effectivement lues sont chargées en mémoire.
+    """
+
+    def __init__(self, directory=ANALYSIS_DIR):
+        self.directory = directory
+        self._arrays = {}
+        # Index et tableaux ouverts ensemble sous le verrou partagé : une consolidation concurrente
+        # remplace les fichiers, les tableaux déjà mappés restent ceux de l'index lu
+        with artifact_lock(AUDIO_ANALYSIS_LOCK):
+            index_path = os.path.join(directory, "index.csv")
+            if os.path.exists(index_path):
+                self.index = pd.read_csv(index_path).set_index('track_id')
+            else:
+                self.index = pd.DataFrame(columns=[f'{kind}_{bound}' for kind in KINDS for bound in ('start', 'stop')])
+            for kind in KINDS:
+                self.array(kind)
+
+    def __contains__(self, track_id):
+        return track_id in self.index.index
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def track_ids(self):
+        return self.index.index.tolist()
+
+    def array(self, kind):
+        """Tableau complet d'un type ('segments', 'beats', 'sections') en mémoire mappée"""
+        if kind not in KINDS:
+            raise ValueError(f"Type inconnu: {kind}. Options disponibles: {list(KINDS.keys())}")
+        if kind not in self._arrays:
+            path = os.path.join(self.directory, f"{kind}.npy")
+            if os.path.exists(path):
+                self._arrays[kind] = np.load(path, mmap_mode='r')
+            else:
+                self._arrays[kind] = np.zeros((0, len(KINDS[kind])), dtype=np.float32)
+        return self._arrays[kind]
+
+    def array_length(self, kind):
+        return len(self.array(kind))
+
+    def get(self, kind, track_id):
+        """
+        Retourne les lignes d'un titre pour un type donné
+
+        Returns:
+            ndarray: Vue (sans copie) sur les lignes du titre, ou None si le titre n'est pas analysé
+        """
+        if track_id not in self:
+            return None
+        row = self.index.loc[track_id]
+        return self.array(kind)[int(row[f'{kind}_start']):int(row[f'{kind}_stop'])]
+
+    def segments(self, track_id):
+        return self.get('segments', track_id)
+
+    def beats(self, track_id):
+        return self.get('beats', track_id)
+
+    def sections(self, track_id):
+        return self.get('sections', track_id)
+
+    def frame(self, kind, track_id):
+        """Lignes d'un titre sous forme de DataFrame (colonnes nommées)"""
+        data = self.get(kind, track_id)
+        if data is None:
+            return None
+        return pd.DataFrame(np.asarray(data), columns=KINDS[kind])
+
+    def close(self):
+        self._arrays.clear()
+
+
+def get_sections_profile(track_ids=None):
+    """
+    Tempo et volume de chaque section, pour l'analyse de l'évolution au sein des titres
+
+    Parameters:
+        track_ids (list): Titres à inclure (par défaut tous les titres analysés)
+
+    Returns:
+        DataFrame: Une ligne par section (track_id, section, start, duration, tempo, loudness)
+    """
+    store = AudioAnalysisStore()
+    track_ids = store.track_ids if track_ids is None else [t for t in track_ids if t in store]
+
+    frames = []
+    for track_id in track_ids:
+        sections = store.frame('sections', track_id)
+        if sections is None or sections.empty:
+            continue
+        sections = sections[['start', 'duration', 'tempo', 'loudness']]
+        sections.insert(0, 'section', range(len(sections)))
+        sections.insert(0, 'track_id', track_id)
+        frames.append(sections)
+
+    if not frames:
+        return pd.DataFrame(columns=['track_id', 'section', 'start', 'duration', 'tempo', 'loudness'])
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    # Test du module
+    count = ingest_audio_analysis()
+    store = AudioAnalysisStore()
+    print(f"Ingestion terminée: {count} nouveaux titres, {len(store)} titres analysés au total.")
@@ -12,6 +12,33 @@ SPOTIFY_REDIRECT_URI = os.getenv('SPOTIFY_REDIRECT_URI', 'http://localhost:8888/
 # Étendue des permissions Spotify requises
 SPOTIFY_SCOPE = "user-library-read user-top-read playlist-read-private"
 
+# Budget d'appels à l'API Spotify partagé par tous les utilisateurs et toutes les tâches
+# (requêtes par seconde en régime permanent, et nombre de requêtes autorisées en rafale)
+SPOTIFY_API_RATE = float(os.getenv('SPOTIFY_API_RATE', '5'))
+SPOTIFY_API_BURST = int(os.getenv('SPOTIFY_API_BURST', '10'))
+
+# Nombre de processus utilisés pour extraire les playlists (1 = extraction séquentielle)
+EXTRACTION_WORKERS = int(os.getenv('MELODIA_EXTRACTION_WORKERS', '1'))
+
+# Marché (code pays ISO 3166-1) utilisé pour les meilleurs titres des artistes
+SPOTIFY_MARKET = os.getenv('SPOTIFY_MARKET', 'FR')
+
+# Durée de validité (secondes) des tops artistes/titres récupérés auprès de Spotify
+TOP_DATA_CACHE_TTL = int(os.getenv('MELODIA_TOP_DATA_CACHE_TTL', '3600'))
+
+# Nettoyage des données par lots de N titres, en mémoire constante (0 = tout en mémoire)
+PROCESSING_CHUNK_SIZE = int(os.getenv('MELODIA_PROCESSING_CHUNK_SIZE', '0'))
+
+# Élargissement relatif de la plage de tempo au-delà duquel les paramètres du traitement sont réajustés
+# (0.1 = 10 %) ; en deçà, les nouveaux titres sont traités avec les paramètres enregistrés
+PROCESSING_REFIT_DRIFT = float(os.getenv('MELODIA_PROCESSING_REFIT_DRIFT', '0.1'))
+
+# Écrire aussi une copie CSV de chaque fichier de données (en plus du format Parquet)
+EXPORT_CSV = os.getenv('MELODIA_EXPORT_CSV', 'false').lower() in ('1', 'true', 'yes')
+
+# Version de l'application, enregistrée dans les manifestes des fichiers de données
+APP_VERSION = "1.0.0"
+
 # Dossier pour sauvegarder les données
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
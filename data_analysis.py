@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
-import os
-from config import DATA_DIR
+from storage import artifact_exists, artifact_fingerprint, load_artifact, save_artifact
+from feature_matrix import load_aligned_feature_matrix
+from data_processing import artist_track_counts, explode_playlists
 
 # Variable globale pour suivre la profondeur de récursion
 _recursion_depth = 0
@@ -9,23 +10,24 @@ _recursion_depth = 0
 _analysis_cache = {}
 
 
-def load_data():
-    """Charge les données depuis les fichiers disponibles"""
-    # Chercher les fichiers dans l'ordre de préférence
-    potential_files = [
-        os.path.join(DATA_DIR, "cleaned_tracks.csv"),
-        os.path.join(DATA_DIR, "tracks_with_features.csv"),
-        os.path.join(DATA_DIR, "tracks.csv")
-    ]
+# Artefacts analysables, dans l'ordre de préférence
+ANALYSIS_SOURCES = ["cleaned_tracks", "tracks_with_features", "tracks"]
 
-    # Utiliser le premier fichier disponible
-    for file_path in potential_files:
-        if os.path.exists(file_path):
-            print(f"Chargement des données depuis {file_path}")
+
+def load_data(columns=None):
+    """
+    Charge les données depuis les fichiers disponibles
+
+    L'analyse lit toutes les colonnes (columns=None) : les titres catégorisés les conservent toutes.
+    """
+    # Utiliser le premier artefact disponible
+    for name in ANALYSIS_SOURCES:
+        if artifact_exists(name):
+            print(f"Chargement des données depuis {name}")
             try:
-                return pd.read_csv(file_path)
+                return load_artifact(name, columns=columns, optimize=True)
             except Exception as e:
-                print(f"Erreur lors du chargement de {file_path}: {e}")
+                print(f"Erreur lors du chargement de {name}: {e}")
 
     print("Aucun fichier de données trouvé.")
     return None
@@ -36,32 +38,46 @@ def get_basic_stats(df):
     if df is None or df.empty:
         return None
 
+    # Appartenance aux playlists et artistes : un titre compte dans chacune de ses playlists et pour
+    # chacun de ses artistes (voir data_processing)
+    playlists = explode_playlists(df, [])
+    artist_counts = artist_track_counts(df) if 'artist_name' in df.columns else None
+
     # Statistiques de base qui ne dépendent que des colonnes obligatoires
     stats = {
         'total_tracks': len(df),
-        'unique_artists': df['artist_name'].nunique() if 'artist_name' in df.columns else 0,
+        'unique_artists': len(artist_counts) if artist_counts is not None else 0,
         'unique_albums': df['album_name'].nunique() if 'album_name' in df.columns else 0,
-        'playlists': df['playlist_name'].nunique() if 'playlist_name' in df.columns else 0
+        'playlists': playlists['playlist_name'].nunique() if playlists is not None else 0
     }
 
     # Top artistes (si disponible)
-    if 'artist_name' in df.columns:
-        top_artists = df['artist_name'].value_counts().head(10).to_dict()
+    if artist_counts is not None:
+        top_artists = artist_counts.head(10).to_dict()
         stats['top_artists'] = top_artists
 
     # Top playlists (si disponible)
-    if 'playlist_name' in df.columns:
-        playlist_counts = df['playlist_name'].value_counts().to_dict()
+    if playlists is not None:
+        playlist_counts = playlists['playlist_name'].value_counts().to_dict()
         stats['playlist_counts'] = playlist_counts
 
     # Ajouter des statistiques sur les caractéristiques audio si disponibles
     audio_features = ['danceability', 'energy', 'valence', 'acousticness']
     available_features = [f for f in audio_features if f in df.columns]
 
+    # Colonnes lues directement dans la matrice float32 quand elle correspond aux données
+    matrix = load_aligned_feature_matrix(df, available_features)
+
     for feature in available_features:
-        stats[f'avg_{feature}'] = df[feature].mean()
-        stats[f'min_{feature}'] = df[feature].min()
-        stats[f'max_{feature}'] = df[feature].max()
+        if matrix is not None:
+            values = matrix.column(feature)
+            stats[f'avg_{feature}'] = float(np.nanmean(values))
+            stats[f'min_{feature}'] = float(np.nanmin(values))
+            stats[f'max_{feature}'] = float(np.nanmax(values))
+        else:
+            stats[f'avg_{feature}'] = df[feature].mean()
+            stats[f'min_{feature}'] = df[feature].min()
+            stats[f'max_{feature}'] = df[feature].max()
 
     return stats
 
@@ -85,13 +101,19 @@ def analyze_audio_features(df):
 
     # Corrélations entre les caractéristiques (si plus d'une caractéristique)
     if len(available_features) > 1:
-        correlations = df[available_features].corr()
+        matrix = load_aligned_feature_matrix(df, available_features)
+        if matrix is not None:
+            features_df = pd.DataFrame({feature: matrix.column(feature) for feature in available_features})
+        else:
+            features_df = df[available_features]
+        correlations = features_df.corr()
         analysis['correlations'] = correlations.to_dict()
 
     # Analyse par playlist si disponible
-    if 'playlist_name' in df.columns and len(available_features) > 0:
-        # Calculer les moyennes par playlist
-        playlist_analysis = df.groupby('playlist_name')[available_features].mean()
+    playlists = explode_playlists(df, available_features) if len(available_features) > 0 else None
+    if playlists is not None:
+        # Calculer les moyennes par playlist (un titre compte dans chacune de ses playlists)
+        playlist_analysis = playlists.groupby('playlist_name', observed=True)[available_features].mean()
         analysis['playlist_profiles'] = playlist_analysis.to_dict()
 
     return analysis
@@ -163,8 +185,7 @@ def categorize_music(df):
 
     # Sauvegarder le DataFrame catégorisé
     try:
-        categorized_path = os.path.join(DATA_DIR, "categorized_tracks.csv")
-        result_df.to_csv(categorized_path, index=False)
+        categorized_path = save_artifact(result_df, "categorized_tracks", producer="analysis")
         print(f"Titres catégorisés sauvegardés dans: {categorized_path}")
     except Exception as e:
         print(f"Erreur lors de la sauvegarde des données catégorisées: {e}")
@@ -177,7 +198,9 @@ def analyze_data(max_recursion_depth=1000):
     global _recursion_depth, _analysis_cache
 
     # Vérifier si nous avons déjà les résultats en cache
-    cache_key = "analysis_results"
+    # (la clé contient l'empreinte des données, lue dans le manifeste : une nouvelle extraction invalide le cache)
+    source = next((name for name in ANALYSIS_SOURCES if artifact_exists(name)), None)
+    cache_key = ("analysis_results", source, artifact_fingerprint(source) if source else None)
     if cache_key in _analysis_cache:
         print("Utilisation des résultats d'analyse en cache.")
         return _analysis_cache[cache_key]
@@ -227,6 +250,7 @@ def analyze_data(max_recursion_depth=1000):
 
         # Stocker les résultats en cache
         result = (stats, audio_analysis, categorized_df)
+        _analysis_cache.clear()
         _analysis_cache[cache_key] = result
 
         _recursion_depth -= 1
@@ -0,0 +1,128 @@
+import os
+import threading
+from contextlib import contextmanager
+from config import DATA_DIR
+
+try:
+    import fcntl
+except ImportError:
+    # Windows : msvcrt ne propose que des verrous exclusifs
+    fcntl = None
+    import msvcrt
+
+# Fichiers de verrou partagés par tous les processus (CLI, pages Streamlit, workers de la file de tâches)
+LOCKS_DIR = os.path.join(DATA_DIR, "locks")
+
+# Verrou du dossier de données : partagé par toute lecture/écriture d'artefact, exclusif pour tout effacer
+DATA_DIR_LOCK = "data_dir"
+
+# Verrous déjà détenus par le thread courant : nom -> [exclusif, nombre d'acquisitions, descripteur]
+_held = threading.local()
+
+
+def _held_locks():
+    if not hasattr(_held, 'locks'):
+        _held.locks = {}
+    return _held.locks
+
+
+def _acquire(fd, exclusive, blocking=True):
+    """Retourne False si le verrou n'est pas disponible et que blocking est faux"""
+    if fcntl is not None:
+        flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(fd, flags if blocking else flags | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+    os.lseek(fd, 0, os.SEEK_SET)
+    while True:
+        try:
+            # LK_LOCK réessaie pendant 10 secondes puis échoue : attendre aussi longtemps que nécessaire
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+
+
+def _release(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(name, exclusive=False, blocking=True):
+    """
+    Verrou partagé (lecteurs) ou exclusif (écrivain) entre processus
+
+    Réentrant dans un même thread : un verrou exclusif déjà détenu couvre les demandes partagées.
+
+    Parameters:
+        name (str): Nom du verrou (ex: nom d'un artefact)
+        exclusive (bool): Verrou exclusif
+        blocking (bool): Attendre que le verrou soit disponible ; sinon le bloc s'exécute sans le verrou
+
+    Yields:
+        bool: True si le verrou est détenu (toujours le cas si blocking est vrai)
+    """
+    held = _held_locks()
+    if name in held:
+        if exclusive and not held[name][0]:
+            if not blocking:
+                yield False
+                return
+            raise RuntimeError(f"Verrou {name} détenu en lecture : impossible de le passer en écriture")
+        held[name][1] += 1
+        try:
+            yield True
+        finally:
+            held[name][1] -= 1
+        return
+
+    os.makedirs(LOCKS_DIR, exist_ok=True)
+    fd = os.open(os.path.join(LOCKS_DIR, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if not _acquire(fd, exclusive, blocking):
+            yield False
+            return
+        held[name] = [exclusive, 1, fd]
+        try:
+            yield True
+        finally:
+            del held[name]
+            _release(fd)
+    finally:
+        os.close(fd)
+
+
+def remove_lock_file(name):
+    """Supprime le fichier d'un verrou devenu inutile (à appeler en détenant le verrou exclusif)"""
+    try:
+        os.remove(os.path.join(LOCKS_DIR, f"{name}.lock"))
+    except OSError:
+        # Fichier absent, ou encore ouvert ailleurs (Windows)
+        pass
+
+
+@contextmanager
+def artifact_lock(name, exclusive=False):
+    """
+    Verrou d'un artefact : partagé pour le lire, exclusif pour l'écrire ou le supprimer
+
+    Le verrou du dossier de données est pris en mode partagé, pour que clear_data attende la fin des
+    lectures et écritures en cours.
+    """
+    with file_lock(DATA_DIR_LOCK):
+        with file_lock(name, exclusive=exclusive):
+            yield
+
+
+@contextmanager
+def data_dir_lock():
+    """Verrou exclusif sur tout le dossier de données (suppression de toutes les données)"""
+    with file_lock(DATA_DIR_LOCK, exclusive=True):
+        yield
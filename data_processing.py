@@ -1,90 +1,571 @@
-import pandas as pd
 import os
-import re
-from datetime import datetime
-from config import DATA_DIR
+import json
+import sqlite3
+from datetime import datetime, timezone
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+from config import PROCESSING_CHUNK_SIZE, PROCESSING_REFIT_DRIFT
+from generations import generation_path
+from storage import (artifact_columns, artifact_exists, artifact_row_count, delete_artifact, iter_artifact_batches,
+                     load_artifact, save_artifact, save_artifact_batches, write_atomic)
+from feature_matrix import build_feature_matrix, build_feature_matrix_from_artifact
+from membership_index import PLAYLIST_CODES_ARTIFACT, build_membership_index, build_membership_index_from_artifact
 
 
-def load_data(merged=True):
-    """Charge les données depuis les fichiers CSV sauvegardés"""
-    if merged and os.path.exists(os.path.join(DATA_DIR, "tracks_with_features.csv")):
+def load_data(merged=True, optimize=True, columns=None):
+    """
+    Charge les données depuis les fichiers sauvegardés (types réduits si optimize, voir optimize_dtypes)
+
+    Le traitement lit toutes les colonnes (columns=None) : le fichier nettoyé les conserve toutes.
+    Les autres consommateurs ne lisent que les colonnes dont ils ont besoin.
+    """
+    if merged and artifact_exists("tracks_with_features"):
         # Charger le dataset fusionné si disponible
-        return pd.read_csv(os.path.join(DATA_DIR, "tracks_with_features.csv"))
-    elif os.path.exists(os.path.join(DATA_DIR, "tracks.csv")):
+        return load_artifact("tracks_with_features", columns=columns, optimize=optimize)
+    elif artifact_exists("tracks"):
         # Sinon, charger uniquement les titres
-        return pd.read_csv(os.path.join(DATA_DIR, "tracks.csv"))
+        return load_artifact("tracks", columns=columns, optimize=optimize)
     else:
         print("Aucun fichier de données trouvé.")
         return None
 
 
-def clean_data(df, deep_clean=False):
-    if deep_clean:
-        print("Nettoyage profond des données...")
-        # Approche simplifiée pour éviter les problèmes de récursion
-        # Utiliser uniquement les colonnes essentielles
-        essential_cols = ['track_id', 'track_name', 'artist_name', 'album_name']
-        if all(col in df.columns for col in essential_cols):
-            df = df[essential_cols + [col for col in df.columns if
-                                      col not in essential_cols and col in ['danceability', 'energy', 'valence',
-                                                                            'acousticness']]]
-    """Nettoie et prépare les données pour l'analyse"""
-    if df is None or df.empty:
-        return None
+# Formats de release_date renvoyés par Spotify : YYYY, YYYY-MM ou YYYY-MM-DD (précision 'year', 'month', 'day')
+_RELEASE_DATE_PATTERN = r'^(\d{4})(?:-(\d{2})(?:-(\d{2}))?)?$'
 
-    print("Nettoyage des données...")
 
-    # Faire une copie pour éviter de modifier l'original
-    cleaned_df = df.copy()
+def parse_release_dates(release_dates):
+    """
+    Analyse des dates de sortie en une seule passe vectorisée
 
-    # Vérifier si nous avons des caractéristiques audio
-    has_audio_features = all(feature in cleaned_df.columns for feature in
-                             ['danceability', 'energy', 'valence', 'acousticness'])
+    Les dates incomplètes sont placées au premier jour de leur période (ex: "1999" -> 1999-01-01) ;
+    les formats inconnus et les dates impossibles donnent NaT.
 
-    if not has_audio_features:
-        print("Avertissement: Caractéristiques audio non disponibles. L'analyse sera limitée.")
+    Parameters:
+        release_dates (Series): Dates de sortie au format texte
+
+    Returns:
+        DataFrame: release_date_parsed (datetime) et release_date_precision ('year', 'month', 'day' ou None)
+    """
+    # Les titres d'un même album partagent leur date : chaque date distincte n'est analysée qu'une fois
+    # (une date manquante devient "nan"/"None", qui ne correspond à aucun format)
+    codes, uniques = pd.factorize(release_dates, use_na_sentinel=False)
+    parts = pd.Series(uniques.astype(str)).str.extract(_RELEASE_DATE_PATTERN)
+    year, month, day = (parts[i].astype('float64') for i in range(3))
+
+    parsed = pd.to_datetime(pd.DataFrame({'year': year, 'month': month.fillna(1), 'day': day.fillna(1)}),
+                            errors='coerce')
+    precision = np.select([day.notna(), month.notna(), year.notna()], ['day', 'month', 'year'], default=None)
+    precision = pd.Series(precision, dtype=object).where(parsed.notna(), None)
+
+    return pd.DataFrame({
+        'release_date_parsed': parsed.to_numpy()[codes],
+        'release_date_precision': precision.to_numpy()[codes]
+    }, index=release_dates.index)
+
+
+# Colonnes obligatoires : les titres sans identifiant, nom ou artiste sont écartés
+ESSENTIAL_COLUMNS = ['track_id', 'track_name', 'artist_name']
+
+# Colonnes dont chaque valeur est une liste (codes des playlists, artistes crédités de l'extraction)
+LIST_COLUMNS = ['playlist_codes', 'artist_ids', 'artist_names']
+
+# Colonnes conservées par le nettoyage profond (caractéristiques audio incluses si disponibles)
+DEEP_CLEAN_COLUMNS = ['track_id', 'track_name', 'artist_name', 'album_name']
+DEEP_CLEAN_FEATURES = ['danceability', 'energy', 'valence', 'acousticness']
+
+# Paramètres ajustés par le traitement (plage de tempo, intervalles des catégories), dans la génération
+# courante des données : les titres ajoutés ensuite sont traités avec ces mêmes paramètres
+PROCESSING_PARAMS_FILE = "processing_params.json"
+
+# Empreinte des données sources de chaque titre nettoyé, pour ne retraiter que les titres nouveaux ou modifiés
+PROCESSED_ROWS_ARTIFACT = "processed_rows"
+
+ENERGY_BINS = [0, 0.33, 0.66, 1]
+ENERGY_LABELS = ['Basse', 'Moyenne', 'Haute']
+MOOD_BINS = [0, 0.33, 0.66, 1]
+MOOD_LABELS = ['Triste', 'Neutre', 'Joyeux']
+
+
+def _drop_invalid_rows(df, seen_ids=None):
+    """
+    Supprime les doublons puis les titres incomplets
+
+    Parameters:
+        df (DataFrame): Titres
+        seen_ids (set): Identifiants déjà rencontrés dans les lots précédents (complété au passage)
 
-    # Supprimer les doublons basés sur l'ID du titre
-    initial_rows = len(cleaned_df)
-    cleaned_df.drop_duplicates(subset=['track_id'], inplace=True)
-    print(f"Doublons supprimés: {initial_rows - len(cleaned_df)} titres")
+    Returns:
+        tuple: (DataFrame, nombre de doublons supprimés)
+    """
+    initial_rows = len(df)
+    df = df.drop_duplicates(subset=['track_id'])
+    if seen_ids is not None:
+        df = df[~df['track_id'].isin(seen_ids)]
+        seen_ids.update(df['track_id'].dropna())
+    duplicates = initial_rows - len(df)
 
-    # Gestion des valeurs manquantes
     # Pour les colonnes obligatoires, supprimer les lignes avec des valeurs manquantes
-    essential_cols = ['track_id', 'track_name', 'artist_name']
-    cleaned_df.dropna(subset=essential_cols, inplace=True)
+    return df.dropna(subset=ESSENTIAL_COLUMNS), duplicates
+
+
+# Colonnes de la table des codes de playlist utilisés par la colonne playlist_codes des titres nettoyés
+# (artefact PLAYLIST_CODES_ARTIFACT)
+PLAYLIST_CODE_COLUMNS = ['playlist_code', 'playlist_id', 'playlist_name']
+
+# Colonnes lues pour l'appartenance des titres aux playlists
+MEMBERSHIP_SOURCE_COLUMNS = ['track_id', 'playlist_id', 'playlist_name', 'added_at']
+
+
+def _playlist_key(df):
+    """Colonne identifiant les playlists : playlist_id, ou playlist_name pour les anciennes extractions"""
+    return 'playlist_id' if 'playlist_id' in df.columns else 'playlist_name'
+
+
+def _extend_codes(codes, rows, key, columns):
+    """
+    Ajoute à une table de codes les valeurs de rows[key] qui n'y figurent pas encore
+
+    Les nouvelles valeurs reçoivent les codes suivants ; les codes existants ne changent pas.
+
+    Parameters:
+        codes (DataFrame): Table existante, ou None
+        rows (DataFrame): Valeurs à coder (colonne key et colonnes descriptives)
+        key (str): Colonne identifiant une valeur
+        columns (list): Colonnes de la table, la première étant le code entier
+
+    Returns:
+        DataFrame: Table des codes complétée
+    """
+    rows = rows.dropna(subset=[key]).drop_duplicates(subset=[key])
+    start = 0
+    if codes is not None:
+        rows = rows[~rows[key].isin(codes[key])]
+        start = len(codes)
+    rows = rows.assign(**{columns[0]: np.arange(start, start + len(rows), dtype='int64')}).reindex(columns=columns)
+    if codes is None or codes.empty:
+        return rows.reset_index(drop=True)
+    return pd.concat([codes, rows], ignore_index=True)
+
+
+def assign_playlist_codes(df, codes=None):
+    """
+    Complète la table des codes de playlist avec les playlists de df qui n'en ont pas encore
+
+    Les codes déjà attribués ne changent pas : les titres repris d'un traitement précédent restent valides.
+
+    Parameters:
+        df (DataFrame): Titres (une ligne par couple playlist/titre)
+        codes (DataFrame): Table existante (playlist_code, playlist_id, playlist_name), optionnelle
+
+    Returns:
+        DataFrame: Table des codes, ou None si df ne contient pas de playlists
+    """
+    key = _playlist_key(df)
+    if key not in df.columns:
+        return None
+    playlists = df[[col for col in ('playlist_id', 'playlist_name') if col in df.columns]]
+    return _extend_codes(codes, playlists, key, PLAYLIST_CODE_COLUMNS)
+
+
+def load_playlist_codes():
+    """Table des codes de playlist du dernier traitement, ou None"""
+    if not artifact_exists(PLAYLIST_CODES_ARTIFACT):
+        return None
+    codes = load_artifact(PLAYLIST_CODES_ARTIFACT, optimize=False)
+    return codes.astype({'playlist_id': object, 'playlist_name': object})
+
+
+def aggregate_membership(df, codes):
+    """
+    Appartenance de chaque titre aux playlists, avant la suppression des doublons
+
+    Calculée sur les codes entiers des titres et des playlists (factorize, bincount, groupby) : aucune
+    boucle Python, quel que soit le nombre de playlists partagées par les titres.
+
+    Parameters:
+        df (DataFrame): Titres (une ligne par couple playlist/titre)
+        codes (DataFrame): Table des codes de playlist (voir assign_playlist_codes)
+
+    Returns:
+        DataFrame: Indexé par track_id : playlist_codes (codes triés), playlist_count et first_added_at,
+                   ou None si df ne contient pas de playlists
+    """
+    key = _playlist_key(df)
+    if codes is None or key not in df.columns:
+        return None
+
+    rows = df['track_id'].notna() & df[key].notna()
+    added_at = pd.to_datetime(df.loc[rows, 'added_at'], utc=True, errors='coerce').to_numpy() \
+        if 'added_at' in df.columns else None
+    return _aggregate_pairs(df.loc[rows, 'track_id'], df.loc[rows, key], codes, key, added_at)
+
+
+def _aggregate_pairs(track_values, playlist_values, codes, key, added_at=None):
+    """
+    Agrège des couples titre/playlist (voir aggregate_membership)
+
+    Parameters:
+        track_values (Series): Identifiant du titre de chaque couple
+        playlist_values (Series): Playlist de chaque couple (valeurs de la colonne key de la table des codes)
+        codes (DataFrame): Table des codes de playlist
+        key (str): Colonne identifiant les playlists
+        added_at (ndarray): Date d'ajout de chaque couple (datetime64), optionnelle
+
+    Returns:
+        DataFrame: Indexé par track_id : playlist_codes, playlist_count et first_added_at
+    """
+    track_codes, track_ids = pd.factorize(track_values)
+    positions = pd.Index(codes[key]).get_indexer(playlist_values)
+    pairs = pd.DataFrame({
+        'track': track_codes,
+        'playlist': codes['playlist_code'].to_numpy()[positions].astype('int32')
+    })
+    pairs['added_at'] = added_at if added_at is not None else pd.NaT
+
+    # Première date d'ajout, toutes playlists confondues
+    first_added_at = pairs.groupby('track')['added_at'].min().reindex(range(len(track_ids)))
+
+    # Listes de codes : couples distincts triés par titre puis par playlist, découpés par les effectifs
+    pairs = pairs.drop_duplicates(subset=['track', 'playlist']).sort_values(['track', 'playlist'])
+    counts = np.bincount(pairs['track'].to_numpy(), minlength=len(track_ids))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype('int32')
+    playlist_codes = pa.ListArray.from_arrays(pa.array(offsets), pa.array(pairs['playlist'].to_numpy()))
+
+    return pd.DataFrame({
+        'playlist_codes': playlist_codes.to_numpy(zero_copy_only=False),
+        'playlist_count': counts.astype('int64'),
+        'first_added_at': pd.to_datetime(first_added_at.to_numpy(), utc=True)
+    }, index=pd.Index(track_ids, name='track_id'))
+
+
+def _attach_membership(cleaned_df, membership):
+    """Ajoute l'appartenance aux playlists (voir aggregate_membership) aux titres dédoublonnés"""
+    if membership is None:
+        return cleaned_df
+    positions = membership.index.get_indexer(cleaned_df['track_id'])
+    found = positions >= 0
+    attached = membership.iloc[np.where(found, positions, 0)].reset_index(drop=True)
+    attached.loc[~found, 'playlist_count'] = 0
+    attached.loc[~found, 'first_added_at'] = pd.NaT
+    attached['playlist_codes'] = attached['playlist_codes'].where(found, None)
+    attached.index = cleaned_df.index
+    return cleaned_df.assign(**{column: attached[column] for column in attached.columns})
+
+
+def _save_playlist_codes(codes):
+    if codes is None:
+        delete_artifact(PLAYLIST_CODES_ARTIFACT)
+    else:
+        save_artifact(codes, PLAYLIST_CODES_ARTIFACT, export_csv=False, producer="processing")
+
+
+def explode_playlists(df, columns):
+    """
+    Une ligne par couple titre/playlist, à partir de la colonne playlist_codes
+
+    Les données nettoyées sans playlist_codes (anciens traitements) gardent une seule playlist par titre.
+
+    Parameters:
+        df (DataFrame): Titres nettoyés
+        columns (list): Colonnes à conserver
+
+    Returns:
+        DataFrame: playlist_name et columns, ou None si df n'a pas de playlists
+    """
+    codes = load_playlist_codes() if 'playlist_codes' in df.columns else None
+    if codes is None:
+        return df[['playlist_name'] + columns] if 'playlist_name' in df.columns else None
+
+    exploded = df[['playlist_codes'] + columns].explode('playlist_codes').dropna(subset=['playlist_codes'])
+    names = pd.Series(codes['playlist_name'].to_numpy(), index=codes['playlist_code'].to_numpy())
+    exploded.insert(0, 'playlist_name', names.reindex(exploded['playlist_codes'].astype('int64')).to_numpy())
+    return exploded.drop(columns='playlist_codes').reset_index(drop=True)
+
+
+# Pont titre/artiste : une ligne par artiste crédité sur un titre, artistes désignés par un code entier
+TRACK_ARTISTS_ARTIFACT = "track_artists"
+ARTIST_CODES_ARTIFACT = "artist_codes"
+ARTIST_CODE_COLUMNS = ['artist_code', 'artist_key', 'artist_id', 'artist_name']
+
+# Colonnes lues pour le pont titre/artiste
+ARTIST_SOURCE_COLUMNS = ['track_id', 'artist_name', 'artist_ids', 'artist_names']
+
+# Séparateur des artistes dans artist_name (voir spotify_api.get_playlist_tracks)
+ARTIST_SEPARATOR = ', '
+
+
+def artist_pairs(df):
+    """
+    Couples (titre, artiste) des titres nettoyés, dans l'ordre des crédits
+
+    Les listes artist_ids et artist_names de l'extraction sont utilisées quand elles sont disponibles.
+    Les titres d'une ancienne extraction n'ont que artist_name : il est découpé sur ARTIST_SEPARATOR
+    (un nom d'artiste contenant lui-même ", " est alors coupé en deux).
+
+    Returns:
+        DataFrame: track_id, artist_position (0 pour l'artiste principal), artist_key (identifiant
+                   Spotify, ou nom à défaut), artist_id et artist_name
+    """
+    if 'artist_ids' in df.columns and 'artist_names' in df.columns:
+        listed = df['artist_ids'].notna().to_numpy()
+    else:
+        listed = np.zeros(len(df), dtype=bool)
+
+    frames = []
+    if listed.any():
+        pairs = df.loc[listed, ['track_id', 'artist_ids', 'artist_names']].explode(['artist_ids', 'artist_names'])
+        frames.append(pd.DataFrame({'track_id': pairs['track_id'], 'artist_id': pairs['artist_ids'],
+                                    'artist_name': pairs['artist_names']}))
+    if not listed.all():
+        names = df.loc[~listed, 'artist_name'].astype(object).str.split(ARTIST_SEPARATOR)
+        pairs = df.loc[~listed, ['track_id']].assign(artist_name=names).explode('artist_name')
+        frames.append(pd.DataFrame({'track_id': pairs['track_id'], 'artist_id': None,
+                                    'artist_name': pairs['artist_name']}))
+
+    # L'index (ligne du titre) est conservé par explode : il donne la position de l'artiste dans le crédit
+    pairs = pd.concat(frames).dropna(subset=['artist_name'])
+    pairs.insert(1, 'artist_position', pairs.groupby(level=0).cumcount().astype('int16'))
+    pairs = pairs.reset_index(drop=True)
+
+    # Artistes sans identifiant : identifiant d'un artiste du même nom s'il est connu
+    known = pairs.dropna(subset=['artist_id']).drop_duplicates(subset=['artist_name'])
+    ids = pairs['artist_id'].fillna(pairs['artist_name'].map(pd.Series(known['artist_id'].to_numpy(),
+                                                                       index=known['artist_name'].to_numpy())))
+    pairs['artist_key'] = ids.fillna(pairs['artist_name'])
+    return pairs
+
+
+def _bridge_rows(pairs, codes):
+    """Lignes du pont titre/artiste : codes entiers des artistes de la table codes"""
+    positions = pd.Index(codes['artist_key']).get_indexer(pairs['artist_key'])
+    return pd.DataFrame({
+        'track_id': pairs['track_id'].to_numpy(),
+        'artist_code': codes['artist_code'].to_numpy()[positions].astype('int32'),
+        'artist_position': pairs['artist_position'].to_numpy()
+    })
+
+
+def _save_artist_codes(codes):
+    save_artifact(codes, ARTIST_CODES_ARTIFACT, export_csv=False, producer="processing")
+    print(f"Pont titre/artiste sauvegardé: {len(codes)} artistes")
+
+
+def build_artist_bridge(cleaned_df):
+    """
+    Écrit le pont titre/artiste et la table des codes d'artiste à partir des titres nettoyés
+
+    Un titre crédité à plusieurs artistes ("A, B") a une ligne par artiste : les comptages par artiste
+    se font avec np.bincount sur les codes (voir artist_track_counts).
+
+    Parameters:
+        cleaned_df (DataFrame): Titres nettoyés (une ligne par titre)
+
+    Returns:
+        DataFrame: Pont titre/artiste (track_id, artist_code, artist_position), ou None
+    """
+    if cleaned_df is None or cleaned_df.empty or 'artist_name' not in cleaned_df.columns:
+        return None
+
+    pairs = artist_pairs(cleaned_df)
+    codes = _extend_codes(None, pairs, 'artist_key', ARTIST_CODE_COLUMNS)
+    bridge = _bridge_rows(pairs, codes)
+    save_artifact(bridge, TRACK_ARTISTS_ARTIFACT, export_csv=False, producer="processing")
+    _save_artist_codes(codes)
+    return bridge
+
+
+def build_artist_bridge_from_artifact(name, batch_size):
+    """
+    Écrit le pont titre/artiste en lisant les titres nettoyés par lots (voir build_artist_bridge)
+
+    Les codes sont attribués au fil des lots ; seule la table des artistes reste en mémoire.
+
+    Returns:
+        int: Nombre d'artistes, ou None si les titres n'ont pas d'artiste
+    """
+    available = artifact_columns(name)
+    if 'artist_name' not in available:
+        return None
+
+    codes = [None]
+
+    def bridge_batches():
+        columns = [col for col in ARTIST_SOURCE_COLUMNS if col in available]
+        for batch in iter_artifact_batches(name, batch_size, columns=columns):
+            pairs = artist_pairs(batch)
+            codes[0] = _extend_codes(codes[0], pairs, 'artist_key', ARTIST_CODE_COLUMNS)
+            yield _bridge_rows(pairs, codes[0])
+
+    save_artifact_batches(bridge_batches(), TRACK_ARTISTS_ARTIFACT, export_csv=False, producer="processing")
+    if codes[0] is None:
+        return None
+    _save_artist_codes(codes[0])
+    return len(codes[0])
+
 
+def artist_track_counts(df=None):
+    """
+    Nombre de titres de chaque artiste, un titre comptant pour chacun de ses artistes
+
+    Compté avec np.bincount sur les codes du pont titre/artiste. Les données traitées avant le pont
+    (ou des titres absents du pont) sont comptées en découpant artist_name.
+
+    Parameters:
+        df (DataFrame): Titres à compter (par défaut tous les titres nettoyés)
+
+    Returns:
+        Series: Nombre de titres par artiste (nom), du plus grand au plus petit
+    """
+    if (artifact_exists(TRACK_ARTISTS_ARTIFACT) and artifact_exists(ARTIST_CODES_ARTIFACT)
+            and (df is None or 'track_id' in df.columns)):
+        bridge = load_artifact(TRACK_ARTISTS_ARTIFACT, optimize=False)
+        if df is not None:
+            bridge = bridge[bridge['track_id'].isin(df['track_id'])] \
+                if df['track_id'].isin(bridge['track_id']).all() else None
+        if bridge is not None:
+            artists = load_artifact(ARTIST_CODES_ARTIFACT, columns=['artist_code', 'artist_name'], optimize=False)
+            names = artists.sort_values('artist_code')['artist_name'].to_numpy()
+            counts = pd.Series(np.bincount(bridge['artist_code'].to_numpy(), minlength=len(names)), index=names)
+            return counts[counts > 0].sort_values(ascending=False, kind='mergesort')
+
+    if df is None:
+        df = load_artifact("cleaned_tracks", columns=['artist_name'])
+    names = df['artist_name'].astype(object).str.split(ARTIST_SEPARATOR).explode()
+    return names.value_counts()
+
+
+def fit_processing_params(tempo_range):
+    """
+    Paramètres du traitement ajustés sur les données actuelles
+
+    Parameters:
+        tempo_range (tuple): Tempo minimal et maximal des titres (None si le tempo n'est pas disponible)
+
+    Returns:
+        dict: tempo_range, energy_bins, mood_bins et date de l'ajustement
+    """
+    if tempo_range is not None and not (pd.notna(tempo_range[0]) and pd.notna(tempo_range[1])):
+        tempo_range = None
+    return {
+        'tempo_range': [float(tempo_range[0]), float(tempo_range[1])] if tempo_range is not None else None,
+        'energy_bins': ENERGY_BINS,
+        'mood_bins': MOOD_BINS,
+        'fitted_at': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def load_processing_params():
+    """Paramètres enregistrés par le dernier ajustement (dict), ou None"""
+    try:
+        with open(generation_path(PROCESSING_PARAMS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_processing_params(params):
+    def write(temp_path):
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(params, f, indent=2)
+
+    write_atomic(generation_path(PROCESSING_PARAMS_FILE), write)
+
+
+def params_drift(params, fitted):
+    """
+    Dérive des données par rapport aux paramètres enregistrés
+
+    La dérive est l'élargissement de la plage de tempo des données actuelles, relatif à la plage enregistrée
+    (0.1 : la plage a grandi de 10 %). Des intervalles de catégories différents (code modifié) ou un tempo
+    apparu ou disparu donnent une dérive infinie.
+
+    Returns:
+        float: Dérive (0 si les données restent dans la plage enregistrée)
+    """
+    if params.get('energy_bins') != fitted['energy_bins'] or params.get('mood_bins') != fitted['mood_bins']:
+        return float('inf')
+
+    saved, current = params.get('tempo_range'), fitted['tempo_range']
+    if saved is None or current is None:
+        return 0.0 if saved == current else float('inf')
+
+    width = saved[1] - saved[0]
+    outside = max(0.0, saved[0] - current[0]) + max(0.0, current[1] - saved[1])
+    if width <= 0:
+        return 0.0 if outside == 0 else float('inf')
+    return outside / width
+
+
+def _select_params(fitted, refit):
+    """
+    Paramètres à appliquer : ceux enregistrés, sauf réajustement demandé ou dérive au-delà du seuil
+
+    Returns:
+        tuple: (paramètres, True si les paramètres viennent d'être ajustés)
+    """
+    params = None if refit else load_processing_params()
+    if params is None:
+        return fitted, True
+
+    drift = params_drift(params, fitted)
+    if drift > PROCESSING_REFIT_DRIFT:
+        print(f"Dérive des données ({drift:.1%}) au-delà du seuil ({PROCESSING_REFIT_DRIFT:.0%}) : "
+              "réajustement des paramètres.")
+        return fitted, True
+    return params, False
+
+
+def _row_hashes(df):
+    """
+    Empreinte des colonnes sources de chaque titre
+
+    Les types numériques sont ramenés à float64 et les chaînes à des objets, pour que l'empreinte
+    ne dépende pas des types réduits au chargement (voir optimize_dtypes). Un changement des playlists
+    ou des artistes d'un titre (colonnes de listes) change aussi son empreinte.
+    """
+    normalized = pd.DataFrame({
+        column: (df[column].astype('float64') if pd.api.types.is_numeric_dtype(df[column])
+                 else df[column].astype(object))
+        for column in sorted(df.columns) if column not in LIST_COLUMNS
+    })
+    hashes = pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+    for column in LIST_COLUMNS:
+        if column in df.columns:
+            # Listes : somme des empreintes de leurs éléments
+            values = df[column].reset_index(drop=True).explode()
+            value_hashes = pd.Series(pd.util.hash_array(values.fillna('').astype(str).to_numpy(dtype=object)),
+                                     index=values.index)
+            hashes = hashes ^ value_hashes.groupby(level=0).sum().to_numpy()
+    return hashes
+
+
+def _transform_tracks(cleaned_df, params):
+    """
+    Transformations ligne à ligne du nettoyage (dates, normalisation, catégories)
+
+    Parameters:
+        cleaned_df (DataFrame): Titres dédoublonnés
+        params (dict): Paramètres du traitement (voir fit_processing_params)
+
+    Returns:
+        DataFrame: Titres nettoyés
+    """
     # Pour les colonnes non-essentielles, remplacer les valeurs manquantes
     if 'popularity' in cleaned_df.columns:
-        cleaned_df['popularity'].fillna(0, inplace=True)
+        cleaned_df['popularity'] = cleaned_df['popularity'].fillna(0)
 
     # Convertir les dates en format datetime si disponible
     if 'release_date' in cleaned_df.columns:
-        # Traiter différents formats de date possibles
-        def parse_date(date_str):
-            if pd.isna(date_str):
-                return None
-
-            # Format YYYY
-            if re.match(r'^\d{4}$', str(date_str)):
-                return datetime.strptime(str(date_str), '%Y')
-
-            # Format YYYY-MM
-            elif re.match(r'^\d{4}-\d{2}$', str(date_str)):
-                return datetime.strptime(str(date_str), '%Y-%m')
-
-            # Format YYYY-MM-DD
-            elif re.match(r'^\d{4}-\d{2}-\d{2}$', str(date_str)):
-                return datetime.strptime(str(date_str), '%Y-%m-%d')
-            else:
-                return None
-
-        # Appliquer la fonction de parsing et créer des colonnes pour année et décennie
-        cleaned_df['release_date_parsed'] = cleaned_df['release_date'].apply(parse_date)
-        cleaned_df['release_year'] = cleaned_df['release_date_parsed'].apply(
-            lambda x: x.year if x else None)
-        cleaned_df['decade'] = cleaned_df['release_year'].apply(
-            lambda x: (x // 10) * 10 if x else None)
+        # Formats YYYY, YYYY-MM et YYYY-MM-DD analysés en bloc ; la précision est conservée
+        release_dates = parse_release_dates(cleaned_df['release_date'])
+        cleaned_df['release_date_parsed'] = release_dates['release_date_parsed']
+        cleaned_df['release_date_precision'] = release_dates['release_date_precision']
+
+        # Année et décennie calculées directement (NaN si la date est inconnue)
+        cleaned_df['release_year'] = cleaned_df['release_date_parsed'].dt.year.astype('float64')
+        cleaned_df['decade'] = (cleaned_df['release_year'] // 10) * 10
 
     # Normaliser les caractéristiques audio si disponibles
     audio_features = ['danceability', 'energy', 'speechiness', 'acousticness',
@@ -97,11 +578,8 @@ def clean_data(df, deep_clean=False):
             cleaned_df[feature] = cleaned_df[feature].clip(0, 1)
 
     # Normaliser le tempo qui est généralement en BPM
-    if 'tempo' in cleaned_df.columns:
-        # Créer une version normalisée pour la comparaison
-        min_tempo = cleaned_df['tempo'].min()
-        max_tempo = cleaned_df['tempo'].max()
-
+    if 'tempo' in cleaned_df.columns and params['tempo_range'] is not None:
+        min_tempo, max_tempo = params['tempo_range']
         if max_tempo > min_tempo:  # Éviter division par zéro
             cleaned_df['tempo_normalized'] = (cleaned_df['tempo'] - min_tempo) / (max_tempo - min_tempo)
 
@@ -109,33 +587,335 @@ def clean_data(df, deep_clean=False):
     if 'energy' in cleaned_df.columns:
         cleaned_df['energy_category'] = pd.cut(
             cleaned_df['energy'],
-            bins=[0, 0.33, 0.66, 1],
-            labels=['Basse', 'Moyenne', 'Haute']
+            bins=params['energy_bins'],
+            labels=ENERGY_LABELS
         )
 
     if 'valence' in cleaned_df.columns:
         cleaned_df['mood'] = pd.cut(
             cleaned_df['valence'],
-            bins=[0, 0.33, 0.66, 1],
-            labels=['Triste', 'Neutre', 'Joyeux']
+            bins=params['mood_bins'],
+            labels=MOOD_LABELS
         )
 
-    # Sauvegarder le DataFrame nettoyé
-    cleaned_path = os.path.join(DATA_DIR, "cleaned_tracks.csv")
-    cleaned_df.to_csv(cleaned_path, index=False)
+    return cleaned_df
+
+
+def _previous_cleaned(track_ids, row_hashes):
+    """
+    Titres déjà nettoyés dont les données sources n'ont pas changé depuis le dernier traitement
+
+    Returns:
+        DataFrame: Lignes réutilisables des données nettoyées, ou None s'il n'y a pas de traitement précédent
+    """
+    if not (artifact_exists("cleaned_tracks") and artifact_exists(PROCESSED_ROWS_ARTIFACT)):
+        return None
+
+    current = pd.DataFrame({'track_id': track_ids.to_numpy(dtype=object), 'row_hash': row_hashes})
+    stored = load_artifact(PROCESSED_ROWS_ARTIFACT)
+    stored['track_id'] = stored['track_id'].astype(object)
+    unchanged = current.merge(stored, on=['track_id', 'row_hash'])['track_id']
+
+    previous = load_artifact("cleaned_tracks", optimize=True)
+    return previous[previous['track_id'].isin(unchanged)]
+
+
+def _merge_cleaned(previous, transformed, track_ids):
+    """
+    Réunit les titres réutilisés et les titres retraités, dans l'ordre des données sources
+
+    Les catégories des deux parties sont réunies pour que les colonnes catégorielles le restent.
+    """
+    for column in transformed.columns.intersection(previous.columns):
+        old_dtype, new_dtype = previous[column].dtype, transformed[column].dtype
+        if isinstance(old_dtype, pd.CategoricalDtype) and isinstance(new_dtype, pd.CategoricalDtype):
+            dtype = pd.CategoricalDtype(new_dtype.categories.union(old_dtype.categories, sort=False),
+                                        ordered=new_dtype.ordered)
+            previous = previous.assign(**{column: previous[column].astype(dtype)})
+            transformed = transformed.assign(**{column: transformed[column].astype(dtype)})
+
+    merged = pd.concat([previous, transformed], ignore_index=True)
+    positions = pd.Index(merged['track_id'].astype(object)).get_indexer(track_ids.astype(object))
+    return merged.iloc[positions].reset_index(drop=True)
+
+
+def clean_data(df, deep_clean=False, refit=True):
+    """
+    Nettoie et prépare les données pour l'analyse
+
+    Parameters:
+        df (DataFrame): Données extraites
+        deep_clean (bool): Ne garder que les colonnes essentielles
+        refit (bool): Réajuster les paramètres du traitement (plage de tempo, catégories) sur ces données.
+                      Sinon les paramètres enregistrés sont réutilisés, sauf dérive au-delà de
+                      MELODIA_PROCESSING_REFIT_DRIFT, et seuls les titres nouveaux ou modifiés sont retraités.
+
+    Returns:
+        DataFrame: Données nettoyées
+    """
+    if deep_clean:
+        print("Nettoyage profond des données...")
+        # Approche simplifiée pour éviter les problèmes de récursion
+        # Utiliser uniquement les colonnes essentielles
+        if all(col in df.columns for col in DEEP_CLEAN_COLUMNS):
+            df = df[DEEP_CLEAN_COLUMNS + [col for col in DEEP_CLEAN_FEATURES if col in df.columns]]
+    if df is None or df.empty:
+        return None
+
+    print("Nettoyage des données...")
+
+    # Vérifier si nous avons des caractéristiques audio
+    has_audio_features = all(feature in df.columns for feature in DEEP_CLEAN_FEATURES)
+
+    if not has_audio_features:
+        print("Avertissement: Caractéristiques audio non disponibles. L'analyse sera limitée.")
+
+    # Supprimer les doublons basés sur l'ID du titre, puis les titres incomplets (nouveau DataFrame :
+    # l'original n'est pas modifié)
+    cleaned_df, duplicates = _drop_invalid_rows(df)
+    print(f"Doublons supprimés: {duplicates} titres")
+
+    tempo_range = (cleaned_df['tempo'].min(), cleaned_df['tempo'].max()) if 'tempo' in cleaned_df.columns else None
+    params, refitted = _select_params(fit_processing_params(tempo_range), refit or deep_clean)
+
+    # Playlists de chaque titre, calculées sur toutes les lignes avant la suppression des doublons
+    playlist_codes = assign_playlist_codes(df, None if refitted else load_playlist_codes())
+    cleaned_df = _attach_membership(cleaned_df, aggregate_membership(df, playlist_codes))
+
+    # Les titres dont les données sources n'ont pas changé gardent leurs valeurs nettoyées
+    row_hashes = _row_hashes(cleaned_df)
+    track_ids = cleaned_df['track_id']
+    previous = None if refitted else _previous_cleaned(track_ids, row_hashes)
+    if previous is None:
+        cleaned_df = _transform_tracks(cleaned_df, params)
+    else:
+        changed = ~track_ids.isin(previous['track_id'])
+        print(f"Traitement incrémental: {int(changed.sum())} titres nouveaux ou modifiés, "
+              f"{len(previous)} titres repris du traitement précédent")
+        transformed = _transform_tracks(cleaned_df[changed].copy(), params)
+        cleaned_df = _merge_cleaned(previous, transformed, track_ids)
+
+    # Sauvegarder le DataFrame nettoyé, l'empreinte des données sources et les paramètres ajustés
+    cleaned_path = save_artifact(cleaned_df, "cleaned_tracks", producer="processing")
     print(f"Données nettoyées sauvegardées dans: {cleaned_path}")
+    save_artifact(pd.DataFrame({'track_id': track_ids.to_numpy(dtype=object), 'row_hash': row_hashes}),
+                  PROCESSED_ROWS_ARTIFACT, export_csv=False, producer="processing")
+    _save_playlist_codes(playlist_codes)
+    if refitted:
+        save_processing_params(params)
+
+    # Matrice float32 des caractéristiques, ouverte sans copie par les recommandations et l'analyse
+    build_feature_matrix(cleaned_df)
+    # Bitsets des playlists pour les requêtes ensemblistes (pages et découvertes)
+    build_membership_index(cleaned_df)
+    # Pont titre/artiste pour les comptages par artiste
+    build_artist_bridge(cleaned_df)
 
     return cleaned_df
 
 
-def process_data(force_rebuild=False):
-    """Fonction principale pour charger et nettoyer les données"""
+class _MembershipSpill:
+    """
+    Couples playlist/titre de toutes les lignes, écrits sur disque pendant la première passe du nettoyage
+    par lots puis relus lot par lot (voir clean_data_chunked)
+
+    Base SQLite temporaire indexée sur track_id : la seconde passe ne lit que les couples des titres
+    du lot en cours, la mémoire ne dépend que de la taille des lots.
+    """
+
+    def __init__(self):
+        # Suffixe .tmp : jamais repris dans une nouvelle génération (voir generations._seed)
+        self.path = generation_path(f"membership_spill.{os.getpid()}.tmp")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE pairs (track_id TEXT NOT NULL, playlist TEXT NOT NULL, added_at INTEGER)")
+        self.conn.execute("CREATE TEMP TABLE batch_tracks (track_id TEXT PRIMARY KEY)")
+
+    def append(self, batch, key):
+        """Ajoute les couples d'un lot (colonne key : playlist_id ou playlist_name)"""
+        rows = batch['track_id'].notna() & batch[key].notna()
+        if 'added_at' in batch.columns:
+            # Dates stockées en nanosecondes (NaT : plus petit entier 64 bits, relu comme NaT)
+            added_at = pd.to_datetime(batch.loc[rows, 'added_at'], utc=True, errors='coerce').dt.tz_localize(None) \
+                .to_numpy().astype('datetime64[ns]').view('int64')
+        else:
+            added_at = np.full(int(rows.sum()), pd.NaT.value, dtype='int64')
+        self.conn.executemany("INSERT INTO pairs VALUES (?, ?, ?)",
+                              zip(batch.loc[rows, 'track_id'].astype(str), batch.loc[rows, key].astype(str),
+                                  added_at.tolist()))
+
+    def finish(self):
+        """Indexe les couples une fois la première passe terminée"""
+        self.conn.execute("CREATE INDEX idx_pairs_track ON pairs(track_id)")
+        self.conn.commit()
+
+    def membership(self, track_ids, codes, key):
+        """Appartenance aux playlists des titres d'un lot (voir aggregate_membership)"""
+        self.conn.execute("DELETE FROM batch_tracks")
+        self.conn.executemany("INSERT OR IGNORE INTO batch_tracks VALUES (?)", ((str(t),) for t in track_ids))
+        pairs = pd.DataFrame(self.conn.execute(
+            "SELECT p.track_id, p.playlist, p.added_at FROM batch_tracks b JOIN pairs p ON p.track_id = b.track_id"
+        ).fetchall(), columns=['track_id', 'playlist', 'added_at'])
+        added_at = pairs['added_at'].to_numpy(dtype='int64').view('datetime64[ns]')
+        return _aggregate_pairs(pairs['track_id'], pairs['playlist'], codes, key, added_at)
+
+    def close(self):
+        self.conn.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _first_pass(source, chunk_size, available, membership_columns):
+    """
+    Première passe du nettoyage par lots : tempo minimal et maximal des titres conservés, et couples
+    playlist/titre de toutes les lignes (appartenance aux playlists, voir aggregate_membership)
+
+    Seules les colonnes obligatoires, le tempo et les colonnes d'appartenance sont lus. Les couples sont
+    écrits sur disque (voir _MembershipSpill) ; seules les playlists distinctes restent en mémoire.
+
+    Returns:
+        tuple: ((tempo minimal, tempo maximal) ou None, playlists distinctes dans l'ordre d'apparition
+               ou None, couples écrits sur disque ou None)
+    """
+    columns = ESSENTIAL_COLUMNS + [col for col in ['tempo'] + membership_columns
+                                   if col in available and col not in ESSENTIAL_COLUMNS]
+    seen_ids = set()
+    min_tempo = max_tempo = None
+    playlists = None
+    spill = _MembershipSpill() if membership_columns else None
+    try:
+        for batch in iter_artifact_batches(source, chunk_size, columns=columns):
+            if spill is not None:
+                key = _playlist_key(batch)
+                spill.append(batch, key)
+                batch_playlists = batch[[col for col in ('playlist_id', 'playlist_name') if col in batch.columns]]
+                playlists = batch_playlists.drop_duplicates(subset=[key]) if playlists is None else \
+                    pd.concat([playlists, batch_playlists]).drop_duplicates(subset=[key])
+            if 'tempo' not in batch.columns:
+                continue
+            tempo = _drop_invalid_rows(batch, seen_ids)[0]['tempo'].dropna()
+            if tempo.empty:
+                continue
+            min_tempo = tempo.min() if min_tempo is None else min(min_tempo, tempo.min())
+            max_tempo = tempo.max() if max_tempo is None else max(max_tempo, tempo.max())
+        if spill is not None:
+            spill.finish()
+    except BaseException:
+        if spill is not None:
+            spill.close()
+        raise
+
+    tempo_range = (min_tempo, max_tempo) if min_tempo is not None else None
+    return tempo_range, playlists, spill
+
+
+def clean_data_chunked(chunk_size, deep_clean=False, refit=False):
+    """
+    Nettoie les données par lots de taille fixe, sans les charger entièrement en mémoire
+
+    Les lots subissent les mêmes transformations que clean_data. Les doublons sont détectés d'un lot
+    à l'autre grâce à l'ensemble des identifiants déjà vus ; le tempo est normalisé avec les bornes
+    calculées lors d'une première passe (ou avec la plage enregistrée, voir clean_data), qui écrit aussi
+    sur disque les couples playlist/titre pour l'appartenance aux playlists (voir _MembershipSpill). Les lots
+    nettoyés sont ajoutés au fichier au fur et à mesure ; tous les titres sont réécrits.
+
+    Parameters:
+        chunk_size (int): Nombre de titres par lot
+        deep_clean (bool): Ne garder que les colonnes essentielles (voir clean_data)
+        refit (bool): Réajuster les paramètres du traitement (voir clean_data)
+
+    Returns:
+        int: Nombre de titres nettoyés, ou None si aucune donnée n'est disponible
+    """
+    source = next((name for name in ("tracks_with_features", "tracks") if artifact_exists(name)), None)
+    if source is None:
+        print("Aucun fichier de données trouvé.")
+        return None
+
+    available = artifact_columns(source)
+    columns = None
+    if deep_clean:
+        print("Nettoyage profond des données...")
+        if all(col in available for col in DEEP_CLEAN_COLUMNS):
+            columns = DEEP_CLEAN_COLUMNS + [col for col in DEEP_CLEAN_FEATURES if col in available]
+            available = columns
+
+    print(f"Nettoyage des données par lots de {chunk_size} titres ({source})...")
+    if not all(feature in available for feature in DEEP_CLEAN_FEATURES):
+        print("Avertissement: Caractéristiques audio non disponibles. L'analyse sera limitée.")
+
+    # Passe 1 : bornes du tempo, comparées aux paramètres enregistrés, et appartenance aux playlists
+    membership_columns = [col for col in MEMBERSHIP_SOURCE_COLUMNS if col in available]
+    if not ('playlist_id' in available or 'playlist_name' in available):
+        membership_columns = []
+    tempo_range, playlists, spill = _first_pass(source, chunk_size, available, membership_columns)
+    try:
+        params, refitted = _select_params(fit_processing_params(tempo_range), refit or deep_clean)
+        playlist_codes = None
+        if playlists is not None:
+            playlist_codes = assign_playlist_codes(playlists, None if refitted else load_playlist_codes())
+            key = _playlist_key(playlists)
+
+        # Passe 2 : nettoyage et écriture des lots, joints à l'appartenance de leurs seuls titres
+        seen_ids = set()
+        duplicates = [0]
+
+        def cleaned_batches():
+            for batch in iter_artifact_batches(source, chunk_size, columns=columns):
+                batch, batch_duplicates = _drop_invalid_rows(batch, seen_ids)
+                duplicates[0] += batch_duplicates
+                if playlist_codes is not None:
+                    batch = _attach_membership(batch, spill.membership(batch['track_id'], playlist_codes, key))
+                yield _transform_tracks(batch, params)
+
+        cleaned_path = save_artifact_batches(cleaned_batches(), "cleaned_tracks", producer="processing")
+    finally:
+        if spill is not None:
+            spill.close()
+    print(f"Doublons supprimés: {duplicates[0]} titres")
+    print(f"Données nettoyées sauvegardées dans: {cleaned_path}")
+    _save_playlist_codes(playlist_codes)
+    if refitted:
+        save_processing_params(params)
+    # Les empreintes ne sont pas conservées en mode par lots : le prochain traitement en mémoire
+    # retraitera tous les titres (avec les mêmes paramètres)
+    delete_artifact(PROCESSED_ROWS_ARTIFACT)
+
+    # Matrice float32 des caractéristiques, remplie lot par lot
+    build_feature_matrix_from_artifact("cleaned_tracks", chunk_size)
+    build_membership_index_from_artifact("cleaned_tracks", chunk_size)
+    build_artist_bridge_from_artifact("cleaned_tracks", chunk_size)
+
+    return artifact_row_count("cleaned_tracks")
+
+
+def process_data(force_rebuild=False, chunk_size=None, refit=False):
+    """
+    Fonction principale pour charger et nettoyer les données
+
+    Parameters:
+        force_rebuild (bool): Nettoyage profond (colonnes essentielles uniquement)
+        chunk_size (int): Nettoyer par lots de chunk_size titres (par défaut MELODIA_PROCESSING_CHUNK_SIZE,
+                          0 pour tout charger en mémoire)
+        refit (bool): Réajuster les paramètres du traitement et retraiter tous les titres
+
+    Returns:
+        DataFrame ou int: Données nettoyées ; en mode par lots, nombre de titres nettoyés. None en cas d'échec.
+    """
+    if chunk_size is None:
+        chunk_size = PROCESSING_CHUNK_SIZE
+    if chunk_size > 0:
+        return clean_data_chunked(chunk_size, deep_clean=force_rebuild, refit=refit)
+
     # Charger les données
     df = load_data()
 
     if df is not None:
         # Nettoyer les données
-        cleaned_df = clean_data(df) if not force_rebuild else clean_data(df, deep_clean=True)
+        cleaned_df = clean_data(df, refit=refit) if not force_rebuild else clean_data(df, deep_clean=True)
         return cleaned_df
     else:
         return None
@@ -145,5 +925,5 @@ if __name__ == "__main__":
     # Test du module
     cleaned_data = process_data()
     if cleaned_data is not None:
-        print(f"Traitement réussi: {len(cleaned_data)} titres après nettoyage.")
-        print(f"Colonnes disponibles: {cleaned_data.columns.tolist()}")
\ No newline at end of file
+        print(f"Traitement réussi: {artifact_row_count('cleaned_tracks')} titres après nettoyage.")
+        print(f"Colonnes disponibles: {artifact_columns('cleaned_tracks')}")
\ No newline at end of file
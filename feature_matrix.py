@@ -0,0 +1,237 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from generations import generation_path
+from storage import (artifact_columns, artifact_exists, artifact_row_count, iter_artifact_batches, load_artifact,
+                     save_artifact, save_artifact_batches, write_atomic)
+from data_lock import artifact_lock
+
+# Matrice des caractéristiques audio (float32, une ligne par titre) et index des titres associé,
+# dans la génération courante des données (voir generations.py)
+FEATURE_MATRIX_FILE = "feature_matrix.npy"
+FEATURE_MATRIX_META_FILE = "feature_matrix.json"
+FEATURE_INDEX_ARTIFACT = "feature_matrix_index"
+
+# Colonnes de la matrice, dans cet ordre (seules celles présentes dans les données sont conservées)
+MATRIX_FEATURES = ['danceability', 'energy', 'valence', 'acousticness', 'instrumentalness',
+                   'liveness', 'speechiness', 'tempo', 'tempo_normalized']
+
+# Matrice ouverte par le processus, rechargée si le fichier a été reconstruit ou si la génération a changé
+_loaded = {'key': None, 'matrix': None}
+
+
+def build_feature_matrix(df):
+    """
+    Écrit la matrice des caractéristiques audio et son index à partir des données nettoyées
+
+    Les valeurs manquantes sont conservées (NaN) : chaque consommateur choisit comment les traiter.
+
+    Parameters:
+        df (DataFrame): Données nettoyées (une ligne par titre)
+
+    Returns:
+        str: Chemin de la matrice, ou None si aucune caractéristique audio n'est disponible
+    """
+    if df is None or df.empty:
+        return None
+
+    columns = [feature for feature in MATRIX_FEATURES if feature in df.columns]
+    if not columns:
+        return None
+
+    matrix = np.empty((len(df), len(columns)), dtype=np.float32)
+    for i, feature in enumerate(columns):
+        matrix[:, i] = pd.to_numeric(df[feature], errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
+
+    matrix_path = generation_path(FEATURE_MATRIX_FILE)
+    meta_path = generation_path(FEATURE_MATRIX_META_FILE)
+
+    def write_meta(temp_path):
+        with open(temp_path, "w") as f:
+            json.dump({'columns': columns, 'rows': len(df)}, f)
+
+    # Écriture dans un fichier temporaire puis substitution : un lecteur ne voit jamais de matrice partielle ;
+    # le verrou garantit qu'il ne voit pas non plus une matrice et un index de deux versions différentes
+    with artifact_lock("feature_matrix", exclusive=True):
+        temp_path = matrix_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix))
+        save_artifact(pd.DataFrame({'track_id': df['track_id'].to_numpy()}), FEATURE_INDEX_ARTIFACT,
+                      export_csv=False, producer="processing")
+        write_atomic(meta_path, write_meta)
+        os.replace(temp_path, matrix_path)
+
+    print(f"Matrice des caractéristiques sauvegardée dans: {matrix_path} ({len(df)} x {len(columns)})")
+    return matrix_path
+
+
+def build_feature_matrix_from_artifact(name, batch_size):
+    """
+    Écrit la matrice des caractéristiques audio et son index en lisant un artefact par lots
+
+    La matrice est remplie directement dans le fichier (memmap) : seul un lot est en mémoire à la fois.
+
+    Parameters:
+        name (str): Artefact des données nettoyées (une ligne par titre)
+        batch_size (int): Nombre de titres par lot
+
+    Returns:
+        str: Chemin de la matrice, ou None si aucune caractéristique audio n'est disponible
+    """
+    columns = [feature for feature in MATRIX_FEATURES if feature in artifact_columns(name)]
+    rows = artifact_row_count(name)
+    if not columns or rows == 0:
+        return None
+
+    matrix_path = generation_path(FEATURE_MATRIX_FILE)
+    meta_path = generation_path(FEATURE_MATRIX_META_FILE)
+    temp_path = matrix_path + ".tmp"
+
+    def write_meta(temp_meta_path):
+        with open(temp_meta_path, "w") as f:
+            json.dump({'columns': columns, 'rows': rows}, f)
+
+    with artifact_lock("feature_matrix", exclusive=True):
+        matrix = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.float32, shape=(rows, len(columns)))
+
+        def index_batches():
+            start = 0
+            for batch in iter_artifact_batches(name, batch_size, columns=['track_id'] + columns):
+                end = start + len(batch)
+                for i, feature in enumerate(columns):
+                    matrix[start:end, i] = pd.to_numeric(batch[feature], errors='coerce').to_numpy(
+                        dtype=np.float32, na_value=np.nan)
+                start = end
+                yield batch[['track_id']]
+
+        save_artifact_batches(index_batches(), FEATURE_INDEX_ARTIFACT, export_csv=False, producer="processing")
+        matrix.flush()
+        del matrix
+        write_atomic(meta_path, write_meta)
+        os.replace(temp_path, matrix_path)
+
+    print(f"Matrice des caractéristiques sauvegardée dans: {matrix_path} ({rows} x {len(columns)})")
+    return matrix_path
+
+
+class FeatureMatrix:
+    """Matrice des caractéristiques ouverte en mémoire partagée (lecture seule, sans copie)"""
+
+    def __init__(self, matrix, track_ids, columns):
+        self.matrix = matrix
+        self.track_ids = track_ids
+        self.columns = columns
+        self._column_index = {column: i for i, column in enumerate(columns)}
+        self._row_index = None
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def has_columns(self, features):
+        return all(feature in self._column_index for feature in features)
+
+    def column(self, feature):
+        """Vue (sans copie) sur une colonne de la matrice"""
+        return self.matrix[:, self._column_index[feature]]
+
+    def rows_for(self, track_ids):
+        """
+        Positions des titres dans la matrice
+
+        Returns:
+            ndarray: Position de chaque titre, -1 pour les titres absents de la matrice
+        """
+        if self._row_index is None:
+            self._row_index = pd.Index(self.track_ids)
+        return self._row_index.get_indexer(pd.Index(track_ids))
+
+    def aligned_with(self, df):
+        """Indique si les lignes de la matrice correspondent exactement à celles du DataFrame"""
+        return (len(df) == len(self) and 'track_id' in df.columns
+                and np.array_equal(df['track_id'].to_numpy(dtype=object), self.track_ids))
+
+    def features_for(self, track_ids, features, fill_missing=True):
+        """
+        Caractéristiques des titres demandés, dans leur ordre
+
+        Parameters:
+            track_ids (array-like): Identifiants des titres
+            features (list): Colonnes à extraire
+            fill_missing (bool): Remplacer les NaN par la moyenne de la colonne
+
+        Returns:
+            ndarray: Matrice float32 (len(track_ids) x len(features)), ou None si un titre est absent
+        """
+        rows = self.rows_for(track_ids)
+        if (rows < 0).any():
+            return None
+
+        values = self.matrix[np.ix_(rows, [self._column_index[feature] for feature in features])]
+        if fill_missing:
+            values = fill_with_column_means(values)
+        return values
+
+
+def fill_with_column_means(values):
+    """Remplace les NaN de chaque colonne par la moyenne de la colonne (0 si la colonne est vide)"""
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    values = np.array(values, dtype=np.float32)
+    counts = (~missing).sum(axis=0)
+    sums = np.where(missing, 0, values).sum(axis=0)
+    means = np.divide(sums, counts, out=np.zeros(values.shape[1], dtype=np.float32), where=counts > 0)
+    values[missing] = np.take(means, np.nonzero(missing)[1])
+    return values
+
+
+def load_feature_matrix():
+    """
+    Ouvre la matrice des caractéristiques en lecture seule avec np.load(mmap_mode='r')
+
+    Les processus qui l'ouvrent partagent les mêmes pages en mémoire.
+
+    Returns:
+        FeatureMatrix: Matrice et index, ou None si la matrice n'a pas été construite
+    """
+    matrix_path = generation_path(FEATURE_MATRIX_FILE)
+    meta_path = generation_path(FEATURE_MATRIX_META_FILE)
+    with artifact_lock("feature_matrix"):
+        if not (os.path.exists(matrix_path) and os.path.exists(meta_path)
+                and artifact_exists(FEATURE_INDEX_ARTIFACT)):
+            return None
+
+        key = (matrix_path, os.path.getmtime(matrix_path))
+        if _loaded['matrix'] is not None and _loaded['key'] == key:
+            return _loaded['matrix']
+
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            matrix = np.load(matrix_path, mmap_mode='r')
+            track_ids = load_artifact(FEATURE_INDEX_ARTIFACT)['track_id'].to_numpy(dtype=object)
+        except Exception as e:
+            print(f"Erreur lors de l'ouverture de la matrice des caractéristiques: {e}")
+            return None
+
+    if matrix.shape != (len(track_ids), len(meta['columns'])):
+        print("Matrice des caractéristiques incohérente avec son index, elle sera ignorée.")
+        return None
+
+    _loaded['matrix'] = FeatureMatrix(matrix, track_ids, meta['columns'])
+    _loaded['key'] = key
+    return _loaded['matrix']
+
+
+def load_aligned_feature_matrix(df, features):
+    """
+    Matrice des caractéristiques si ses lignes sont exactement celles de df et qu'elle contient `features`
+
+    Returns:
+        FeatureMatrix: Matrice utilisable à la place des colonnes de df, ou None
+    """
+    matrix = load_feature_matrix()
+    if matrix is not None and matrix.has_columns(features) and matrix.aligned_with(df):
+        return matrix
+    return None
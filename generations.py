@@ -0,0 +1,296 @@
+import os
+import shutil
+import threading
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from config import DATA_DIR
+from data_lock import file_lock, remove_lock_file
+
+# Générations des données : chaque rafraîchissement construit une génération complète à côté de celle
+# servie aux pages, puis le pointeur CURRENT est basculé d'un coup (os.replace)
+# - generations/<id>/ : fichiers de données d'une génération
+# - CURRENT : identifiant de la génération servie (absent : fichiers directement dans DATA_DIR)
+GENERATIONS_DIR = os.path.join(DATA_DIR, "generations")
+CURRENT_POINTER_PATH = os.path.join(DATA_DIR, "CURRENT")
+
+# Nombre de générations publiées conservées pour un retour arrière
+KEEP_GENERATIONS = 3
+
+# Fichiers repris d'un ancien dossier de données sans génération
+LEGACY_SUFFIXES = (".parquet", ".csv", ".manifest.json")
+LEGACY_FILES = ["library.db", "feature_matrix.npy", "feature_matrix.json", "membership_index.npy",
+                "membership_index.json", "pipeline_state.json", "processing_params.json"]
+
+# Marqueur d'une génération publiée (les générations abandonnées n'en ont pas)
+_COMMITTED_MARKER = ".committed"
+_BUILD_LOCK = "generation_build"
+
+# Génération en construction dans le thread courant, et dossier de la génération servie figée
+# pour les lectures du thread courant (voir pin_generation)
+_context = threading.local()
+
+
+def _generation_dir(generation_id):
+    return os.path.join(GENERATIONS_DIR, generation_id)
+
+
+def _pin_lock(generation_id):
+    """Verrou d'une génération : partagé par les lecteurs qui l'ont figée, exclusif pour la supprimer"""
+    return f"generation_{generation_id}"
+
+
+def current_generation():
+    """Identifiant de la génération servie, ou None pour l'ancien dossier sans génération"""
+    try:
+        with open(CURRENT_POINTER_PATH, "r", encoding="utf-8") as f:
+            generation_id = f.read().strip()
+    except OSError:
+        return None
+    return generation_id if generation_id and os.path.isdir(_generation_dir(generation_id)) else None
+
+
+def active_generation():
+    """Génération en construction dans le thread courant, ou None"""
+    return getattr(_context, 'generation', None)
+
+
+def generation_dir():
+    """
+    Dossier où lire et écrire les fichiers de données
+
+    Le thread qui construit une génération écrit dans celle-ci ; tous les autres lisent la génération servie
+    (celle figée par pin_generation, sinon celle désignée par CURRENT au moment de l'appel).
+    """
+    generation = active_generation()
+    if generation is not None:
+        return generation.path
+    pinned = getattr(_context, 'pinned', None)
+    if pinned is not None:
+        return pinned
+    generation_id = current_generation()
+    return _generation_dir(generation_id) if generation_id else DATA_DIR
+
+
+def generation_path(file_name):
+    """Chemin d'un fichier de données dans la génération courante (voir generation_dir)"""
+    return os.path.join(generation_dir(), file_name)
+
+
+class Generation:
+    """Génération en cours de construction"""
+
+    def __init__(self, generation_id, base_id):
+        self.id = generation_id
+        self.base_id = base_id
+        self.path = _generation_dir(generation_id)
+        self.discarded = False
+
+    def discard(self):
+        """Abandonne la génération : elle ne sera pas publiée"""
+        self.discarded = True
+
+
+def _seed(target_dir, base_id):
+    """
+    Reprend les fichiers de la génération servie dans une nouvelle génération
+
+    Les fichiers sont liés (hardlink) plutôt que copiés : ils ne sont jamais modifiés sur place
+    (écriture dans un fichier temporaire puis os.replace), la génération servie reste donc intacte.
+    """
+    if base_id is not None:
+        source_dir = _generation_dir(base_id)
+        names = [name for name in os.listdir(source_dir) if name != _COMMITTED_MARKER]
+    else:
+        source_dir = DATA_DIR
+        names = [name for name in os.listdir(source_dir)
+                 if name.endswith(LEGACY_SUFFIXES) or name in LEGACY_FILES]
+
+    for name in names:
+        source = os.path.join(source_dir, name)
+        if not os.path.isfile(source) or name.endswith(".tmp"):
+            continue
+        target = os.path.join(target_dir, name)
+        try:
+            os.link(source, target)
+        except OSError:
+            # Système de fichiers sans liens physiques
+            shutil.copy2(source, target)
+
+
+def commit_generation(generation):
+    """Publie une génération : le pointeur CURRENT est remplacé d'un seul coup"""
+    open(os.path.join(generation.path, _COMMITTED_MARKER), "w").close()
+    temp_path = f"{CURRENT_POINTER_PATH}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(generation.id)
+    os.replace(temp_path, CURRENT_POINTER_PATH)
+    print(f"Nouvelle génération des données publiée: {generation.id}")
+    _prune()
+
+
+def list_generations():
+    """Générations publiées, de la plus ancienne à la plus récente"""
+    if not os.path.isdir(GENERATIONS_DIR):
+        return []
+    return sorted(name for name in os.listdir(GENERATIONS_DIR)
+                  if os.path.exists(os.path.join(_generation_dir(name), _COMMITTED_MARKER)))
+
+
+def _prune():
+    """
+    Supprime les générations abandonnées et les générations publiées les plus anciennes
+
+    Une génération encore figée par un lecteur, dans n'importe quel processus (voir pin_generation),
+    est conservée : elle sera supprimée par une publication suivante.
+    """
+    current = current_generation()
+    keep = set(list_generations()[-KEEP_GENERATIONS:])
+    keep.add(current)
+    for name in os.listdir(GENERATIONS_DIR):
+        if name in keep:
+            continue
+        with file_lock(_pin_lock(name), exclusive=True, blocking=False) as unpinned:
+            if unpinned:
+                shutil.rmtree(_generation_dir(name), ignore_errors=True)
+                remove_lock_file(_pin_lock(name))
+
+
+@contextmanager
+def use_generation(generation):
+    """Fait écrire le thread courant dans une génération en construction (ex: threads du pipeline)"""
+    previous = active_generation()
+    _context.generation = generation
+    try:
+        yield generation
+    finally:
+        _context.generation = previous
+
+
+@contextmanager
+def pin_generation():
+    """
+    Fige la génération servie pour les lectures du thread courant pendant le bloc
+
+    CURRENT n'est lu qu'une fois : une page ou une commande qui lit plusieurs fichiers ne mélange pas
+    deux générations si une construction est publiée entre deux lectures. Le verrou partagé de la
+    génération empêche les autres processus de la supprimer pendant le bloc (voir _prune). Utilisable
+    comme décorateur. Sans effet dans un thread qui construit une génération ou dont la génération est
+    déjà figée.
+    """
+    if active_generation() is not None or getattr(_context, 'pinned', None) is not None:
+        yield
+        return
+
+    with ExitStack() as pin:
+        while True:
+            generation_id = current_generation()
+            if generation_id is None:
+                break
+            pin.enter_context(file_lock(_pin_lock(generation_id)))
+            # Génération supprimée entre la lecture de CURRENT et la prise du verrou : relire CURRENT
+            if os.path.isdir(_generation_dir(generation_id)):
+                break
+            pin.close()
+
+        _context.pinned = _generation_dir(generation_id) if generation_id else DATA_DIR
+        try:
+            yield
+        finally:
+            _context.pinned = None
+
+
+def _repin(generation_id):
+    """Le thread qui publie ou annule une génération lit ensuite la nouvelle génération servie"""
+    if getattr(_context, 'pinned', None) is not None:
+        _context.pinned = _generation_dir(generation_id) if generation_id else DATA_DIR
+
+
+@contextmanager
+def generations_lock():
+    """
+    Attend la fin de la construction en cours et bloque les suivantes
+
+    À prendre avant data_lock.data_dir_lock (même ordre que les constructions) pour tout effacer.
+    """
+    with file_lock(_BUILD_LOCK, exclusive=True):
+        yield
+
+
+@contextmanager
+def build_generation():
+    """
+    Construit une nouvelle génération des données, publiée à la fin du bloc
+
+    Pendant la construction, les pages continuent à lire la génération servie. La génération n'est pas
+    publiée si le bloc lève une exception ou appelle discard(). Les constructions sont exécutées l'une
+    après l'autre ; un bloc imbriqué réutilise la génération déjà en construction.
+
+    Yields:
+        Generation: Génération en construction
+    """
+    if active_generation() is not None:
+        yield active_generation()
+        return
+
+    with file_lock(_BUILD_LOCK, exclusive=True):
+        base_id = current_generation()
+        generation_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        generation = Generation(generation_id, base_id)
+        os.makedirs(generation.path)
+        _seed(generation.path, base_id)
+
+        try:
+            with use_generation(generation):
+                yield generation
+        except BaseException:
+            shutil.rmtree(generation.path, ignore_errors=True)
+            raise
+
+        if generation.discarded:
+            print("Génération abandonnée : les données servies restent inchangées.")
+            shutil.rmtree(generation.path, ignore_errors=True)
+        else:
+            commit_generation(generation)
+            _repin(generation.id)
+
+
+def rollback_generation():
+    """
+    Revient instantanément à la génération publiée précédente
+
+    Returns:
+        str: Identifiant de la génération désormais servie, ou None si aucun retour n'est possible
+    """
+    with file_lock(_BUILD_LOCK, exclusive=True):
+        generations = list_generations()
+        current = current_generation()
+        if current not in generations or generations.index(current) == 0:
+            print("Aucune génération précédente disponible.")
+            return None
+
+        previous = generations[generations.index(current) - 1]
+        temp_path = f"{CURRENT_POINTER_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(previous)
+        os.replace(temp_path, CURRENT_POINTER_PATH)
+        # La génération annulée ne doit pas redevenir la plus récente
+        os.remove(os.path.join(_generation_dir(current), _COMMITTED_MARKER))
+        print(f"Retour à la génération {previous}")
+        _repin(previous)
+        return previous
+
+
+def delete_all_generations():
+    """
+    Supprime toutes les générations et le pointeur CURRENT
+
+    Returns:
+        bool: True si des générations ont été supprimées
+    """
+    with file_lock(_BUILD_LOCK, exclusive=True):
+        deleted = os.path.isdir(GENERATIONS_DIR) or os.path.exists(CURRENT_POINTER_PATH)
+        if os.path.exists(CURRENT_POINTER_PATH):
+            os.remove(CURRENT_POINTER_PATH)
+        shutil.rmtree(GENERATIONS_DIR, ignore_errors=True)
+        _repin(None)
+        return deleted
@@ -0,0 +1,527 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import traceback
+import multiprocessing
+from config import DATA_DIR
+from storage import artifact_row_count
+
+# Base SQLite contenant la file de tâches (partagée entre le CLI, Streamlit et les workers)
+JOBS_DB_PATH = os.path.join(DATA_DIR, "jobs.db")
+
+# États possibles d'une tâche
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# Priorités (la plus élevée est traitée en premier)
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 5
+PRIORITY_HIGH = 10
+
+# Intervalle entre deux battements de cœur d'un worker (secondes)
+HEARTBEAT_INTERVAL = 10
+# Au-delà de ce délai sans battement, une tâche en cours est considérée comme abandonnée
+HEARTBEAT_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 5,
+    status TEXT NOT NULL DEFAULT 'pending',
+    depends_on INTEGER REFERENCES jobs(id),
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker_pid INTEGER,
+    heartbeat_at REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_pending_dedup ON jobs(dedup_key) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority DESC, id);
+CREATE TABLE IF NOT EXISTS job_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    progress REAL NOT NULL,
+    message TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_progress_job ON job_progress(job_id, id);
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+
+def _connect():
+    """Ouvre une connexion à la base des tâches (mode autocommit, transactions explicites)"""
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    # Le mode WAL permet aux lecteurs (UI, CLI) de ne pas bloquer les workers
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _dedup_key(job_type, payload, depends_on=None):
+    """
+    Calcule la clé de déduplication d'une tâche à partir de son type, de ses paramètres et de la tâche
+    dont elle dépend (deux tâches attendant des tâches différentes ne sont pas identiques)
+    """
+    canonical = json.dumps({'type': job_type, 'payload': payload, 'depends_on': depends_on}, sort_keys=True)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def _row_to_dict(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def enqueue_job(job_type, payload=None, priority=PRIORITY_NORMAL, depends_on=None, max_attempts=3):
+    """
+    Ajoute une tâche dans la file d'attente
+
+    Une tâche identique (même type, mêmes paramètres, même dépendance) déjà en attente n'est pas dupliquée :
+    son identifiant est retourné et sa priorité est relevée si nécessaire.
+
+    Parameters:
+        job_type (str): Type de tâche (voir JOB_HANDLERS)
+        payload (dict): Paramètres transmis au gestionnaire de la tâche
+        priority (int): Priorité de la tâche (PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH)
+        depends_on (int): Identifiant d'une tâche devant être terminée avant celle-ci
+        max_attempts (int): Nombre maximal de tentatives en cas d'interruption du worker
+
+    Returns:
+        int: Identifiant de la tâche
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Type de tâche inconnu: {job_type}. Options disponibles: {list(JOB_HANDLERS.keys())}")
+
+    payload = payload or {}
+    dedup_key = _dedup_key(job_type, payload, depends_on)
+    conn = _connect()
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(
+            """INSERT OR IGNORE INTO jobs (job_type, payload, dedup_key, priority, status, depends_on,
+                                           max_attempts, created_at)
+               VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)""",
+            (job_type, json.dumps(payload, sort_keys=True), dedup_key, priority, depends_on,
+             max_attempts, time.time())
+        )
+
+        if cursor.rowcount:
+            job_id = cursor.lastrowid
+        else:
+            # Tâche identique déjà en attente : on la réutilise
+            row = conn.execute("SELECT id, priority FROM jobs WHERE dedup_key = ? AND status = 'pending'",
+                               (dedup_key,)).fetchone()
+            job_id = row['id']
+            if priority > row['priority']:
+                conn.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, job_id))
+
+        conn.execute("COMMIT")
+        return job_id
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def enqueue_pipeline(priority=PRIORITY_NORMAL):
+    """
+    Ajoute la chaîne extraction -> traitement -> analyse dans la file d'attente
+
+    Les trois étapes forment une seule tâche, exécutée dans une seule génération : les pages ne servent
+    les nouveaux titres qu'avec les données nettoyées et analysées correspondantes (comme
+    main.run_full_pipeline).
+
+    Returns:
+        list: Identifiants des tâches créées, dans l'ordre d'exécution
+    """
+    return [enqueue_job('pipeline', priority=priority)]
+
+
+def get_job(job_id):
+    """Retourne l'état d'une tâche (dict) ou None si elle n'existe pas"""
+    conn = _connect()
+    try:
+        return _row_to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def list_jobs(limit=20, status=None):
+    """
+    Liste les tâches les plus récentes
+
+    Parameters:
+        limit (int): Nombre maximal de tâches retournées
+        status (str): Filtrer sur un état particulier
+
+    Returns:
+        list: Liste de dictionnaires décrivant les tâches
+    """
+    conn = _connect()
+    try:
+        if status:
+            rows = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit))
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [_row_to_dict(row) for row in rows.fetchall()]
+    finally:
+        conn.close()
+
+
+def get_job_progress(job_id):
+    """Retourne l'historique de progression d'une tâche"""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT progress, message, created_at FROM job_progress WHERE job_id = ? ORDER BY id",
+                            (job_id,)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def report_progress(job_id, progress, message=None):
+    """
+    Enregistre l'avancement d'une tâche
+
+    Parameters:
+        job_id (int): Identifiant de la tâche
+        progress (float): Avancement entre 0 et 1
+        message (str): Description de l'étape en cours
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE jobs SET progress = ?, message = ?, heartbeat_at = ? WHERE id = ?",
+                     (progress, message, now, job_id))
+        conn.execute("INSERT INTO job_progress (job_id, progress, message, created_at) VALUES (?, ?, ?, ?)",
+                     (job_id, progress, message, now))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def active_worker_count():
+    """Retourne le nombre de workers ayant donné signe de vie récemment"""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT COUNT(*) AS n FROM workers WHERE heartbeat_at > ?",
+                           (time.time() - HEARTBEAT_TIMEOUT,)).fetchone()
+        return row['n']
+    finally:
+        conn.close()
+
+
+def recover_stale_jobs(conn=None):
+    """
+    Remet en attente les tâches dont le worker a cessé de répondre (crash, arrêt brutal)
+
+    Les tâches ayant épuisé leurs tentatives sont marquées en échec, ainsi que les tâches
+    qui dépendent d'une tâche en échec.
+
+    Returns:
+        int: Nombre de tâches récupérées
+    """
+    own_conn = conn is None
+    conn = conn or _connect()
+    now = time.time()
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        stale_before = now - HEARTBEAT_TIMEOUT
+        recovered = conn.execute(
+            """UPDATE jobs SET status = 'pending', worker_pid = NULL, message = 'Reprise après interruption'
+               WHERE status = 'running' AND heartbeat_at < ? AND attempts < max_attempts""",
+            (stale_before,)
+        ).rowcount
+        conn.execute(
+            """UPDATE jobs SET status = 'failed', finished_at = ?, error = 'Nombre maximal de tentatives atteint'
+               WHERE status = 'running' AND heartbeat_at < ? AND attempts >= max_attempts""",
+            (now, stale_before)
+        )
+        conn.execute(
+            """UPDATE jobs SET status = 'failed', finished_at = ?, error = 'Une tâche dont elle dépend a échoué'
+               WHERE status = 'pending' AND depends_on IN (SELECT id FROM jobs WHERE status = 'failed')""",
+            (now,)
+        )
+        conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (stale_before,))
+        conn.execute("COMMIT")
+
+        if recovered:
+            print(f"{recovered} tâche(s) interrompue(s) remise(s) en attente.")
+        return recovered
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def _claim_next_job(conn, pid):
+    """Réserve atomiquement la prochaine tâche exécutable (priorité décroissante, puis ordre d'arrivée)"""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            """SELECT * FROM jobs j
+               WHERE j.status = 'pending'
+                 AND (j.depends_on IS NULL
+                      OR EXISTS (SELECT 1 FROM jobs d WHERE d.id = j.depends_on AND d.status = 'done'))
+               ORDER BY j.priority DESC, j.id
+               LIMIT 1"""
+        ).fetchone()
+
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+
+        conn.execute(
+            """UPDATE jobs SET status = 'running', worker_pid = ?, attempts = attempts + 1,
+                              started_at = ?, heartbeat_at = ?, error = NULL
+               WHERE id = ?""",
+            (pid, now, now, row['id'])
+        )
+        conn.execute("COMMIT")
+        return _row_to_dict(row)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _finish_job(conn, job_id, status, result=None, error=None):
+    conn.execute(
+        """UPDATE jobs SET status = ?, progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END,
+                          result = ?, error = ?, finished_at = ?
+           WHERE id = ?""",
+        (status, status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+    )
+
+
+# Gestionnaires de tâches - importations différées pour éviter les importations circulaires
+# et ne charger que les modules nécessaires dans chaque worker
+
+def _extract(payload):
+    from spotify_api import extract_spotify_data
+    tracks, features = extract_spotify_data(force_new_auth=payload.get('force_new_auth', False))
+    if tracks is None:
+        raise RuntimeError("Échec de l'extraction des données Spotify")
+    return {'tracks': len(tracks), 'features': len(features) if features is not None else 0}
+
+
+def _process(payload):
+    from data_processing import process_data
+    cleaned = process_data(force_rebuild=payload.get('force_rebuild', False), refit=payload.get('refit', False))
+    if cleaned is None:
+        raise RuntimeError("Échec du traitement des données")
+    return {'tracks': artifact_row_count("cleaned_tracks")}
+
+
+def _analyze(payload):
+    import data_analysis
+    # Un worker vit longtemps : invalider le cache pour analyser les données actuelles
+    data_analysis._analysis_cache.clear()
+    stats, _, categorized_df = data_analysis.analyze_data()
+    if not stats:
+        raise RuntimeError("Échec de l'analyse des données")
+    return {'tracks': stats['total_tracks'], 'unique_artists': stats['unique_artists']}
+
+
+# Étapes du pipeline : (type de tâche, message d'avancement, fonction)
+PIPELINE_STEPS = [
+    ('extraction', "Extraction des playlists Spotify...", _extract),
+    ('processing', "Nettoyage des données...", _process),
+    ('analysis', "Analyse des données...", _analyze),
+]
+
+
+def _run_step(step_type):
+    """Gestionnaire d'une tâche exécutant une seule étape du pipeline"""
+    message, step = next((message, step) for name, message, step in PIPELINE_STEPS if name == step_type)
+
+    def run(job_id, payload):
+        report_progress(job_id, 0.1, message)
+        return step(payload)
+    return run
+
+
+def _run_pipeline(job_id, payload):
+    """Enchaîne toutes les étapes du pipeline dans une même génération (voir _run_job)"""
+    results = {}
+    for index, (name, message, step) in enumerate(PIPELINE_STEPS):
+        report_progress(job_id, index / len(PIPELINE_STEPS), message)
+        results[name] = step(payload)
+    return results
+
+
+def _run_history_sync(job_id, payload):
+    from listening_history import sync_recently_played
+    report_progress(job_id, 0.1, "Synchronisation de l'historique d'écoute...")
+    return {'new_plays': sync_recently_played()}
+
+
+def _run_audio_analysis(job_id, payload):
+    from audio_analysis import ingest_audio_analysis
+    report_progress(job_id, 0.1, "Récupération des analyses audio détaillées...")
+    return {'tracks': ingest_audio_analysis(track_ids=payload.get('track_ids'))}
+
+
+JOB_HANDLERS = {
+    'extraction': _run_step('extraction'),
+    'processing': _run_step('processing'),
+    'analysis': _run_step('analysis'),
+    'pipeline': _run_pipeline,
+    'history_sync': _run_history_sync,
+    'audio_analysis': _run_audio_analysis,
+}
+
+# Tâches qui réécrivent les données servies : exécutées dans une nouvelle génération, publiée si elles réussissent
+GENERATION_JOBS = {'extraction', 'processing', 'analysis', 'pipeline'}
+
+
+def _run_job(job):
+    handler = JOB_HANDLERS[job['job_type']]
+    if job['job_type'] not in GENERATION_JOBS:
+        return handler(job['id'], job['payload'])
+
+    # Importation différée : generations dépend de config, chargé à la demande dans chaque worker
+    from generations import build_generation
+    with build_generation():
+        return handler(job['id'], job['payload'])
+
+
+def _heartbeat_loop(pid, stop_event, current_job):
+    """Signale périodiquement que le worker (et sa tâche en cours) est toujours actif"""
+    conn = _connect()
+    try:
+        while not stop_event.wait(HEARTBEAT_INTERVAL):
+            now = time.time()
+            conn.execute("UPDATE workers SET heartbeat_at = ? WHERE pid = ?", (now, pid))
+            job_id = current_job.get('id')
+            if job_id is not None:
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'", (now, job_id))
+    finally:
+        conn.close()
+
+
+def worker_loop(stop_event=None, poll_interval=2.0):
+    """
+    Boucle principale d'un worker : réserve et exécute les tâches jusqu'à l'arrêt demandé
+
+    Parameters:
+        stop_event (multiprocessing.Event): Événement signalant l'arrêt du worker
+        poll_interval (float): Pause entre deux recherches lorsque la file est vide
+    """
+    pid = os.getpid()
+    conn = _connect()
+    now = time.time()
+    conn.execute("INSERT OR REPLACE INTO workers (pid, started_at, heartbeat_at) VALUES (?, ?, ?)", (pid, now, now))
+
+    current_job = {}
+    heartbeat_stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat_loop, args=(pid, heartbeat_stop, current_job), daemon=True)
+    heartbeat.start()
+
+    print(f"Worker {pid} démarré.")
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            recover_stale_jobs(conn)
+            job = _claim_next_job(conn, pid)
+
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+
+            current_job['id'] = job['id']
+            print(f"Worker {pid}: exécution de la tâche {job['id']} ({job['job_type']})")
+
+            try:
+                result = _run_job(job)
+                _finish_job(conn, job['id'], STATUS_DONE, result=result)
+                report_progress(job['id'], 1.0, "Terminé")
+                print(f"Worker {pid}: tâche {job['id']} terminée.")
+            except Exception as e:
+                _finish_job(conn, job['id'], STATUS_FAILED, error=f"{e}\n{traceback.format_exc()}")
+                print(f"Worker {pid}: échec de la tâche {job['id']}: {e}")
+            finally:
+                current_job.pop('id', None)
+    finally:
+        heartbeat_stop.set()
+        conn.execute("DELETE FROM workers WHERE pid = ?", (pid,))
+        conn.close()
+        print(f"Worker {pid} arrêté.")
+
+
+def start_workers(num_workers=None, poll_interval=2.0):
+    """
+    Démarre un pool de processus workers
+
+    Parameters:
+        num_workers (int): Nombre de workers (par défaut: nombre de cœurs, au plus 4)
+        poll_interval (float): Pause entre deux recherches lorsque la file est vide
+
+    Returns:
+        tuple: (liste des processus, événement d'arrêt)
+    """
+    if num_workers is None:
+        num_workers = min(4, multiprocessing.cpu_count())
+
+    # Récupérer les tâches laissées en cours par un précédent arrêt brutal
+    recover_stale_jobs()
+
+    stop_event = multiprocessing.Event()
+    processes = []
+    for _ in range(num_workers):
+        process = multiprocessing.Process(target=worker_loop, args=(stop_event, poll_interval))
+        process.start()
+        processes.append(process)
+
+    return processes, stop_event
+
+
+def stop_workers(processes, stop_event, timeout=None):
+    """Demande l'arrêt des workers et attend la fin de leur tâche en cours"""
+    stop_event.set()
+    for process in processes:
+        process.join(timeout)
+
+
+if __name__ == "__main__":
+    # Lancer un pool de workers : python job_queue.py [nombre_de_workers]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    workers, stop = start_workers(count)
+    print(f"{len(workers)} worker(s) en attente de tâches. Ctrl+C pour arrêter.")
+
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        print("\nArrêt des workers (fin des tâches en cours)...")
+        stop_workers(workers, stop)
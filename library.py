@@ -0,0 +1,203 @@
+import pandas as pd
+from data_processing import ARTIST_SOURCE_COLUMNS, artist_pairs
+from storage import artifact_exists, load_artifact, save_artifact
+
+# Tables de la bibliothèque normalisée : chaque information n'est stockée qu'une fois
+# - tracks : une ligne par titre
+# - playlists : une ligne par playlist
+# - playlist_membership : une ligne par (playlist, titre, position)
+# - artists : une ligne par artiste (un titre à plusieurs artistes compte pour chacun d'eux)
+# - features : une ligne par titre avec ses caractéristiques audio (fichier audio_features de l'extraction)
+LIBRARY_TABLES = {
+    'tracks': "library_tracks",
+    'playlists': "library_playlists",
+    'playlist_membership': "library_playlist_membership",
+    'artists': "library_artists",
+    'features': "audio_features"
+}
+
+TRACK_COLUMNS = ['track_id', 'track_name', 'artist_name', 'album_id', 'album_name', 'release_date', 'popularity']
+PLAYLIST_COLUMNS = ['playlist_id', 'playlist_name', 'playlist_owner', 'playlist_tracks', 'snapshot_id']
+MEMBERSHIP_COLUMNS = ['playlist_id', 'track_id', 'position', 'added_at']
+
+
+def build_library(tracks_df, features_df=None, playlists_df=None):
+    """
+    Construit les tables normalisées à partir des titres extraits (une ligne par couple playlist/titre)
+
+    Parameters:
+        tracks_df (DataFrame): Titres extraits des playlists
+        features_df (DataFrame): Caractéristiques audio par titre (optionnel)
+        playlists_df (DataFrame): Playlists retournées par l'API (optionnel, sinon déduites des titres)
+
+    Returns:
+        dict: DataFrame par nom de table (None pour 'features' sans caractéristiques audio)
+    """
+    tracks_df = tracks_df.copy()
+    if 'position' not in tracks_df.columns:
+        # Données d'une ancienne extraction : position déduite de l'ordre des lignes
+        tracks_df['position'] = tracks_df.groupby('playlist_id', sort=False).cumcount()
+    if 'added_at' not in tracks_df.columns:
+        tracks_df['added_at'] = None
+
+    # Titres : les informations du titre ne dépendent pas de la playlist
+    track_columns = [col for col in TRACK_COLUMNS if col in tracks_df.columns]
+    tracks = tracks_df[track_columns].drop_duplicates(subset=['track_id']).reset_index(drop=True)
+
+    # Playlists, dans l'ordre de la bibliothèque de l'utilisateur
+    if playlists_df is None or playlists_df.empty:
+        playlists_df = tracks_df[['playlist_id', 'playlist_name']].drop_duplicates(subset=['playlist_id'])
+    playlists = playlists_df[[col for col in PLAYLIST_COLUMNS if col in playlists_df.columns]].reset_index(drop=True)
+
+    # Appartenance des titres aux playlists
+    membership = tracks_df[MEMBERSHIP_COLUMNS].reset_index(drop=True)
+    membership['added_at'] = pd.to_datetime(membership['added_at'], utc=True, errors='coerce')
+
+    # Artistes : nombre de titres distincts par artiste, regroupés sur l'identifiant Spotify
+    # (ou le nom pour les titres d'une ancienne extraction, voir data_processing.artist_pairs)
+    artist_columns = [col for col in ARTIST_SOURCE_COLUMNS if col in tracks_df.columns]
+    pairs = artist_pairs(tracks_df[artist_columns].drop_duplicates(subset=['track_id']))
+    pairs = pairs.drop_duplicates(subset=['track_id', 'artist_key'])
+    artists = (pairs.groupby('artist_key', sort=False)
+               .agg(artist_id=('artist_id', 'first'), artist_name=('artist_name', 'first'),
+                    track_count=('track_id', 'size'))
+               .reset_index(drop=True)
+               .sort_values(['track_count', 'artist_name'], ascending=[False, True])
+               .reset_index(drop=True))
+
+    features = None
+    if features_df is not None and not features_df.empty:
+        features = features_df.drop_duplicates(subset=['track_id']).reset_index(drop=True)
+
+    return {
+        'tracks': tracks,
+        'playlists': playlists,
+        'playlist_membership': membership,
+        'artists': artists,
+        'features': features
+    }
+
+
+def save_library(tables):
+    """
+    Sauvegarde les tables de la bibliothèque
+
+    Parameters:
+        tables (dict): Tables produites par build_library
+    """
+    for name, df in tables.items():
+        # Sans caractéristiques audio, ne pas écraser celles d'une extraction précédente
+        if df is not None:
+            save_artifact(df, LIBRARY_TABLES[name], producer="library")
+    print(f"Bibliothèque sauvegardée: {len(tables['tracks'])} titres, {len(tables['playlists'])} playlists, "
+          f"{len(tables['playlist_membership'])} appartenances")
+
+    # Importation différée : library_db dépend de ce module
+    from library_db import build_library_db
+    build_library_db()
+
+
+def library_exists():
+    """Indique si la bibliothèque normalisée a été construite"""
+    return all(artifact_exists(LIBRARY_TABLES[name]) for name in ('tracks', 'playlists', 'playlist_membership'))
+
+
+def load_table(name, columns=None):
+    """
+    Charge une table de la bibliothèque
+
+    Parameters:
+        name (str): Nom de la table (clé de LIBRARY_TABLES)
+        columns (list): Colonnes à charger (par défaut toutes)
+
+    Returns:
+        DataFrame: Contenu de la table
+    """
+    if name not in LIBRARY_TABLES:
+        raise ValueError(f"Table inconnue: {name}. Options disponibles: {list(LIBRARY_TABLES)}")
+    return load_artifact(LIBRARY_TABLES[name], columns=columns)
+
+
+def rebuild_library_from_tracks():
+    """
+    Construit la bibliothèque à partir des fichiers d'une extraction existante
+
+    Returns:
+        bool: True si la bibliothèque a été construite
+    """
+    if not artifact_exists("tracks"):
+        print("Aucune extraction disponible pour construire la bibliothèque.")
+        return False
+
+    # Les caractéristiques audio sont déjà stockées par titre (fichier audio_features)
+    save_library(build_library(load_artifact("tracks")))
+    return True
+
+
+def get_tracks(with_features=True, columns=None):
+    """
+    Titres de la bibliothèque (une ligne par titre), avec leurs caractéristiques audio
+
+    Parameters:
+        with_features (bool): Joindre la table des caractéristiques audio
+        columns (list): Colonnes à conserver (par défaut toutes)
+
+    Returns:
+        DataFrame: Titres
+    """
+    tracks = load_table('tracks')
+    if with_features and artifact_exists(LIBRARY_TABLES['features']):
+        tracks = tracks.merge(load_table('features'), on='track_id', how='left')
+    if columns is not None:
+        tracks = tracks[[col for col in columns if col in tracks.columns]]
+    return tracks
+
+
+def get_playlist_sizes():
+    """
+    Nombre de titres de chaque playlist
+
+    Returns:
+        DataFrame: playlist_id, playlist_name et track_count, de la plus grande à la plus petite
+    """
+    membership = load_table('playlist_membership', columns=['playlist_id'])
+    playlists = load_table('playlists', columns=['playlist_id', 'playlist_name'])
+    sizes = membership.groupby('playlist_id').size().rename('track_count').reset_index()
+    sizes = playlists.merge(sizes, on='playlist_id', how='inner')
+    return sizes.sort_values('track_count', ascending=False, kind='mergesort').reset_index(drop=True)
+
+
+def get_playlist_tracks(playlist_id, tracks_df=None):
+    """
+    Titres d'une playlist dans leur ordre d'origine
+
+    Parameters:
+        playlist_id (str): Identifiant de la playlist
+        tracks_df (DataFrame): Données par titre à joindre (par défaut get_tracks())
+
+    Returns:
+        DataFrame: Une ligne par titre de la playlist, avec position et date d'ajout
+    """
+    membership = load_table('playlist_membership')
+    membership = membership[membership['playlist_id'] == playlist_id].sort_values('position')
+    if tracks_df is None:
+        tracks_df = get_tracks()
+    # Les colonnes de playlist éventuellement présentes dans tracks_df viennent d'une autre playlist
+    tracks_df = tracks_df.drop(columns=[col for col in ('playlist_id', 'playlist_name') if col in tracks_df.columns])
+    return membership.merge(tracks_df, on='track_id', how='inner').reset_index(drop=True)
+
+
+def get_track_playlists(track_id):
+    """
+    Playlists contenant un titre
+
+    Parameters:
+        track_id (str): Identifiant du titre
+
+    Returns:
+        DataFrame: playlist_id, playlist_name, position et date d'ajout
+    """
+    membership = load_table('playlist_membership')
+    membership = membership[membership['track_id'] == track_id]
+    playlists = load_table('playlists', columns=['playlist_id', 'playlist_name'])
+    return membership.merge(playlists, on='playlist_id', how='left').reset_index(drop=True)
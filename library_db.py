@@ -0,0 +1,228 @@
+import os
+import sqlite3
+import pandas as pd
+from generations import generation_path
+from storage import artifact_exists, load_artifact
+from data_lock import artifact_lock
+from library import LIBRARY_TABLES
+
+# Base SQLite indexée pour les recherches ponctuelles des pages (titre, artiste, album, playlist),
+# dans la génération courante des données (voir generations.py)
+LIBRARY_DB_FILE = "library.db"
+
+FEATURE_COLUMNS = ['danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness', 'acousticness',
+                   'instrumentalness', 'liveness', 'valence', 'tempo']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id TEXT PRIMARY KEY,
+    track_name TEXT,
+    artist_name TEXT,
+    album_id TEXT,
+    album_name TEXT,
+    release_date TEXT,
+    popularity INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_name_artist ON tracks(track_name, artist_name);
+CREATE INDEX IF NOT EXISTS idx_tracks_artist ON tracks(artist_name);
+CREATE INDEX IF NOT EXISTS idx_tracks_album ON tracks(album_id);
+CREATE TABLE IF NOT EXISTS playlists (
+    playlist_id TEXT PRIMARY KEY,
+    playlist_name TEXT,
+    playlist_owner TEXT,
+    playlist_tracks INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_playlists_name ON playlists(playlist_name);
+CREATE TABLE IF NOT EXISTS playlist_membership (
+    playlist_id TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    added_at TEXT,
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_membership_track ON playlist_membership(track_id);
+CREATE TABLE IF NOT EXISTS features (
+    track_id TEXT PRIMARY KEY,
+    danceability REAL,
+    energy REAL,
+    key INTEGER,
+    loudness REAL,
+    mode INTEGER,
+    speechiness REAL,
+    acousticness REAL,
+    instrumentalness REAL,
+    liveness REAL,
+    valence REAL,
+    tempo REAL
+);
+"""
+
+# Colonnes de chaque table, dans l'ordre du schéma
+_TABLE_COLUMNS = {
+    'tracks': ['track_id', 'track_name', 'artist_name', 'album_id', 'album_name', 'release_date', 'popularity'],
+    'playlists': ['playlist_id', 'playlist_name', 'playlist_owner', 'playlist_tracks'],
+    'playlist_membership': ['playlist_id', 'track_id', 'position', 'added_at'],
+    'features': ['track_id'] + FEATURE_COLUMNS
+}
+
+# Fichiers de la bibliothèque normalisée dont les tables sont issues
+_SOURCE_ARTIFACTS = {table: LIBRARY_TABLES[table] for table in _TABLE_COLUMNS}
+
+
+def library_db_path():
+    """Chemin de la base de la bibliothèque"""
+    return generation_path(LIBRARY_DB_FILE)
+
+
+def _connect(path=None):
+    """Ouvre une connexion à la base de la bibliothèque"""
+    conn = sqlite3.connect(path or library_db_path(), timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def library_db_exists():
+    """Indique si la base de la bibliothèque a été construite"""
+    return os.path.exists(library_db_path())
+
+
+def _rows(df, columns):
+    """Convertit un DataFrame en tuples insérables (valeurs manquantes -> NULL)"""
+    df = df.reindex(columns=columns)
+    if 'added_at' in df.columns:
+        df['added_at'] = df['added_at'].map(lambda value: value.isoformat() if pd.notna(value) else None)
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+
+def build_library_db():
+    """
+    Reconstruit la base SQLite à partir des tables de la bibliothèque
+
+    La base est construite dans un fichier temporaire puis substituée à l'ancienne :
+    les pages ouvertes continuent à lire l'ancienne version pendant la reconstruction.
+
+    Returns:
+        bool: True si la base a été construite
+    """
+    if not all(artifact_exists(_SOURCE_ARTIFACTS[name]) for name in ('tracks', 'playlists', 'playlist_membership')):
+        print("Bibliothèque non disponible, base SQLite non construite.")
+        return False
+
+    db_path = library_db_path()
+    temp_path = db_path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    conn = _connect(temp_path)
+    try:
+        conn.executescript(_SCHEMA)
+        with conn:
+            for table, columns in _TABLE_COLUMNS.items():
+                if not artifact_exists(_SOURCE_ARTIFACTS[table]):
+                    continue
+                df = load_artifact(_SOURCE_ARTIFACTS[table], columns=columns)
+                placeholders = ", ".join("?" for _ in columns)
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                    _rows(df, columns)
+                )
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    # Les requêtes en cours se terminent sur l'ancienne base avant la substitution
+    with artifact_lock("library_db", exclusive=True):
+        os.replace(temp_path, db_path)
+    print(f"Base de la bibliothèque mise à jour: {db_path}")
+    return True
+
+
+def _query_one(sql, params=()):
+    with artifact_lock("library_db"):
+        conn = _connect()
+        try:
+            row = conn.execute(sql, params).fetchone()
+            return dict(row) if row is not None else None
+        finally:
+            conn.close()
+
+
+def _query_df(sql, params=()):
+    with artifact_lock("library_db"):
+        conn = _connect()
+        try:
+            return pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+
+
+_TRACK_SELECT = f"""
+SELECT t.*, {', '.join('f.' + col for col in FEATURE_COLUMNS)}
+FROM tracks t LEFT JOIN features f ON f.track_id = t.track_id
+"""
+
+
+def get_track(track_id):
+    """Titre et caractéristiques audio (dict) ou None si le titre est inconnu"""
+    return _query_one(_TRACK_SELECT + " WHERE t.track_id = ?", (track_id,))
+
+
+def find_track(track_name, artist_name):
+    """
+    Recherche un titre par son nom et son artiste
+
+    Returns:
+        dict: Titre et caractéristiques audio, ou None
+    """
+    return _query_one(_TRACK_SELECT + " WHERE t.track_name = ? AND t.artist_name = ? LIMIT 1",
+                      (track_name, artist_name))
+
+
+def tracks_by_artist(artist_name):
+    """Titres d'un artiste (crédit exact), avec leurs caractéristiques audio"""
+    return _query_df(_TRACK_SELECT + " WHERE t.artist_name = ? ORDER BY t.track_name", (artist_name,))
+
+
+def tracks_by_album(album_id):
+    """Titres d'un album, avec leurs caractéristiques audio"""
+    return _query_df(_TRACK_SELECT + " WHERE t.album_id = ? ORDER BY t.track_name", (album_id,))
+
+
+def playlist_tracks(playlist_id):
+    """
+    Titres d'une playlist dans leur ordre d'origine
+
+    Returns:
+        DataFrame: Titres, position, date d'ajout et caractéristiques audio
+    """
+    return _query_df(f"""
+        SELECT m.position, m.added_at, t.*, {', '.join('f.' + col for col in FEATURE_COLUMNS)}
+        FROM playlist_membership m
+        JOIN tracks t ON t.track_id = m.track_id
+        LEFT JOIN features f ON f.track_id = m.track_id
+        WHERE m.playlist_id = ?
+        ORDER BY m.position
+    """, (playlist_id,))
+
+
+def track_playlists(track_id):
+    """Playlists contenant un titre (DataFrame: playlist_id, playlist_name, position, added_at)"""
+    return _query_df("""
+        SELECT m.playlist_id, p.playlist_name, m.position, m.added_at
+        FROM playlist_membership m
+        LEFT JOIN playlists p ON p.playlist_id = m.playlist_id
+        WHERE m.track_id = ?
+        ORDER BY p.playlist_name
+    """, (track_id,))
+
+
+def playlist_sizes():
+    """Nombre de titres par playlist (DataFrame: playlist_id, playlist_name, track_count)"""
+    return _query_df("""
+        SELECT p.playlist_id, p.playlist_name, COUNT(m.track_id) AS track_count
+        FROM playlists p
+        JOIN playlist_membership m ON m.playlist_id = p.playlist_id
+        GROUP BY p.playlist_id
+        ORDER BY track_count DESC
+    """)
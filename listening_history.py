@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import pandas as pd
+from config import DATA_DIR
+from data_lock import artifact_lock
+
+# Historique d'écoute : un fichier par mois, uniquement complété (jamais réécrit)
+HISTORY_DIR = os.path.join(DATA_DIR, "history")
+SYNC_STATE_PATH = os.path.join(HISTORY_DIR, "sync_state.json")
+
+# Limite imposée par l'API pour l'endpoint recently-played
+RECENTLY_PLAYED_LIMIT = 50
+
+# Verrou de la synchronisation (curseur de sync_state.json) : une seule synchronisation à la fois
+HISTORY_SYNC_LOCK = "history_sync"
+
+HISTORY_COLUMNS = ['played_at', 'track_id', 'track_name', 'artist_name', 'album_name',
+                   'duration_ms', 'context_type', 'context_uri']
+
+
+def _partition_path(month):
+    """Chemin du fichier d'historique d'un mois ('YYYY-MM')"""
+    return os.path.join(HISTORY_DIR, f"plays_{month}.csv")
+
+
+def _partition_lock_name(month):
+    """Nom du verrou du fichier d'historique d'un mois"""
+    return f"history_plays_{month}"
+
+
+def _load_sync_state():
+    if os.path.exists(SYNC_STATE_PATH):
+        with open(SYNC_STATE_PATH, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_sync_state(state):
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    temp_path = SYNC_STATE_PATH + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(temp_path, SYNC_STATE_PATH)
+
+
+def _item_to_row(item):
+    """Convertit un élément de l'API recently-played en ligne d'historique"""
+    track = item['track']
+    context = item.get('context') or {}
+    return {
+        'played_at': item['played_at'],
+        'track_id': track['id'],
+        'track_name': track['name'],
+        'artist_name': ', '.join([artist['name'] for artist in track['artists']]),
+        'album_name': track['album']['name'],
+        'duration_ms': track.get('duration_ms'),
+        'context_type': context.get('type'),
+        'context_uri': context.get('uri')
+    }
+
+
+def append_plays(plays_df):
+    """
+    Ajoute des écoutes à l'historique en ignorant celles déjà enregistrées (clé: played_at)
+
+    Parameters:
+        plays_df (DataFrame): Écoutes au format HISTORY_COLUMNS
+
+    Returns:
+        int: Nombre d'écoutes réellement ajoutées
+    """
+    if plays_df is None or plays_df.empty:
+        return 0
+
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    plays_df = plays_df.drop_duplicates(subset=['played_at'])
+    played_at = pd.to_datetime(plays_df['played_at'], utc=True, format='ISO8601')
+    months = played_at.dt.strftime('%Y-%m')
+
+    added = 0
+    for month, month_df in plays_df.groupby(months.values):
+        path = _partition_path(month)
+        month_df = month_df.sort_values('played_at')
+
+        # Lecture des écoutes connues et ajout sous le même verrou : deux synchronisations
+        # concurrentes n'enregistrent pas deux fois la même écoute
+        with artifact_lock(_partition_lock_name(month), exclusive=True):
+            if os.path.exists(path):
+                known = set(pd.read_csv(path, usecols=['played_at'])['played_at'])
+                month_df = month_df[~month_df['played_at'].isin(known)]
+
+            if month_df.empty:
+                continue
+
+            month_df[HISTORY_COLUMNS].to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+        added += len(month_df)
+
+    return added
+
+
+def _background_client():
+    """Client Spotify de la voie arrière-plan : la synchronisation ne doit pas ralentir les pages"""
+    # Importations différées : le client Spotify n'est nécessaire que pour la synchronisation
+    from spotify_auth import SpotifyAuth
+    from api_scheduler import LANE_BACKGROUND
+    return SpotifyAuth.get_instance().get_scheduled_client(LANE_BACKGROUND)
+
+
+def sync_recently_played(sp=None):
+    """
+    Récupère uniquement les écoutes postérieures à la dernière synchronisation et les ajoute à l'historique
+
+    Le curseur 'after' de l'API est conservé entre deux synchronisations : en régime normal,
+    une synchronisation ne coûte qu'une requête.
+
+    Parameters:
+        sp (spotipy.Spotify): Client Spotify à réutiliser (optionnel)
+
+    Returns:
+        int: Nombre de nouvelles écoutes enregistrées
+    """
+    if sp is None:
+        sp = _background_client()
+
+    # Le curseur est lu puis avancé : deux synchronisations concurrentes se suivent
+    with artifact_lock(HISTORY_SYNC_LOCK, exclusive=True):
+        return _sync_recently_played(sp)
+
+
+def _sync_recently_played(sp):
+    state = _load_sync_state()
+    after = state.get('after')
+    rows = []
+
+    while True:
+        if after is not None:
+            results = sp.current_user_recently_played(limit=RECENTLY_PLAYED_LIMIT, after=after)
+        else:
+            results = sp.current_user_recently_played(limit=RECENTLY_PLAYED_LIMIT)
+
+        items = results.get('items', []) if results else []
+        rows.extend(_item_to_row(item) for item in items if item.get('track') and item['track'].get('id'))
+
+        # Continuer tant que l'API renvoie des pages complètes et que le curseur avance
+        next_after = (results.get('cursors') or {}).get('after') if results else None
+        if len(items) < RECENTLY_PLAYED_LIMIT or not next_after or str(next_after) == str(after):
+            break
+        after = int(next_after)
+
+    if not rows:
+        print("Aucune nouvelle écoute depuis la dernière synchronisation.")
+        return 0
+
+    plays_df = pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+    added = append_plays(plays_df)
+
+    # Avancer le curseur jusqu'à l'écoute la plus récente (en millisecondes)
+    latest = pd.to_datetime(plays_df['played_at'], utc=True, format='ISO8601').max()
+    state['after'] = int(latest.value // 1_000_000)
+    state['last_sync'] = time.time()
+    _save_sync_state(state)
+
+    print(f"Historique d'écoute: {added} nouvelle(s) écoute(s) enregistrée(s).")
+    return added
+
+
+def load_listening_history(start=None, end=None):
+    """
+    Charge l'historique d'écoute, éventuellement restreint à une période
+
+    Parameters:
+        start (str): Date de début incluse (ex: '2025-01-01')
+        end (str): Date de fin exclue
+
+    Returns:
+        DataFrame: Écoutes triées par date, avec 'played_at' au format datetime
+    """
+    if not os.path.exists(HISTORY_DIR):
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    start_ts = pd.Timestamp(start, tz='UTC') if start else None
+    end_ts = pd.Timestamp(end, tz='UTC') if end else None
+
+    frames = []
+    for file_name in sorted(os.listdir(HISTORY_DIR)):
+        if not (file_name.startswith("plays_") and file_name.endswith(".csv")):
+            continue
+
+        # Ignorer les mois hors de la période sans lire les fichiers
+        month_start = pd.Timestamp(file_name[len("plays_"):-len(".csv")] + "-01", tz='UTC')
+        if end_ts is not None and month_start >= end_ts:
+            continue
+        if start_ts is not None and month_start + pd.offsets.MonthBegin(1) <= start_ts:
+            continue
+
+        with artifact_lock(_partition_lock_name(file_name[len("plays_"):-len(".csv")])):
+            frames.append(pd.read_csv(os.path.join(HISTORY_DIR, file_name)))
+
+    if not frames:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    history_df = pd.concat(frames, ignore_index=True)
+    history_df['played_at'] = pd.to_datetime(history_df['played_at'], utc=True, format='ISO8601')
+
+    if start_ts is not None:
+        history_df = history_df[history_df['played_at'] >= start_ts]
+    if end_ts is not None:
+        history_df = history_df[history_df['played_at'] < end_ts]
+
+    return history_df.sort_values('played_at').reset_index(drop=True)
+
+
+def run_history_sync_loop(interval=300):
+    """
+    Synchronise l'historique d'écoute à intervalle régulier
+
+    Parameters:
+        interval (int): Délai entre deux synchronisations (secondes)
+    """
+    sp = _background_client()
+
+    print(f"Synchronisation de l'historique toutes les {interval} secondes. Ctrl+C pour arrêter.")
+    while True:
+        try:
+            sync_recently_played(sp)
+        except Exception as e:
+            print(f"Erreur lors de la synchronisation de l'historique: {e}")
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    # Test du module : synchronisation périodique de l'historique
+    try:
+        run_history_sync_loop()
+    except KeyboardInterrupt:
+        history = load_listening_history()
+        print(f"\nHistorique: {len(history)} écoutes enregistrées.")
@@ -1,18 +1,26 @@
 import os
 import sys
 import time
+import shutil
 
 # Ajouter le répertoire racine au PATH pour les imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config import DATA_DIR
-from spotify_api import extract_spotify_data
+from storage import ARTIFACTS, artifact_exists, artifact_row_count, load_artifact
+from spotify_api import extract_spotify_data, get_source_fingerprint, take_source_playlists
 from data_processing import process_data
 from data_analysis import analyze_data
 from visualization import create_visualizations
 from recommendation import get_recommendations
 from top_artists import analyze_top_artists, TopArtistsAnalyzer
 from spotify_auth import SpotifyAuth
+from listening_history import sync_recently_played
+from snapshots import delete_all_snapshots
+from data_lock import data_dir_lock
+from generations import build_generation, delete_all_generations, generations_lock, pin_generation, rollback_generation
+import job_queue
+import pipeline
 
 
 def print_header(message):
@@ -46,45 +54,69 @@ def check_setup():
 
 def clear_data():
     """Supprime toutes les données extraites pour permettre un nouveau départ"""
-    # Fichiers à supprimer
-    data_files = [
-        "tracks.csv",
-        "audio_features.csv",
-        "tracks_with_features.csv",
-        "cleaned_tracks.csv",
-        "categorized_tracks.csv",
-        "audio_analysis.csv"
-    ]
-
-    deleted = False
-    for file_name in data_files:
-        file_path = os.path.join(DATA_DIR, file_name)
-        if os.path.exists(file_path):
+    # Verrous exclusifs : attendre la fin des constructions, lectures et écritures en cours (pages, workers, CLI)
+    with generations_lock(), data_dir_lock():
+        # Fichiers à supprimer (format Parquet, et CSV pour les exports et les anciennes versions)
+        data_files = [f"{name}.{fmt}" for name in ARTIFACTS for fmt in ("parquet", "csv", "manifest.json")]
+        data_files.extend(["audio_analysis.csv", "library.db", "feature_matrix.npy", "feature_matrix.json",
+                           "membership_index.npy", "membership_index.json", "pipeline_state.json",
+                           "processing_params.json"])
+
+        deleted = False
+        for file_name in data_files:
+            file_path = os.path.join(DATA_DIR, file_name)
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                    print(f"Fichier supprimé: {file_name}")
+                    deleted = True
+                except Exception as e:
+                    print(f"Erreur lors de la suppression de {file_name}: {e}")
+
+        # Supprimer les analyses audio détaillées (tableaux NumPy)
+        analysis_dir = os.path.join(DATA_DIR, "audio_analysis")
+        if os.path.isdir(analysis_dir):
             try:
-                os.remove(file_path)
-                print(f"Fichier supprimé: {file_name}")
+                shutil.rmtree(analysis_dir)
+                print("Dossier des analyses audio supprimé")
                 deleted = True
             except Exception as e:
-                print(f"Erreur lors de la suppression de {file_name}: {e}")
+                print(f"Erreur lors de la suppression des analyses audio: {e}")
 
-    # Supprimer aussi le dossier des visualisations
-    viz_dir = os.path.join(DATA_DIR, "visualizations")
-    if os.path.exists(viz_dir) and os.path.isdir(viz_dir):
+        # Supprimer les générations des données et le pointeur vers la génération servie
         try:
-            for file in os.listdir(viz_dir):
-                os.remove(os.path.join(viz_dir, file))
-            os.rmdir(viz_dir)
-            print("Dossier des visualisations supprimé")
-            deleted = True
+            if delete_all_generations():
+                print("Générations des données supprimées")
+                deleted = True
         except Exception as e:
-            print(f"Erreur lors de la suppression du dossier des visualisations: {e}")
+            print(f"Erreur lors de la suppression des générations: {e}")
 
-    if deleted:
-        print("\nToutes les données ont été supprimées. Vous pouvez désormais repartir de zéro.")
-        return True
-    else:
-        print("\nAucune donnée à supprimer.")
-        return False
+        # Supprimer les instantanés de la bibliothèque
+        try:
+            if delete_all_snapshots():
+                print("Instantanés de la bibliothèque supprimés")
+                deleted = True
+        except Exception as e:
+            print(f"Erreur lors de la suppression des instantanés: {e}")
+
+        # Supprimer aussi le dossier des visualisations
+        viz_dir = os.path.join(DATA_DIR, "visualizations")
+        if os.path.exists(viz_dir) and os.path.isdir(viz_dir):
+            try:
+                for file in os.listdir(viz_dir):
+                    os.remove(os.path.join(viz_dir, file))
+                os.rmdir(viz_dir)
+                print("Dossier des visualisations supprimé")
+                deleted = True
+            except Exception as e:
+                print(f"Erreur lors de la suppression du dossier des visualisations: {e}")
+
+        if deleted:
+            print("\nToutes les données ont été supprimées. Vous pouvez désormais repartir de zéro.")
+            return True
+        else:
+            print("\nAucune donnée à supprimer.")
+            return False
 
 
 def logout_spotify():
@@ -108,10 +140,38 @@ def logout_spotify():
         return False
 
 
-def run_extraction_process(force_new_auth=False):
-    """Exécute le processus d'extraction des données Spotify"""
+def run_in_new_generation(step, *args, **kwargs):
+    """
+    Exécute une étape dans une nouvelle génération des données
+
+    Les pages continuent à lire les données actuelles pendant l'étape ; la nouvelle génération n'est
+    publiée que si l'étape réussit.
+
+    Parameters:
+        step (callable): Étape à exécuter, retourne True en cas de succès
+
+    Returns:
+        bool: Résultat de l'étape
+    """
+    with build_generation() as generation:
+        success = step(*args, **kwargs)
+        if not success:
+            generation.discard()
+    return success
+
+
+def run_extraction_process(force_new_auth=False, incremental=False, playlists_df=None):
+    """
+    Exécute le processus d'extraction des données Spotify
+
+    Parameters:
+        force_new_auth (bool): Si True, force une nouvelle authentification
+        incremental (bool): Ne relire que les playlists modifiées depuis l'extraction précédente
+        playlists_df (DataFrame): Playlists déjà récupérées (ex: par la vérification de la source du pipeline)
+    """
     print_header("EXTRACTION DES DONNÉES SPOTIFY")
-    tracks, features = extract_spotify_data(force_new_auth=force_new_auth)
+    tracks, features = extract_spotify_data(force_new_auth=force_new_auth, incremental=incremental,
+                                            playlists_df=playlists_df)
 
     if tracks is not None:
         print(
@@ -122,13 +182,20 @@ def run_extraction_process(force_new_auth=False):
         return False
 
 
-def run_processing_step():
-    """Exécute l'étape de traitement et nettoyage des données"""
+def run_processing_step(refit=False):
+    """
+    Exécute l'étape de traitement et nettoyage des données
+
+    Parameters:
+        refit (bool): Réajuster les paramètres de normalisation et retraiter tous les titres
+                      (par défaut seuls les titres nouveaux ou modifiés sont traités)
+    """
     print_header("TRAITEMENT ET NETTOYAGE DES DONNÉES")
-    cleaned_data = process_data()
+    cleaned_data = process_data(refit=refit)
 
     if cleaned_data is not None:
-        print(f"\nTraitement réussi: {len(cleaned_data)} titres après nettoyage.")
+        # Lu dans le manifeste : process_data ne retourne qu'un nombre de titres en mode par lots
+        print(f"\nTraitement réussi: {artifact_row_count('cleaned_tracks')} titres après nettoyage.")
         return True
     else:
         print("\nÉchec du traitement des données. Assurez-vous que l'extraction a réussi.")
@@ -175,6 +242,7 @@ def run_analysis_step():
         return False
 
 
+@pin_generation()
 def run_visualization_step():
     """Exécute l'étape de création des visualisations"""
     print_header("CRÉATION DES VISUALISATIONS")
@@ -189,19 +257,18 @@ def run_visualization_step():
         return False
 
 
+@pin_generation()
 def run_recommendation_demo():
     """Exécute un exemple de recommandations"""
     print_header("DÉMONSTRATION DU SYSTÈME DE RECOMMANDATION")
 
     # Charger les données catégorisées
-    categorized_path = os.path.join(DATA_DIR, "categorized_tracks.csv")
-
-    if not os.path.exists(categorized_path):
+    if not artifact_exists("categorized_tracks"):
         print("Données catégorisées non disponibles. Exécutez d'abord l'analyse.")
         return False
 
-    import pandas as pd
-    df = pd.read_csv(categorized_path)
+    # Seul le titre de test est affiché : les autres colonnes ne sont pas lues
+    df = load_artifact("categorized_tracks", columns=['track_id', 'track_name', 'artist_name'])
 
     if df.empty:
         print("Données catégorisées vides.")
@@ -301,6 +368,89 @@ def run_top_artists_analysis(force_new_auth=False):
         return False
 
 
+def build_pipeline_stages():
+    """
+    Graphe des étapes du pipeline : chaque étape déclare les artefacts qu'elle lit et produit
+
+    L'extraction dépend de l'état des playlists Spotify (snapshot_id) et ne relit que les playlists modifiées.
+    Elle reprend la liste des playlists lue pour l'empreinte de la source (un seul appel à /me/playlists).
+    """
+    return [
+        pipeline.Stage("extraction",
+                       lambda: run_extraction_process(incremental=True, playlists_df=take_source_playlists()),
+                       outputs=["tracks", "audio_features", "tracks_with_features"],
+                       source=get_source_fingerprint),
+        pipeline.Stage("traitement", run_processing_step,
+                       inputs=["tracks", "tracks_with_features"],
+                       outputs=["cleaned_tracks", "feature_matrix_index", "processed_rows", "playlist_codes",
+                                "membership_index_tracks", "track_artists", "artist_codes"]),
+        pipeline.Stage("analyse", run_analysis_step,
+                       inputs=["cleaned_tracks"],
+                       outputs=["categorized_tracks"]),
+        # Visualisations et recommandations ne dépendent que de l'analyse : exécutées en parallèle
+        pipeline.Stage("visualisations", run_visualization_step,
+                       inputs=["categorized_tracks"], main_thread=True),
+        pipeline.Stage("recommandations", run_recommendation_demo,
+                       inputs=["categorized_tracks"])
+    ]
+
+
+def run_full_pipeline(force=False):
+    """
+    Exécute les étapes du pipeline dont les entrées ont changé depuis leur dernière exécution
+
+    Le pipeline construit une nouvelle génération des données, publiée d'un coup si toutes les étapes
+    réussissent : en cas d'échec, les pages continuent à servir la génération précédente.
+    """
+    print_header("PIPELINE DE DONNÉES")
+    started = time.time()
+    with build_generation() as generation:
+        results = pipeline.run_pipeline(build_pipeline_stages(), force=force)
+        pipeline.print_summary(results)
+        success = all(result['status'] in (pipeline.STATUS_DONE, pipeline.STATUS_SKIPPED)
+                      for result in results.values())
+        # Rien à publier si aucune étape n'a été exécutée
+        if not success or all(result['status'] == pipeline.STATUS_SKIPPED for result in results.values()):
+            generation.discard()
+    print(f"Durée totale: {time.time() - started:.3f} s")
+    return success
+
+
+def run_background_pipeline(workers):
+    """Place le pipeline dans la file de tâches et démarre des workers si nécessaire"""
+    print_header("PIPELINE EN ARRIÈRE-PLAN")
+
+    job_ids = job_queue.enqueue_pipeline()
+    print(f"Tâches en file d'attente: {', '.join(str(job_id) for job_id in job_ids)}")
+
+    if not workers and job_queue.active_worker_count() == 0:
+        processes, stop_event = job_queue.start_workers()
+        workers.extend([processes, stop_event])
+        print(f"{len(processes)} worker(s) démarré(s) pour cette session.")
+
+    print("Utilisez l'option 12 pour suivre l'avancement.")
+    return job_ids
+
+
+def show_jobs_status(limit=10):
+    """Affiche l'état des dernières tâches en arrière-plan"""
+    print_header("ÉTAT DES TÂCHES EN ARRIÈRE-PLAN")
+
+    jobs = job_queue.list_jobs(limit=limit)
+    if not jobs:
+        print("Aucune tâche enregistrée.")
+        return
+
+    print(f"Workers actifs: {job_queue.active_worker_count()}\n")
+    for job in jobs:
+        line = f"#{job['id']} {job['job_type']:<12} {job['status']:<8} {job['progress'] * 100:5.1f}%"
+        if job['message']:
+            line += f" - {job['message']}"
+        if job['status'] == job_queue.STATUS_FAILED and job['error']:
+            line += f" (erreur: {job['error'].splitlines()[0]})"
+        print(line)
+
+
 def main():
     """Fonction principale du programme"""
     print_header("ANALYSEUR ET GÉNÉRATEUR DE PLAYLISTS MUSICALES")
@@ -311,6 +461,9 @@ def main():
         print("\nConfiguration incomplète. Veuillez corriger les problèmes avant de continuer.")
         sys.exit(1)
 
+    # Workers démarrés depuis ce menu (processus, événement d'arrêt)
+    workers = []
+
     # Menu principal
     while True:
         print("\n=== ANALYSEUR ET GÉNÉRATEUR DE PLAYLISTS MUSICALES ===")
@@ -327,22 +480,27 @@ def main():
 
         print("\n>> ACTIONS GLOBALES:")
         print("7. Exécuter tout le pipeline de données")
+        print("11. Exécuter le pipeline en arrière-plan")
+        print("12. Voir l'état des tâches en arrière-plan")
+        print("13. Synchroniser l'historique d'écoute")
+        print("15. Retraiter toutes les données (nouveaux paramètres de normalisation)")
 
         print("\n>> COMPTE ET SESSION:")
         print("8. Se connecter/Forcer une nouvelle connexion Spotify")
         print("9. Se déconnecter du compte Spotify")
         print("10. Effacer toutes les données et recommencer")
+        print("14. Revenir à la version précédente des données")
 
         print("\n0. Quitter")
 
-        choice = input("\nVotre choix (0-10): ")
+        choice = input("\nVotre choix (0-15): ")
 
         if choice == '1':
-            run_extraction_process()
+            run_in_new_generation(run_extraction_process)
         elif choice == '2':
-            run_processing_step()
+            run_in_new_generation(run_processing_step)
         elif choice == '3':
-            run_analysis_step()
+            run_in_new_generation(run_analysis_step)
         elif choice == '4':
             run_visualization_step()
         elif choice == '5':
@@ -350,20 +508,12 @@ def main():
         elif choice == '6':
             run_top_artists_analysis()
         elif choice == '7':
-            # Exécuter toutes les étapes
-            if run_extraction_process():
-                time.sleep(1)
-                if run_processing_step():
-                    time.sleep(1)
-                    if run_analysis_step():
-                        time.sleep(1)
-                        run_visualization_step()
-                        time.sleep(1)
-                        run_recommendation_demo()
+            # Exécuter les étapes dont les données d'entrée ont changé
+            run_full_pipeline()
         elif choice == '8':
             # Forcer une nouvelle connexion
             print("Forçage d'une nouvelle connexion Spotify...")
-            run_extraction_process(force_new_auth=True)
+            run_in_new_generation(run_extraction_process, force_new_auth=True)
         elif choice == '9':
             # Se déconnecter de Spotify
             logout_spotify()
@@ -371,7 +521,22 @@ def main():
             # Effacer toutes les données
             if input("Êtes-vous sûr de vouloir supprimer toutes les données? (o/n): ").lower() == 'o':
                 clear_data()
+        elif choice == '11':
+            run_background_pipeline(workers)
+        elif choice == '12':
+            show_jobs_status()
+        elif choice == '13':
+            print_header("SYNCHRONISATION DE L'HISTORIQUE D'ÉCOUTE")
+            sync_recently_played()
+        elif choice == '14':
+            print_header("RETOUR À LA VERSION PRÉCÉDENTE DES DONNÉES")
+            rollback_generation()
+        elif choice == '15':
+            run_in_new_generation(run_processing_step, refit=True)
         elif choice == '0':
+            if workers:
+                print("Arrêt des workers (fin des tâches en cours)...")
+                job_queue.stop_workers(*workers)
             print("\nMerci d'avoir utilisé l'analyseur de playlists musicales!")
             sys.exit(0)
         else:
@@ -0,0 +1,319 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from generations import generation_path
+from storage import (artifact_columns, artifact_exists, artifact_row_count, iter_artifact_batches, load_artifact,
+                     save_artifact, save_artifact_batches, write_atomic)
+from data_lock import artifact_lock
+
+# Index d'appartenance des titres aux playlists : un bitset (uint64) par playlist sur l'ensemble des titres
+# nettoyés, dans la génération courante des données (voir generations.py)
+# - ligne i : playlist de code i (table des codes : voir data_processing.assign_playlist_codes)
+# - bit j : titre de la ligne j des titres nettoyés
+MEMBERSHIP_INDEX_FILE = "membership_index.npy"
+MEMBERSHIP_INDEX_META_FILE = "membership_index.json"
+MEMBERSHIP_TRACKS_ARTIFACT = "membership_index_tracks"
+PLAYLIST_CODES_ARTIFACT = "playlist_codes"
+
+# Taille maximale (en octets) des blocs intermédiaires des calculs sur toutes les playlists
+_BLOCK_BYTES = 64 * 1024 * 1024
+
+# Index ouvert par le processus, rechargé si le fichier a été reconstruit ou si la génération a changé
+_loaded = {'key': None, 'index': None}
+
+# Nombre de bits à 1 de chaque octet (numpy < 2 n'a pas np.bitwise_count)
+_BYTE_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _words(track_count):
+    return (track_count + 63) // 64
+
+
+def _block_rows(row_bytes):
+    """Nombre de playlists par bloc pour qu'un calcul intermédiaire reste sous _BLOCK_BYTES"""
+    return max(1, _BLOCK_BYTES // max(1, row_bytes))
+
+
+def popcount(bits, axis=-1):
+    """
+    Nombre de bits à 1 de bitsets uint64
+
+    Parameters:
+        bits (ndarray): Bitsets (uint64), un par ligne
+        axis (int): Axe des mots d'un bitset
+
+    Returns:
+        ndarray ou int: Nombre de titres de chaque bitset
+    """
+    bits = np.asarray(bits, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).sum(axis=axis, dtype=np.int64)
+    counts = _BYTE_POPCOUNT[np.ascontiguousarray(bits).view(np.uint8)]
+    counts = counts.reshape(bits.shape + (8,)).sum(axis=-1, dtype=np.int64)
+    return counts.sum(axis=axis)
+
+
+def bitset_and(*bitsets):
+    """Titres présents dans toutes les playlists"""
+    return np.bitwise_and.reduce(np.stack(bitsets), axis=0)
+
+
+def bitset_or(*bitsets):
+    """Titres présents dans au moins une des playlists"""
+    return np.bitwise_or.reduce(np.stack(bitsets), axis=0)
+
+
+def bitset_andnot(bits, excluded):
+    """Titres de bits absents de excluded"""
+    return np.bitwise_and(bits, np.bitwise_not(excluded))
+
+
+def _set_bits(bits, playlist_codes, rows):
+    """Met à 1 le bit de chaque couple (playlist, ligne du titre)"""
+    rows = np.asarray(rows, dtype=np.int64)
+    words = rows >> 6
+    masks = np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64))
+    np.bitwise_or.at(bits, (np.asarray(playlist_codes, dtype=np.int64), words), masks)
+
+
+def _membership_pairs(playlist_codes):
+    """
+    Couples (playlist, ligne du titre) d'une colonne playlist_codes
+
+    Returns:
+        tuple: (codes des playlists, lignes des titres), ndarray d'entiers
+    """
+    lists = pa.array(playlist_codes, type=pa.list_(pa.int32()), from_pandas=True)
+    codes = pc.list_flatten(lists).to_numpy(zero_copy_only=False)
+    rows = pc.list_parent_indices(lists).to_numpy(zero_copy_only=False)
+    return codes, rows
+
+
+def _playlist_count():
+    return artifact_row_count(PLAYLIST_CODES_ARTIFACT) if artifact_exists(PLAYLIST_CODES_ARTIFACT) else 0
+
+
+def _write_index(track_count, playlist_count, fill):
+    """
+    Écrit l'index et ses métadonnées (voir build_membership_index)
+
+    Parameters:
+        fill (callable): Remplit les bitsets (memmap à zéro) et enregistre l'ordre des titres
+    """
+    index_path = generation_path(MEMBERSHIP_INDEX_FILE)
+    meta_path = generation_path(MEMBERSHIP_INDEX_META_FILE)
+    temp_path = index_path + ".tmp"
+
+    def write_meta(temp_meta_path):
+        with open(temp_meta_path, "w") as f:
+            json.dump({'tracks': track_count, 'playlists': playlist_count}, f)
+
+    # Même protocole que la matrice des caractéristiques : fichier temporaire puis substitution sous verrou
+    with artifact_lock("membership_index", exclusive=True):
+        bits = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.uint64,
+                                         shape=(playlist_count, _words(track_count)))
+        bits[:] = 0
+        fill(bits)
+        bits.flush()
+        del bits
+        write_atomic(meta_path, write_meta)
+        os.replace(temp_path, index_path)
+
+    print(f"Index des playlists sauvegardé dans: {index_path} ({playlist_count} playlists x {track_count} titres)")
+    return index_path
+
+
+def build_membership_index(df):
+    """
+    Écrit l'index d'appartenance aux playlists à partir des données nettoyées
+
+    Parameters:
+        df (DataFrame): Données nettoyées (une ligne par titre, colonne playlist_codes)
+
+    Returns:
+        str: Chemin de l'index, ou None si les données n'ont pas de playlists
+    """
+    playlist_count = _playlist_count()
+    if df is None or df.empty or 'playlist_codes' not in df.columns or playlist_count == 0:
+        return None
+
+    def fill(bits):
+        _set_bits(bits, *_membership_pairs(df['playlist_codes']))
+        save_artifact(pd.DataFrame({'track_id': df['track_id'].to_numpy()}), MEMBERSHIP_TRACKS_ARTIFACT,
+                      export_csv=False, producer="processing")
+
+    return _write_index(len(df), playlist_count, fill)
+
+
+def build_membership_index_from_artifact(name, batch_size):
+    """
+    Écrit l'index d'appartenance aux playlists en lisant un artefact par lots
+
+    Parameters:
+        name (str): Artefact des données nettoyées (une ligne par titre, colonne playlist_codes)
+        batch_size (int): Nombre de titres par lot
+
+    Returns:
+        str: Chemin de l'index, ou None si les données n'ont pas de playlists
+    """
+    playlist_count = _playlist_count()
+    track_count = artifact_row_count(name)
+    if playlist_count == 0 or track_count == 0 or 'playlist_codes' not in artifact_columns(name):
+        return None
+
+    def fill(bits):
+        def index_batches():
+            start = 0
+            for batch in iter_artifact_batches(name, batch_size, columns=['track_id', 'playlist_codes']):
+                codes, rows = _membership_pairs(batch['playlist_codes'])
+                _set_bits(bits, codes, rows + start)
+                start += len(batch)
+                yield batch[['track_id']]
+
+        save_artifact_batches(index_batches(), MEMBERSHIP_TRACKS_ARTIFACT, export_csv=False, producer="processing")
+
+    return _write_index(track_count, playlist_count, fill)
+
+
+class MembershipIndex:
+    """
+    Index d'appartenance ouvert en mémoire partagée (lecture seule, sans copie)
+
+    Les opérations ensemblistes portent sur des bitsets (ndarray uint64) : voir bitset_and, bitset_or,
+    bitset_andnot et popcount.
+    """
+
+    def __init__(self, bits, track_ids, playlists):
+        self.bits = bits
+        self.track_ids = track_ids
+        self.playlists = playlists
+        self._row_index = None
+        self._lookup = None
+        self._track_counts = None
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def code(self, playlist):
+        """Code d'une playlist à partir de son identifiant ou de son nom (KeyError si elle est inconnue)"""
+        if self._lookup is None:
+            self._lookup = {}
+            for column in ('playlist_name', 'playlist_id'):
+                self._lookup.update((value, code) for value, code in
+                                    zip(self.playlists[column], self.playlists['playlist_code']) if pd.notna(value))
+        return int(self._lookup[playlist])
+
+    def playlist(self, playlist):
+        """Bitset des titres d'une playlist (identifiant ou nom)"""
+        return self.bits[self.code(playlist)]
+
+    def sizes(self):
+        """Nombre de titres de chaque playlist, dans l'ordre des codes"""
+        return popcount(self.bits)
+
+    def overlaps(self, codes=None):
+        """
+        Nombre de titres communs à chaque paire de playlists
+
+        Parameters:
+            codes (list): Codes des playlists comparées (par défaut toutes)
+
+        Returns:
+            ndarray: Matrice symétrique (len(codes) x len(codes)) ; la diagonale contient la taille des playlists
+        """
+        bits = self.bits if codes is None else self.bits[np.asarray(codes, dtype=np.int64)]
+        counts = np.empty((len(bits), len(bits)), dtype=np.int64)
+        # Bloc de playlists comparé à toutes les autres en une opération, de taille bornée
+        size = _block_rows(len(bits) * bits.shape[1] * 8)
+        for start in range(0, len(bits), size):
+            block = bits[start:start + size]
+            counts[start:start + len(block)] = popcount(block[:, None, :] & bits[None, :, :])
+        return counts
+
+    def track_counts(self):
+        """Nombre de playlists contenant chaque titre, dans l'ordre des titres de l'index"""
+        if self._track_counts is not None:
+            return self._track_counts
+        counts = np.zeros(self.bits.shape[1] * 64, dtype=np.int32)
+        size = _block_rows(self.bits.shape[1] * 64)
+        for start in range(0, self.bits.shape[0], size):
+            counts += np.unpackbits(np.ascontiguousarray(self.bits[start:start + size]).view(np.uint8),
+                                    axis=1, bitorder='little').sum(axis=0, dtype=np.int32)
+        self._track_counts = counts[:len(self)]
+        return self._track_counts
+
+    def at_least(self, n):
+        """Bitset des titres présents dans au moins n playlists"""
+        return self.from_mask(self.track_counts() >= n)
+
+    def from_mask(self, mask):
+        """Bitset à partir d'un masque booléen sur les titres de l'index"""
+        packed = np.zeros(self.bits.shape[1] * 8, dtype=np.uint8)
+        values = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+        packed[:len(values)] = values
+        return packed.view(np.uint64)
+
+    def mask(self, bits):
+        """Masque booléen des titres de l'index à partir d'un bitset"""
+        return np.unpackbits(np.ascontiguousarray(bits).view(np.uint8), bitorder='little')[:len(self)].astype(bool)
+
+    def tracks(self, bits):
+        """Identifiants des titres d'un bitset, dans l'ordre des titres nettoyés"""
+        return self.track_ids[self.mask(bits)]
+
+    def rows_for(self, track_ids):
+        """
+        Positions des titres dans l'index
+
+        Returns:
+            ndarray: Position de chaque titre, -1 pour les titres absents de l'index
+        """
+        if self._row_index is None:
+            self._row_index = pd.Index(self.track_ids)
+        return self._row_index.get_indexer(pd.Index(track_ids))
+
+    def aligned_with(self, df):
+        """Indique si les titres de l'index correspondent exactement à ceux du DataFrame"""
+        return (len(df) == len(self) and 'track_id' in df.columns
+                and np.array_equal(df['track_id'].to_numpy(dtype=object), self.track_ids))
+
+
+def load_membership_index():
+    """
+    Ouvre l'index d'appartenance aux playlists en lecture seule avec np.load(mmap_mode='r')
+
+    Returns:
+        MembershipIndex: Index, ou None s'il n'a pas été construit
+    """
+    index_path = generation_path(MEMBERSHIP_INDEX_FILE)
+    meta_path = generation_path(MEMBERSHIP_INDEX_META_FILE)
+    with artifact_lock("membership_index"):
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)
+                and artifact_exists(MEMBERSHIP_TRACKS_ARTIFACT) and artifact_exists(PLAYLIST_CODES_ARTIFACT)):
+            return None
+
+        key = (index_path, os.path.getmtime(index_path))
+        if _loaded['index'] is not None and _loaded['key'] == key:
+            return _loaded['index']
+
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            bits = np.load(index_path, mmap_mode='r')
+            track_ids = load_artifact(MEMBERSHIP_TRACKS_ARTIFACT)['track_id'].to_numpy(dtype=object)
+            playlists = load_artifact(PLAYLIST_CODES_ARTIFACT, optimize=False)
+        except Exception as e:
+            print(f"Erreur lors de l'ouverture de l'index des playlists: {e}")
+            return None
+
+    if (bits.shape != (meta['playlists'], _words(len(track_ids))) or meta['tracks'] != len(track_ids)
+            or len(playlists) != meta['playlists']):
+        print("Index des playlists incohérent avec ses titres, il sera ignoré.")
+        return None
+
+    _loaded['index'] = MembershipIndex(bits, track_ids, playlists.sort_values('playlist_code').reset_index(drop=True))
+    _loaded['key'] = key
+    return _loaded['index']
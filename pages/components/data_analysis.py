@@ -8,19 +8,34 @@ import plotly.express as px
 import plotly.graph_objects as go
 import sys
 from config import DATA_DIR
+from storage import artifact_exists, artifact_path, delete_artifact, load_artifact, save_artifact
+from generations import build_generation, pin_generation
+from data_processing import artist_track_counts, explode_playlists
+from membership_index import bitset_and, bitset_andnot, load_membership_index, popcount
+import library_db
+from library import library_exists, load_table, rebuild_library_from_tracks, get_playlist_sizes, get_playlist_tracks
 
 
 # Ne PAS importer directement analyze_data depuis data_analysis ici
 # Nous utiliserons une importation différée pour éviter la circularité
 
+# Caractéristiques audio affichées sur la page
+AUDIO_FEATURES = ['danceability', 'energy', 'valence', 'acousticness']
 
+# Colonnes lues pour l'affichage de l'analyse (les autres colonnes des titres catégorisés ne sont pas chargées)
+ANALYSIS_PAGE_COLUMNS = ['track_id', 'track_name', 'artist_name', 'playlist_name', 'playlist_codes', 'popularity',
+                         'release_year', 'energy_dance_category', 'acoustic_mood_category'] + AUDIO_FEATURES
+
+# Colonnes gardées par l'analyse simplifiée (voir data_processing.clean_data avec deep_clean)
+SIMPLIFIED_ANALYSIS_COLUMNS = ['track_id', 'track_name', 'artist_name', 'album_name'] + AUDIO_FEATURES
+
+
+@pin_generation()
 def show():
     st.title("Analyse de votre Bibliothèque Musicale")
 
     # Vérifier si des données nettoyées sont disponibles
-    cleaned_path = os.path.join(DATA_DIR, "cleaned_tracks.csv")
-
-    if not os.path.exists(cleaned_path):
+    if not artifact_exists("cleaned_tracks"):
         st.warning("Aucune donnée n'est disponible pour l'analyse. Veuillez d'abord extraire vos données Spotify.")
 
         if st.button("Aller à la page d'extraction", type="primary"):
@@ -31,7 +46,7 @@ def show():
     try:
         # Charger les données nettoyées avec une gestion d'erreur améliorée
         try:
-            df = pd.read_csv(cleaned_path, low_memory=False)
+            df = load_artifact("cleaned_tracks", columns=SIMPLIFIED_ANALYSIS_COLUMNS, optimize=True)
             if df.empty:
                 st.error("Le fichier de données existe mais ne contient aucune donnée valide.")
                 if st.button("Retourner à l'extraction", type="primary"):
@@ -50,13 +65,19 @@ def show():
 
                 with st.spinner("Réparation en cours..."):
                     try:
-                        # Renommer l'ancien fichier s'il existe
-                        if os.path.exists(cleaned_path):
-                            os.rename(cleaned_path, cleaned_path + ".bak")
-
-                        # Forcer une nouvelle analyse - IMPORTATION DIFFÉRÉE
-                        from data_analysis import analyze_data
-                        stats, audio_analysis, categorized_df = analyze_data(max_recursion_depth=2000)
+                        # Réparer dans une nouvelle génération, publiée seulement si l'analyse réussit
+                        with build_generation() as generation:
+                            # Renommer l'ancien fichier s'il existe
+                            for cleaned_path in (artifact_path("cleaned_tracks"),
+                                                 artifact_path("cleaned_tracks", "csv")):
+                                if os.path.exists(cleaned_path):
+                                    os.rename(cleaned_path, cleaned_path + ".bak")
+
+                            # Forcer une nouvelle analyse - IMPORTATION DIFFÉRÉE
+                            from data_analysis import analyze_data
+                            stats, audio_analysis, categorized_df = analyze_data(max_recursion_depth=2000)
+                            if categorized_df is None:
+                                generation.discard()
 
                         # Restaurer la limite de récursion
                         sys.setrecursionlimit(current_limit)
@@ -72,9 +93,7 @@ def show():
             return
 
         # Vérifier si une analyse a déjà été effectuée
-        categorized_path = os.path.join(DATA_DIR, "categorized_tracks.csv")
-
-        if not os.path.exists(categorized_path):
+        if not artifact_exists("categorized_tracks"):
             st.info("Analyse des données en cours...")
 
             with st.spinner("Analyse en cours..."):
@@ -84,8 +103,12 @@ def show():
                     sys.setrecursionlimit(2000)  # Valeur sécuritaire
 
                     # Exécuter l'analyse avec une limite de récursion - IMPORTATION DIFFÉRÉE
+                    # La nouvelle génération n'est publiée que si l'analyse réussit
                     from data_analysis import analyze_data
-                    stats, audio_analysis, categorized_df = analyze_data(max_recursion_depth=2000)
+                    with build_generation() as generation:
+                        stats, audio_analysis, categorized_df = analyze_data(max_recursion_depth=2000)
+                        if not stats or categorized_df is None:
+                            generation.discard()
 
                     # Restaurer la limite de récursion
                     sys.setrecursionlimit(current_limit)
@@ -107,7 +130,8 @@ def show():
 
                                     # Sauvegarder directement
                                     if df_simplified is not None:
-                                        df_simplified.to_csv(categorized_path, index=False)
+                                        with build_generation():
+                                            save_artifact(df_simplified, "categorized_tracks", producer="analysis")
                                         st.success("Analyse simplifiée terminée!")
                                         st.experimental_rerun()
                                 except Exception as simple_error:
@@ -126,13 +150,14 @@ def show():
         else:
             # Charger les données catégorisées
             try:
-                df = pd.read_csv(categorized_path, low_memory=False)
+                df = load_artifact("categorized_tracks", columns=ANALYSIS_PAGE_COLUMNS, optimize=True)
             except Exception as e:
                 st.error(f"Erreur lors du chargement des données catégorisées: {str(e)}")
                 # Proposer de réanalyser
                 if st.button("Réanalyser les données", type="primary"):
                     # Supprimer le fichier problématique
-                    os.remove(categorized_path)
+                    with build_generation():
+                        delete_artifact("categorized_tracks")
                     st.experimental_rerun()
                 return
 
@@ -197,8 +222,10 @@ def show_overview(df):
             st.metric("Artistes", f"{df['artist_name'].nunique()}")
 
         with col3:
-            if 'playlist_name' in df.columns:
-                st.metric("Playlists", f"{df['playlist_name'].nunique()}")
+            if library_exists():
+                st.metric("Playlists", f"{len(load_table('playlists', columns=['playlist_id']))}")
+            elif 'playlist_name' in df.columns:
+                st.metric("Playlists", f"{explode_playlists(df, [])['playlist_name'].nunique()}")
             else:
                 st.metric("Playlists", "N/A")
 
@@ -268,7 +295,9 @@ def show_artists_analysis(df):
         # Top artistes
         st.subheader("Vos artistes les plus écoutés")
 
-        top_artists = df['artist_name'].value_counts().head(15)
+        # Un titre compte pour chacun de ses artistes (pont titre/artiste, voir data_processing)
+        artist_counts = artist_track_counts(df)
+        top_artists = artist_counts.head(15)
         fig = px.bar(
             x=top_artists.values,
             y=top_artists.index,
@@ -287,8 +316,6 @@ def show_artists_analysis(df):
 
             st.subheader("Nuage d'artistes")
 
-            artist_counts = df['artist_name'].value_counts().to_dict()
-
             # Génération du nuage de mots
             wordcloud = WordCloud(
                 width=800,
@@ -296,7 +323,7 @@ def show_artists_analysis(df):
                 background_color='black',
                 colormap='viridis',
                 max_words=100
-            ).generate_from_frequencies(artist_counts)
+            ).generate_from_frequencies(artist_counts.to_dict())
 
             # Affichage
             fig, ax = plt.subplots(figsize=(12, 6))
@@ -395,23 +422,27 @@ def show_playlists_analysis(df):
     try:
         st.header("Analyse des playlists")
 
-        if 'playlist_name' not in df.columns:
+        # Les données analysées ne gardent qu'une playlist par titre : l'appartenance
+        # complète des titres aux playlists vient de la bibliothèque normalisée
+        if not library_exists():
+            rebuild_library_from_tracks()
+
+        if not library_exists():
             st.warning("Aucune information de playlist n'est disponible dans les données.")
             return
 
-        # Liste des playlists
-        playlists = df['playlist_name'].unique()
-
-        # Taille des playlists
-        playlist_sizes = df['playlist_name'].value_counts()
+        # Taille des playlists (requêtes indexées sur la base SQLite si elle est disponible)
+        use_db = library_db.library_db_exists()
+        playlist_sizes = library_db.playlist_sizes() if use_db else get_playlist_sizes()
+        playlist_names = dict(zip(playlist_sizes['playlist_id'], playlist_sizes['playlist_name']))
 
         # Graphique de la taille des playlists
         fig = px.bar(
-            x=playlist_sizes.index,
-            y=playlist_sizes.values,
+            x=playlist_sizes['playlist_name'],
+            y=playlist_sizes['track_count'],
             title="Taille des playlists",
             labels={'x': 'Playlist', 'y': 'Nombre de titres'},
-            color=playlist_sizes.values,
+            color=playlist_sizes['track_count'],
             color_continuous_scale=px.colors.sequential.Viridis
         )
 
@@ -421,6 +452,8 @@ def show_playlists_analysis(df):
 
         st.plotly_chart(fig, use_container_width=True)
 
+        show_playlist_comparison(df, playlist_sizes['playlist_name'].head(10).tolist())
+
         # Caractéristiques par playlist
         st.subheader("Profil audio des playlists")
 
@@ -434,16 +467,21 @@ def show_playlists_analysis(df):
 
         # Créer un graphique radar pour chaque playlist
         # Limiter aux 10 plus grandes playlists pour la lisibilité
-        top_playlists = playlist_sizes.head(10).index.tolist()
+        top_playlists = playlist_sizes['playlist_id'].head(10).tolist()
 
         # Sélecteur de playlist
-        selected_playlist = st.selectbox(
+        selected_playlist_id = st.selectbox(
             "Choisissez une playlist à analyser:",
-            options=top_playlists
+            options=top_playlists,
+            format_func=lambda playlist_id: playlist_names.get(playlist_id, playlist_id)
         )
+        selected_playlist = playlist_names.get(selected_playlist_id, selected_playlist_id)
 
         # Calculer les moyennes des caractéristiques pour la playlist sélectionnée
-        playlist_data = df[df['playlist_name'] == selected_playlist]
+        if use_db:
+            playlist_data = library_db.playlist_tracks(selected_playlist_id)
+        else:
+            playlist_data = get_playlist_tracks(selected_playlist_id, df)
         feature_means = playlist_data[audio_features].mean()
 
         # Créer un graphique radar avec plotly
@@ -470,7 +508,8 @@ def show_playlists_analysis(df):
         st.plotly_chart(fig, use_container_width=True)
 
         # Top artistes dans la playlist
-        top_artists_in_playlist = playlist_data['artist_name'].value_counts().head(10)
+        artist_counts_in_playlist = artist_track_counts(playlist_data)
+        top_artists_in_playlist = artist_counts_in_playlist[artist_counts_in_playlist > 0].head(10)
 
         fig = px.bar(
             x=top_artists_in_playlist.values,
@@ -485,4 +524,60 @@ def show_playlists_analysis(df):
         fig.update_layout(yaxis={'categoryorder': 'total ascending'})
         st.plotly_chart(fig, use_container_width=True)
     except Exception as e:
-        st.error(f"Erreur lors de l'affichage de l'analyse des playlists: {str(e)}")
\ No newline at end of file
+        st.error(f"Erreur lors de l'affichage de l'analyse des playlists: {str(e)}")
+
+
+def show_playlist_comparison(df, top_playlists):
+    """
+    Compare les playlists à partir de l'index d'appartenance (bitsets, voir membership_index.py)
+
+    Parameters:
+        df (DataFrame): Titres analysés (noms des titres affichés)
+        top_playlists (list): Noms des plus grandes playlists, comparées deux à deux
+    """
+    index = load_membership_index()
+    if index is None:
+        st.info("Relancez le traitement des données pour comparer les playlists entre elles.")
+        return
+
+    st.subheader("Comparaison des playlists")
+    names = [name for name in top_playlists if name in set(index.playlists['playlist_name'])]
+
+    # Titres communs à chaque paire des plus grandes playlists
+    if len(names) > 1:
+        overlaps = index.overlaps([index.code(name) for name in names])
+        fig = px.imshow(overlaps, x=names, y=names, text_auto=True, color_continuous_scale='Viridis',
+                        title="Titres communs entre les playlists")
+        st.plotly_chart(fig, use_container_width=True)
+
+    all_names = index.playlists['playlist_name'].dropna().tolist()
+    if len(all_names) > 1:
+        col1, col2 = st.columns(2)
+        with col1:
+            first = st.selectbox("Playlist A", all_names, index=0, key="compare_playlist_a")
+        with col2:
+            second = st.selectbox("Playlist B", all_names, index=1, key="compare_playlist_b")
+
+        first_bits, second_bits = index.playlist(first), index.playlist(second)
+        only_first = bitset_andnot(first_bits, second_bits)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Dans A et B", f"{popcount(bitset_and(first_bits, second_bits))}")
+        with col2:
+            st.metric("Seulement dans A", f"{popcount(only_first)}")
+        with col3:
+            st.metric("Seulement dans B", f"{popcount(bitset_andnot(second_bits, first_bits))}")
+
+        track_ids = index.tracks(only_first)
+        if len(track_ids) > 0 and 'track_name' in df.columns:
+            st.write(f"Titres de {first} absents de {second}:")
+            st.dataframe(df[df['track_id'].isin(track_ids)][['track_name', 'artist_name']].head(50))
+
+    # Titres présents dans plusieurs playlists
+    min_playlists = st.slider("Titres présents dans au moins N playlists", min_value=2, max_value=10, value=3)
+    shared = index.at_least(min_playlists)
+    st.metric(f"Titres dans au moins {min_playlists} playlists", f"{popcount(shared)}")
+    track_ids = index.tracks(shared)
+    if len(track_ids) > 0 and 'track_name' in df.columns:
+        st.dataframe(df[df['track_id'].isin(track_ids)][['track_name', 'artist_name']].head(50))
@@ -4,22 +4,40 @@ import os
 import time
 import traceback
 from config import DATA_DIR
+from storage import artifact_exists, artifact_row_count, load_artifact, preview_artifact
 from spotify_api import extract_spotify_data
 from data_processing import process_data
+import job_queue
+from snapshots import list_snapshots, diff_snapshots, summarize_diff
+from generations import build_generation, pin_generation
 
 
-def show_data_preview(df, title, n=5):
-    """Affiche un aperçu du DataFrame avec un titre"""
+def show_data_preview(df, title, n=5, total=None):
+    """Affiche un aperçu du DataFrame avec un titre (total: nombre de lignes de l'artefact complet)"""
     if df is None or df.empty:
         st.warning(f"Aucune donnée disponible pour: {title}")
         return
 
     st.subheader(title)
     st.dataframe(df.head(n))
-    st.caption(f"Affichage de {n} lignes sur {len(df)}")
+    st.caption(f"Affichage de {min(n, len(df))} lignes sur {total if total is not None else len(df)}")
 
 
 def extract_data(with_retries=True):
+    """
+    Extrait et traite les données dans une nouvelle génération
+
+    Les autres pages continuent à lire les données actuelles pendant l'extraction ; la nouvelle génération
+    n'est publiée que si l'extraction réussit.
+    """
+    with build_generation() as generation:
+        success = _extract_and_process(with_retries)
+        if not success:
+            generation.discard()
+    return success
+
+
+def _extract_and_process(with_retries=True):
     """Fonction pour gérer l'extraction des données avec gestion d'erreurs améliorée"""
     progress_placeholder = st.empty()
     status_placeholder = st.empty()
@@ -70,7 +88,7 @@ def extract_data(with_retries=True):
         try:
             cleaned_data = process_data()
 
-            if cleaned_data is None or cleaned_data.empty:
+            if cleaned_data is None or artifact_row_count("cleaned_tracks") == 0:
                 status_placeholder.warning("Attention: Le traitement des données a retourné un résultat vide.")
                 # Continuer quand même, ce n'est pas une erreur fatale
 
@@ -117,17 +135,76 @@ def extract_data(with_retries=True):
         return False
 
 
+def show_background_jobs(limit=5):
+    """Affiche l'état des dernières tâches exécutées en arrière-plan"""
+    jobs = job_queue.list_jobs(limit=limit)
+    if not jobs:
+        return
+
+    st.subheader("Tâches en arrière-plan")
+
+    if job_queue.active_worker_count() == 0:
+        st.info("Aucun worker actif. Lancez `python job_queue.py` pour traiter les tâches en attente.")
+
+    status_labels = {
+        job_queue.STATUS_PENDING: "En attente",
+        job_queue.STATUS_RUNNING: "En cours",
+        job_queue.STATUS_DONE: "Terminée",
+        job_queue.STATUS_FAILED: "Échec"
+    }
+
+    for job in jobs:
+        label = f"#{job['id']} {job['job_type']} - {status_labels.get(job['status'], job['status'])}"
+        if job['message']:
+            label += f" ({job['message']})"
+        st.progress(min(max(job['progress'], 0.0), 1.0), text=label)
+
+        if job['status'] == job_queue.STATUS_FAILED and job['error']:
+            with st.expander(f"Erreur de la tâche #{job['id']}"):
+                st.code(job['error'])
+
+    if st.button("Actualiser l'état des tâches", key="refresh_jobs"):
+        st.experimental_rerun()
+
+
+def show_snapshot_history():
+    """Affiche les extractions enregistrées et les changements entre deux d'entre elles"""
+    snapshots = list_snapshots()
+    if len(snapshots) < 2:
+        return
+
+    st.subheader("Historique des extractions")
+    labels = {snapshot['id']: f"{snapshot['created_at'][:19].replace('T', ' ')} "
+                              f"({snapshot['playlists']} playlists, {snapshot['tracks']} titres)"
+              for snapshot in snapshots}
+    ids = [snapshot['id'] for snapshot in snapshots]
+
+    col1, col2 = st.columns(2)
+    with col1:
+        old_id = st.selectbox("Extraction de référence", options=ids, index=len(ids) - 2,
+                              format_func=labels.get, key="snapshot_old")
+    with col2:
+        new_id = st.selectbox("Extraction comparée", options=ids, index=len(ids) - 1,
+                              format_func=labels.get, key="snapshot_new")
+
+    diff = diff_snapshots(old_id, new_id)
+    if diff.empty:
+        st.info("Aucun changement entre ces deux extractions.")
+        return
+
+    st.dataframe(summarize_diff(diff))
+    with st.expander("Détail des titres ajoutés et retirés"):
+        st.dataframe(diff)
+
+
+@pin_generation()
 def show():
     st.title("Extraction des Données Spotify")
 
     # Vérifier si des données existent déjà
-    tracks_path = os.path.join(DATA_DIR, "tracks.csv")
-    features_path = os.path.join(DATA_DIR, "audio_features.csv")
-    cleaned_path = os.path.join(DATA_DIR, "cleaned_tracks.csv")
-
-    has_tracks = os.path.exists(tracks_path)
-    has_features = os.path.exists(features_path)
-    has_cleaned = os.path.exists(cleaned_path)
+    has_tracks = artifact_exists("tracks")
+    has_features = artifact_exists("audio_features")
+    has_cleaned = artifact_exists("cleaned_tracks")
 
     # Afficher l'état actuel des données dans une carte stylisée
     st.markdown("""
@@ -139,23 +216,20 @@ def show():
 
     with col1:
         if has_tracks:
-            tracks_df = pd.read_csv(tracks_path)
-            st.metric("Titres", f"{len(tracks_df)}", help="Nombre total de titres extraits")
+            st.metric("Titres", f"{artifact_row_count('tracks')}", help="Nombre total de titres extraits")
         else:
             st.metric("Titres", "0", help="Aucun titre extrait")
 
     with col2:
         if has_features:
-            features_df = pd.read_csv(features_path)
-            st.metric("Caractéristiques Audio", f"{len(features_df)}",
+            st.metric("Caractéristiques Audio", f"{artifact_row_count('audio_features')}",
                       help="Nombre de titres avec caractéristiques audio")
         else:
             st.metric("Caractéristiques Audio", "0", help="Aucune caractéristique audio extraite")
 
     with col3:
         if has_cleaned:
-            cleaned_df = pd.read_csv(cleaned_path)
-            st.metric("Titres Traités", f"{len(cleaned_df)}", help="Nombre de titres après nettoyage")
+            st.metric("Titres Traités", f"{artifact_row_count('cleaned_tracks')}", help="Nombre de titres après nettoyage")
         else:
             st.metric("Titres Traités", "0", help="Aucun titre traité")
 
@@ -189,6 +263,14 @@ def show():
                 except Exception as e:
                     st.error(f"Erreur lors de la réinitialisation de l'authentification: {e}")
 
+    # Extraction, traitement et analyse confiés aux workers de la file de tâches
+    if st.button("Extraire en arrière-plan", type="secondary", use_container_width=True):
+        job_ids = job_queue.enqueue_pipeline(priority=job_queue.PRIORITY_HIGH)
+        st.success(f"Tâches ajoutées à la file d'attente: {', '.join(str(job_id) for job_id in job_ids)}")
+
+    show_background_jobs()
+    show_snapshot_history()
+
     # Afficher des aperçus des données si disponibles
     if has_cleaned or has_tracks:
         st.markdown("---")
@@ -199,34 +281,32 @@ def show():
 
         try:
             # On privilégie les données nettoyées, sinon on utilise les données brutes
-            if has_cleaned:
-                df = pd.read_csv(cleaned_path, low_memory=False)
-            elif has_tracks:
-                df = pd.read_csv(tracks_path, low_memory=False)
-            else:
-                df = None
+            # Les aperçus ne lisent que les premières lignes ; le total vient du manifeste
+            name = "cleaned_tracks" if has_cleaned else "tracks"
+            total_rows = artifact_row_count(name)
 
-            if df is not None:
+            if total_rows > 0:
                 with tab1:
                     cols_to_show = ['track_name', 'artist_name', 'album_name']
-                    available_cols = [col for col in cols_to_show if col in df.columns]
-                    if available_cols:
-                        show_data_preview(df[available_cols], "Aperçu des titres")
+                    preview = preview_artifact(name, columns=cols_to_show)
+                    if not preview.columns.empty:
+                        show_data_preview(preview, "Aperçu des titres", total=total_rows)
                     else:
                         st.warning("Structure de données inattendue. Colonnes manquantes.")
 
                 with tab2:
-                    audio_cols = [col for col in df.columns if col in
-                                  ['track_name', 'danceability', 'energy', 'valence', 'acousticness', 'tempo']]
-                    if 'danceability' in audio_cols:
-                        show_data_preview(df[audio_cols], "Aperçu des caractéristiques audio")
+                    preview = preview_artifact(name, columns=['track_name', 'danceability', 'energy', 'valence',
+                                                              'acousticness', 'tempo'])
+                    if 'danceability' in preview.columns:
+                        show_data_preview(preview, "Aperçu des caractéristiques audio", total=total_rows)
                     else:
                         st.warning("Caractéristiques audio non disponibles")
 
                 with tab3:
+                    df = load_artifact(name, columns=['playlist_name', 'track_name', 'artist_name'], optimize=True)
                     if 'playlist_name' in df.columns:
                         try:
-                            playlist_summary = df.groupby('playlist_name').agg(
+                            playlist_summary = df.groupby('playlist_name', observed=True).agg(
                                 titres=('track_name', 'count'),
                                 artistes_uniques=('artist_name', 'nunique')
                             ).reset_index()
@@ -1,7 +1,6 @@
 import streamlit as st
-import pandas as pd
-import os
-from config import DATA_DIR
+from storage import artifact_exists, artifact_row_count, artifact_distinct_count
+from generations import pin_generation
 from spotify_auth import SpotifyAuth
 
 
@@ -27,6 +26,7 @@ def login():
                     "Conseil: Vérifiez que l'URI de redirection dans votre tableau de bord Spotify Developer correspond exactement à 'http://127.0.0.1:8080'")
 
 
+@pin_generation()
 def show():
     if not st.session_state.authenticated:
         # Si non authentifié, afficher la page d'accueil avec connexion
@@ -178,39 +178,22 @@ def show():
         st.title(f"Bienvenue, {st.session_state.username} 👋")
 
         # Vérifier si des données existent
-        tracks_path = os.path.join(DATA_DIR, "tracks.csv")
-        categorized_path = os.path.join(DATA_DIR, "categorized_tracks.csv")
+        has_tracks = artifact_exists("tracks")
 
-        # Afficher des métriques et statut
+        # Afficher des métriques et statut (lues dans les manifestes, sans charger les données)
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            if os.path.exists(tracks_path):
-                df = pd.read_csv(tracks_path)
-                st.metric("Titres extraits", f"{len(df)}")
-            else:
-                st.metric("Titres extraits", "0")
+            st.metric("Titres extraits", f"{artifact_row_count('tracks')}")
 
         with col2:
-            if os.path.exists(categorized_path):
-                df = pd.read_csv(categorized_path)
-                st.metric("Titres analysés", f"{len(df)}")
-            else:
-                st.metric("Titres analysés", "0")
+            st.metric("Titres analysés", f"{artifact_row_count('categorized_tracks')}")
 
         with col3:
-            # Vérifier si l'utilisateur a des playlists
-            if os.path.exists(tracks_path):
-                df = pd.read_csv(tracks_path)
-                if 'playlist_name' in df.columns:
-                    st.metric("Playlists", f"{df['playlist_name'].nunique()}")
-                else:
-                    st.metric("Playlists", "0")
-            else:
-                st.metric("Playlists", "0")
+            st.metric("Playlists", f"{artifact_distinct_count('tracks', 'playlist_name')}")
 
         # Proposer des actions selon l'état des données
-        if not os.path.exists(tracks_path):
+        if not has_tracks:
             st.warning("Aucune donnée n'a encore été extraite de Spotify.")
 
             # Carte d'action pour l'extraction
@@ -225,7 +208,7 @@ def show():
                 st.session_state.page = "extraction"
                 st.experimental_rerun()
 
-        elif not os.path.exists(categorized_path):
+        elif not artifact_exists("categorized_tracks"):
             st.info("Vos données ont été extraites, mais l'analyse n'est pas encore terminée.")
 
             # Carte d'action pour l'analyse
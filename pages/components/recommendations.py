@@ -5,18 +5,20 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from config import DATA_DIR
+from storage import artifact_exists, load_artifact
+from generations import pin_generation
+import library_db
 
 # Importer uniquement get_recommendations, PAS export_playlist_to_csv
-from recommendation import get_recommendations
+from recommendation import get_recommendations, RECOMMENDATION_COLUMNS
 
 
+@pin_generation()
 def show():
     st.title("Recommandations Personnalisées")
 
     # Vérifier si des données catégorisées sont disponibles
-    categorized_path = os.path.join(DATA_DIR, "categorized_tracks.csv")
-
-    if not os.path.exists(categorized_path):
+    if not artifact_exists("categorized_tracks"):
         st.warning(
             "Aucune donnée n'est disponible pour les recommandations. Veuillez d'abord extraire et analyser vos données Spotify.")
 
@@ -35,8 +37,8 @@ def show():
         return
 
     try:
-        # Charger les données catégorisées
-        df = pd.read_csv(categorized_path, low_memory=False)
+        # Charger les données catégorisées (seulement les colonnes utiles aux recommandations)
+        df = load_artifact("categorized_tracks", columns=RECOMMENDATION_COLUMNS, optimize=True)
 
         if df.empty:
             st.error("Le fichier de données existe mais ne contient aucune donnée valide.")
@@ -58,6 +60,23 @@ def show():
         st.error(f"Erreur lors du chargement des recommandations: {str(e)}")
 
 
+def find_track_by_name(df, track_name, artist_name):
+    """
+    Retrouve un titre à partir de son nom et de son artiste
+
+    Returns:
+        dict: Informations du titre, ou None s'il est introuvable
+    """
+    if library_db.library_db_exists():
+        track = library_db.find_track(track_name, artist_name)
+        if track is not None:
+            return track
+
+    # Base non construite (ancienne extraction) : parcours du DataFrame
+    track_row = df[(df['track_name'] == track_name) & (df['artist_name'] == artist_name)]
+    return track_row.iloc[0].to_dict() if not track_row.empty else None
+
+
 def show_similar_tracks_recommendations(df):
     """Affiche les recommandations basées sur la similarité des titres"""
     st.header("Titres similaires")
@@ -87,15 +106,15 @@ def show_similar_tracks_recommendations(df):
         # Extraire le nom du titre et de l'artiste
         track_name, artist_name = selected_track.split(" - ", 1)
 
-        # Trouver l'ID du titre
-        track_row = df[(df['track_name'] == track_name) & (df['artist_name'] == artist_name)]
+        # Trouver le titre (recherche indexée si la base de la bibliothèque est disponible)
+        track = find_track_by_name(df, track_name, artist_name)
 
-        if not track_row.empty:
-            track_id = track_row.iloc[0]['track_id']
+        if track is not None:
+            track_id = track['track_id']
 
             # Afficher les caractéristiques du titre sélectionné
             audio_features = ['danceability', 'energy', 'valence', 'acousticness']
-            missing_features = [f for f in audio_features if f not in track_row.columns]
+            missing_features = [f for f in audio_features if track.get(f) is None or pd.isna(track.get(f))]
 
             if not missing_features:
                 st.subheader("Caractéristiques du titre sélectionné")
@@ -103,16 +122,16 @@ def show_similar_tracks_recommendations(df):
                 col1, col2, col3, col4 = st.columns(4)
 
                 with col1:
-                    st.metric("Dansabilité", f"{track_row.iloc[0]['danceability']:.2f}")
+                    st.metric("Dansabilité", f"{track['danceability']:.2f}")
 
                 with col2:
-                    st.metric("Énergie", f"{track_row.iloc[0]['energy']:.2f}")
+                    st.metric("Énergie", f"{track['energy']:.2f}")
 
                 with col3:
-                    st.metric("Positivité", f"{track_row.iloc[0]['valence']:.2f}")
+                    st.metric("Positivité", f"{track['valence']:.2f}")
 
                 with col4:
-                    st.metric("Acoustique", f"{track_row.iloc[0]['acousticness']:.2f}")
+                    st.metric("Acoustique", f"{track['acousticness']:.2f}")
 
             # Obtenir les recommandations
             if st.button("Obtenir des recommandations", type="primary"):
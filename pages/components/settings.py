@@ -1,19 +1,32 @@
 import streamlit as st
 import os
 import shutil
-from config import DATA_DIR, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI
+from config import APP_VERSION, DATA_DIR, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI
+from storage import ARTIFACTS, artifact_exists, load_artifact, optimize_dtypes, memory_report
+from data_lock import LOCKS_DIR, data_dir_lock
+from snapshots import SNAPSHOTS_DIR, delete_all_snapshots
+from generations import (GENERATIONS_DIR, current_generation, delete_all_generations, generations_lock,
+                         list_generations, pin_generation, rollback_generation)
 
 
 def clear_data():
     """Supprime toutes les données extraites"""
     try:
-        # Supprimer tous les fichiers dans le répertoire de données
-        for file in os.listdir(DATA_DIR):
-            file_path = os.path.join(DATA_DIR, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
+        # Verrous exclusifs : attendre la fin des constructions, lectures et écritures en cours (pages, workers, CLI)
+        with generations_lock(), data_dir_lock():
+            # Supprimer tous les fichiers dans le répertoire de données (sauf les fichiers de verrou)
+            for file in os.listdir(DATA_DIR):
+                file_path = os.path.join(DATA_DIR, file)
+                if file_path == LOCKS_DIR:
+                    continue
+                if file_path == SNAPSHOTS_DIR:
+                    delete_all_snapshots()
+                elif file_path == GENERATIONS_DIR:
+                    delete_all_generations()
+                elif os.path.isfile(file_path):
+                    os.remove(file_path)
+                elif os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
 
         # Réinitialiser les données de session qui dépendent des fichiers
         if 'top_artists_data' in st.session_state:
@@ -25,6 +38,53 @@ def clear_data():
         return False
 
 
+def show_api_scheduler_stats():
+    """Affiche la profondeur de file et les temps d'attente de chaque voie de l'ordonnanceur API (tous processus)"""
+    from api_scheduler import ApiScheduler, LANE_INTERACTIVE
+
+    stats = ApiScheduler.get_instance().get_stats()
+    lane_names = {LANE_INTERACTIVE: "Interactive", "background": "Arrière-plan"}
+
+    for lane, lane_stats in stats.items():
+        st.subheader(lane_names.get(lane, lane))
+        col1, col2, col3, col4 = st.columns(4)
+
+        with col1:
+            st.metric("En attente", str(lane_stats['queue_depth']))
+        with col2:
+            st.metric("Appels servis", str(lane_stats['granted']))
+        with col3:
+            st.metric("Attente moyenne", f"{lane_stats['avg_wait']:.2f} s")
+        with col4:
+            st.metric("Attente p95", f"{lane_stats['p95_wait']:.2f} s")
+
+
+def show_memory_report():
+    """Affiche la mémoire occupée par un artefact chargé, avec les types par défaut puis optimisés"""
+    available = [name for name in ARTIFACTS if artifact_exists(name)]
+    if not available:
+        st.info("Aucune donnée chargeable.")
+        return
+
+    name = st.selectbox("Fichier de données", options=available, key="memory_report_artifact")
+    if st.button("Mesurer la mémoire", key="memory_report_button"):
+        with st.spinner("Chargement des données..."):
+            df = load_artifact(name)
+            report = memory_report(df, optimize_dtypes(df))
+
+        total = report.loc['TOTAL']
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Types par défaut", f"{total['bytes_before'] / (1024 * 1024):.2f} Mo")
+        with col2:
+            st.metric("Types optimisés", f"{total['bytes_after'] / (1024 * 1024):.2f} Mo")
+        with col3:
+            st.metric("Réduction", f"x{total['ratio']:.1f}" if total['ratio'] == total['ratio'] else "-")
+
+        st.dataframe(report.drop(index='TOTAL'))
+
+
+@pin_generation()
 def show():
     st.title("Paramètres")
 
@@ -75,6 +135,10 @@ def show():
         6. Modifiez le fichier `.env` à la racine du projet avec vos identifiants
         """)
 
+    # Section Budget API
+    st.header("Budget API Spotify")
+    show_api_scheduler_stats()
+
     # Section Gestion des données
     st.header("Gestion des données")
 
@@ -85,7 +149,7 @@ def show():
 
     with col1:
         # Vérifier si des données existent
-        if os.path.exists(os.path.join(DATA_DIR, "tracks.csv")):
+        if artifact_exists("tracks"):
             # Calculer la taille des données
             total_size = 0
             for dirpath, dirnames, filenames in os.walk(DATA_DIR):
@@ -106,13 +170,29 @@ def show():
             st.metric("Taille des données", "0 octet")
 
     with col2:
-        if os.path.exists(os.path.join(DATA_DIR, "tracks.csv")):
+        if artifact_exists("tracks"):
             # Compter les fichiers
             file_count = sum(len(files) for _, _, files in os.walk(DATA_DIR))
             st.metric("Nombre de fichiers", str(file_count))
         else:
             st.metric("Nombre de fichiers", "0")
 
+    # Mémoire occupée par les données chargées
+    st.subheader("Mémoire des données chargées")
+    show_memory_report()
+
+    # Générations des données : retour à la version publiée précédente
+    generations = list_generations()
+    current = current_generation()
+    if current is not None:
+        st.caption(f"Version des données servie: {current} ({len(generations)} version(s) conservée(s))")
+        if current in generations and generations.index(current) > 0:
+            if st.button("Revenir à la version précédente des données"):
+                previous = rollback_generation()
+                if previous:
+                    st.success(f"Données revenues à la version {previous}")
+                    st.experimental_rerun()
+
     # Option pour supprimer toutes les données
     st.warning("La suppression des données est irréversible. Vous devrez extraire à nouveau vos données Spotify.")
     if st.button("Supprimer toutes les données", type="primary"):
@@ -129,10 +209,10 @@ def show():
     # Section À propos
     st.header("À propos de MelodIA")
 
-    st.markdown("""
+    st.markdown(f"""
     **MelodIA** est un analyseur et générateur de playlists musicales qui utilise l'API Spotify pour extraire des données sur vos habitudes d'écoute et vous proposer des recommandations personnalisées.
 
-    - Version: 1.0.0
+    - Version: {APP_VERSION}
     - Développé avec Python et Streamlit
     - Utilise l'API Spotify via la bibliothèque spotipy
 
@@ -4,8 +4,10 @@ import plotly.express as px
 import plotly.graph_objects as go
 import os
 from top_artists import analyze_top_artists, TopArtistsAnalyzer
+from generations import pin_generation
 
 
+@pin_generation()
 def show():
     st.title("Vos Artistes les Plus Écoutés")
 
@@ -119,7 +121,9 @@ def show():
     # Bouton pour réinitialiser l'analyse
     st.markdown("---")
     if st.button("Actualiser l'analyse des artistes", type="secondary"):
-        st.session_state.top_artists_data = None
+        with st.spinner("Récupération des dernières données Spotify..."):
+            results = analyze_top_artists(force_refresh=True)
+        st.session_state.top_artists_data = results
         st.experimental_rerun()
 
 
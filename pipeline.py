@@ -0,0 +1,191 @@
+import json
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from generations import active_generation, generation_path, use_generation
+from storage import artifact_fingerprint, write_atomic
+
+# État de la dernière exécution réussie de chaque étape (empreintes des entrées et des sorties),
+# enregistré dans la génération des données qu'il décrit
+PIPELINE_STATE_FILE = "pipeline_state.json"
+
+STATUS_DONE = 'exécutée'
+STATUS_SKIPPED = 'à jour'
+STATUS_FAILED = 'échec'
+STATUS_BLOCKED = 'non exécutée'
+
+
+class Stage:
+    """
+    Étape du pipeline, décrite par les artefacts qu'elle lit et ceux qu'elle produit
+
+    Parameters:
+        name (str): Nom de l'étape
+        run (callable): Fonction sans argument, retourne True en cas de succès
+        inputs (list): Artefacts lus (voir storage.ARTIFACTS)
+        outputs (list): Artefacts produits
+        source (callable): Empreinte d'une entrée externe (ex: playlists Spotify), optionnelle
+        main_thread (bool): L'étape doit s'exécuter dans le thread principal (ex: graphiques matplotlib)
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), source=None, main_thread=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.source = source
+        self.main_thread = main_thread
+
+
+def load_state():
+    """État enregistré des étapes (dict vide si le pipeline n'a jamais été exécuté)"""
+    try:
+        with open(generation_path(PIPELINE_STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    def write(temp_path):
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
+    write_atomic(generation_path(PIPELINE_STATE_FILE), write)
+
+
+def _fingerprints(names):
+    return {name: artifact_fingerprint(name) for name in names}
+
+
+def _dependencies(stages):
+    """Étapes dont dépend chaque étape : celles qui produisent un de ses artefacts d'entrée"""
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            producers[output] = stage.name
+    return {
+        stage.name: {producers[name] for name in stage.inputs if name in producers and producers[name] != stage.name}
+        for stage in stages
+    }
+
+
+def is_up_to_date(stage, state, source_fingerprint=None):
+    """
+    Indique si une étape peut être sautée
+
+    Une étape est à jour si sa dernière exécution réussie a vu les mêmes entrées (et la même source externe)
+    et si ses sorties n'ont pas changé depuis.
+    """
+    previous = state.get(stage.name)
+    if previous is None:
+        return False
+    if stage.source is not None and previous.get('source') != source_fingerprint:
+        return False
+    if previous.get('inputs') != _fingerprints(stage.inputs):
+        return False
+    return previous.get('outputs') == _fingerprints(stage.outputs)
+
+
+def _execute(stage, state, force, generation=None):
+    """
+    Exécute une étape si ses entrées ont changé
+
+    Parameters:
+        generation (Generation): Génération en construction du thread appelant, reprise par ce thread
+
+    Returns:
+        tuple: (statut, durée en secondes, nouvel état de l'étape ou None)
+    """
+    if generation is not None and active_generation() is not generation:
+        with use_generation(generation):
+            return _execute(stage, state, force)
+
+    started = time.time()
+    try:
+        source_fingerprint = stage.source() if stage.source is not None else None
+        if not force and is_up_to_date(stage, state, source_fingerprint):
+            return STATUS_SKIPPED, time.time() - started, None
+
+        if not stage.run():
+            return STATUS_FAILED, time.time() - started, None
+    except Exception as e:
+        print(f"Erreur pendant l'étape {stage.name}: {e}")
+        return STATUS_FAILED, time.time() - started, None
+
+    record = {
+        'source': source_fingerprint,
+        'inputs': _fingerprints(stage.inputs),
+        'outputs': _fingerprints(stage.outputs),
+        'finished_at': datetime.now(timezone.utc).isoformat()
+    }
+    return STATUS_DONE, time.time() - started, record
+
+
+def run_pipeline(stages, force=False):
+    """
+    Exécute le pipeline dans l'ordre des dépendances
+
+    Les étapes dont les entrées n'ont pas changé sont sautées ; les étapes indépendantes les unes des
+    autres s'exécutent en parallèle. Une étape n'est pas exécutée si une étape dont elle dépend a échoué.
+
+    Parameters:
+        stages (list): Étapes (Stage) du pipeline
+        force (bool): Exécuter toutes les étapes même si leurs entrées n'ont pas changé
+
+    Returns:
+        dict: Statut et durée de chaque étape
+    """
+    dependencies = _dependencies(stages)
+    state = load_state()
+    results = {}
+    remaining = list(stages)
+
+    while remaining:
+        ready = [stage for stage in remaining if dependencies[stage.name].issubset(results)]
+        if not ready:
+            # Dépendance circulaire : les étapes restantes ne peuvent pas être ordonnées
+            for stage in remaining:
+                results[stage.name] = {'status': STATUS_BLOCKED, 'duration': 0.0}
+            break
+
+        for stage in ready:
+            remaining.remove(stage)
+
+        runnable = []
+        for stage in ready:
+            failed = [name for name in dependencies[stage.name]
+                      if results[name]['status'] in (STATUS_FAILED, STATUS_BLOCKED)]
+            if failed:
+                results[stage.name] = {'status': STATUS_BLOCKED, 'duration': 0.0}
+            else:
+                runnable.append(stage)
+
+        # Les étapes prêtes sont indépendantes : elles s'exécutent en même temps
+        background = [stage for stage in runnable if not stage.main_thread]
+        outcomes = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(background))) as executor:
+            futures = {stage.name: executor.submit(_execute, stage, state, force, active_generation())
+                       for stage in background}
+            for stage in runnable:
+                if stage.main_thread:
+                    outcomes[stage.name] = _execute(stage, state, force)
+            for name, future in futures.items():
+                outcomes[name] = future.result()
+
+        for name, (status, duration, record) in outcomes.items():
+            results[name] = {'status': status, 'duration': duration}
+            if record is not None:
+                state[name] = record
+            elif status == STATUS_FAILED:
+                state.pop(name, None)
+        save_state(state)
+
+    return results
+
+
+def print_summary(results):
+    """Affiche le statut et la durée de chaque étape"""
+    print("\nRésumé du pipeline:")
+    for name, result in results.items():
+        print(f"  {name:<16} {result['status']:<14} {result['duration']:.3f} s")
@@ -1,38 +1,74 @@
 import pandas as pd
 import numpy as np
-import os
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import MinMaxScaler
-from config import DATA_DIR
+from storage import artifact_exists, load_artifact, project_columns
+from feature_matrix import load_feature_matrix, fill_with_column_means
+from membership_index import load_membership_index
 
+# Caractéristiques audio utilisées pour la similarité entre titres
+SIMILARITY_FEATURES = ['danceability', 'energy', 'valence', 'acousticness',
+                       'instrumentalness', 'liveness', 'speechiness']
 
-def load_categorized_data():
-    """Charge les données catégorisées pour les recommandations"""
-    categorized_path = os.path.join(DATA_DIR, "categorized_tracks.csv")
+# Colonnes lues par le système de recommandation : identifiants et noms affichés, popularité et playlists
+# pour les découvertes, caractéristiques audio (les autres colonnes ne sont pas chargées)
+RECOMMENDATION_COLUMNS = ['track_id', 'track_name', 'artist_name', 'album_name', 'playlist_name',
+                          'playlist_count', 'popularity'] + SIMILARITY_FEATURES
 
+
+def load_categorized_data(columns=RECOMMENDATION_COLUMNS):
+    """
+    Charge les données catégorisées pour les recommandations
+
+    Parameters:
+        columns (list): Colonnes à charger (par défaut celles du système de recommandation, None pour toutes)
+    """
     try:
-        if os.path.exists(categorized_path):
-            return pd.read_csv(categorized_path, low_memory=False)
+        if artifact_exists("categorized_tracks"):
+            return load_artifact("categorized_tracks", columns=columns, optimize=True)
         else:
             # Si les données catégorisées ne sont pas disponibles, exécuter l'analyse
             print("Données catégorisées non trouvées, exécution de l'analyse...")
             # Importation différée pour éviter les importations circulaires
             from data_analysis import analyze_data
             _, _, df = analyze_data(max_recursion_depth=2000)
-            return df
+            return project_columns(df, columns)
     except Exception as e:
         print(f"Erreur lors du chargement des données: {e}")
         # Tentative de récupération avec un ancien fichier de sauvegarde
-        backup_path = os.path.join(DATA_DIR, "tracks.csv")
-        if os.path.exists(backup_path):
+        if artifact_exists("tracks"):
             print("Tentative de chargement depuis les données brutes...")
             try:
-                return pd.read_csv(backup_path, low_memory=False)
+                return load_artifact("tracks", columns=columns, optimize=True)
             except Exception as e2:
                 print(f"Échec de la récupération depuis les données brutes: {e2}")
         return None
 
 
+def get_feature_values(df, features):
+    """
+    Caractéristiques numériques des titres de df, dans l'ordre de ses lignes
+
+    La matrice float32 produite par le traitement est lue sans copie quand elle couvre tous les titres ;
+    sinon les valeurs sont converties depuis le DataFrame.
+
+    Parameters:
+        df (DataFrame): Titres (colonne track_id)
+        features (list): Caractéristiques à extraire
+
+    Returns:
+        ndarray: Matrice float32, valeurs manquantes remplacées par la moyenne de la colonne
+    """
+    matrix = load_feature_matrix()
+    if matrix is not None and matrix.has_columns(features):
+        values = matrix.features_for(df['track_id'], features)
+        if values is not None:
+            return values
+
+    values = df[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float32)
+    return fill_with_column_means(values)
+
+
 def get_similar_tracks(track_id, df, n=5):
     """
     Recommande des titres similaires basés sur les caractéristiques audio
@@ -55,8 +91,7 @@ def get_similar_tracks(track_id, df, n=5):
             return None
 
         # Caractéristiques audio à utiliser pour la similarité
-        audio_features = ['danceability', 'energy', 'valence', 'acousticness',
-                          'instrumentalness', 'liveness', 'speechiness']
+        audio_features = SIMILARITY_FEATURES
 
         # Vérifier quelles caractéristiques sont disponibles
         available_features = [f for f in audio_features if f in df.columns]
@@ -65,20 +100,15 @@ def get_similar_tracks(track_id, df, n=5):
             print("Pas assez de caractéristiques audio disponibles pour les recommandations.")
             return None
 
-        # Extraire les caractéristiques et s'assurer qu'elles sont numériques
-        features_df = df[available_features].copy()
-        for feature in available_features:
-            features_df[feature] = pd.to_numeric(features_df[feature], errors='coerce')
-            features_df[feature].fillna(features_df[feature].mean(), inplace=True)
-
-        features_matrix = features_df.values
+        # Extraire les caractéristiques numériques (matrice float32 partagée si disponible)
+        features_matrix = get_feature_values(df, available_features)
 
         # Normaliser les caractéristiques
         scaler = MinMaxScaler()
         features_matrix_scaled = scaler.fit_transform(features_matrix)
 
-        # Trouver l'index du titre cible
-        track_index = df[df['track_id'] == track_id].index[0]
+        # Trouver la position du titre cible
+        track_index = np.flatnonzero(df['track_id'].to_numpy() == track_id)[0]
 
         # Calculer la similarité cosinus
         similarities = cosine_similarity([features_matrix_scaled[track_index]], features_matrix_scaled)[0]
@@ -145,9 +175,7 @@ def generate_playlist_by_mood(mood, df, size=15, min_energy=None, min_danceabili
 
         # S'assurer que les caractéristiques sont numériques
         numeric_df = df.copy()
-        for feature in available_features:
-            numeric_df[feature] = pd.to_numeric(numeric_df[feature], errors='coerce')
-            numeric_df[feature].fillna(numeric_df[feature].mean(), inplace=True)
+        numeric_df[available_features] = get_feature_values(df, available_features)
 
         # Définir les critères par défaut pour chaque ambiance
         mood_criteria = {
@@ -248,6 +276,24 @@ def generate_playlist_by_mood(mood, df, size=15, min_energy=None, min_danceabili
         return None
 
 
+def playlist_counts(df):
+    """
+    Nombre de playlists contenant chaque titre
+
+    Lu dans l'index d'appartenance aux playlists (bitsets) s'il contient tous les titres de df, sinon dans
+    la colonne playlist_count des données nettoyées ; à défaut, compte les playlists des lignes du titre
+    présentes dans df.
+    """
+    index = load_membership_index()
+    if index is not None:
+        rows = index.rows_for(df['track_id'])
+        if (rows >= 0).all():
+            return pd.Series(index.track_counts()[rows], index=df.index)
+    if 'playlist_count' in df.columns:
+        return df['playlist_count']
+    return df.groupby('track_id')['playlist_name'].transform('nunique')
+
+
 def discover_new_music(df, n=10, discovery_type='mixed'):
     """
     Recommande des titres peu connus ou récemment ajoutés à la bibliothèque
@@ -301,12 +347,7 @@ def discover_new_music(df, n=10, discovery_type='mixed'):
 
             if has_playlists:
                 # Donner priorité aux titres qui apparaissent dans peu de playlists
-                track_playlist_counts = df.groupby('track_id')['playlist_name'].nunique().reset_index()
-                track_playlist_counts.columns = ['track_id', 'playlist_count']
-
-                # Fusionner avec les données principales
-                discoveries = pd.merge(discoveries, track_playlist_counts, on='track_id', how='left')
-                discoveries = discoveries[discoveries['playlist_count'] <= 1]
+                discoveries = discoveries[playlist_counts(discoveries) <= 1]
         else:
             # Approche mixte (par défaut)
             if has_popularity:
@@ -320,15 +361,8 @@ def discover_new_music(df, n=10, discovery_type='mixed'):
                     discoveries = discoveries[~discoveries['artist_name'].isin(artist_counts[artist_counts > 2].index)]
 
             elif has_playlists:
-                # Compter combien de fois chaque titre apparaît dans différentes playlists
-                track_playlist_counts = df.groupby('track_id')['playlist_name'].nunique().reset_index()
-                track_playlist_counts.columns = ['track_id', 'playlist_count']
-
-                # Fusionner avec les données principales
-                merged_df = pd.merge(df, track_playlist_counts, on='track_id', how='left')
-
-                # Sélectionner les titres qui apparaissent dans peu de playlists (1 ou 2)
-                discoveries = merged_df[merged_df['playlist_count'] <= 1]
+                # Sélectionner les titres qui apparaissent dans peu de playlists
+                discoveries = df[playlist_counts(df) <= 1]
             else:
                 # Fallback: sélection aléatoire
                 discoveries = df.sample(min(n * 2, len(df)))
@@ -0,0 +1,317 @@
+import io
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import DATA_DIR
+from data_lock import artifact_lock
+from storage import PARQUET_COMPRESSION, build_schema, write_atomic
+
+# Instantanés de la bibliothèque : un manifeste par extraction, des partitions stockées par contenu
+# - snapshots/<id>.json : playlists de l'extraction et empreinte de la partition de chacune
+# - snapshots/objects/<empreinte>.parquet : partition immuable, partagée par tous les instantanés identiques
+SNAPSHOTS_DIR = os.path.join(DATA_DIR, "snapshots")
+OBJECTS_DIR = os.path.join(SNAPSHOTS_DIR, "objects")
+# Verrou des instantanés : exclusif pour en créer ou en supprimer (ramasse-miettes des partitions),
+# partagé pour les lire
+SNAPSHOTS_LOCK = "snapshots"
+
+# Colonnes stables stockées dans les partitions : une playlist dont les titres n'ont pas changé garde
+# la même partition. Les autres colonnes (ex: popularité, qui évolue à chaque extraction) sont stockées
+# une fois par instantané, une ligne par titre. Le nom de la playlist est repris du manifeste.
+PARTITION_COLUMNS = ['playlist_id', 'track_id', 'track_name', 'artist_name', 'artist_ids', 'artist_names',
+                     'album_id', 'album_name', 'release_date', 'position', 'added_at']
+
+DIFF_COLUMNS = ['playlist_id', 'playlist_name', 'change', 'track_id', 'track_name', 'artist_name']
+CHANGE_ADDED = 'ajouté'
+CHANGE_REMOVED = 'retiré'
+
+
+def _snapshot_path(snapshot_id):
+    return os.path.join(SNAPSHOTS_DIR, f"{snapshot_id}.json")
+
+
+def _object_path(digest):
+    return os.path.join(OBJECTS_DIR, f"{digest}.parquet")
+
+
+def _store_object(df):
+    """
+    Stocke une partition par contenu
+
+    Une partition identique à une partition déjà stockée n'est pas réécrite : seule son empreinte est référencée.
+
+    Returns:
+        str: Empreinte SHA-256 de la partition
+    """
+    df = df.reset_index(drop=True)
+    table = pa.Table.from_pandas(df, schema=build_schema(df), preserve_index=False)
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression=PARQUET_COMPRESSION)
+    data = buffer.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+
+    path = _object_path(digest)
+    if not os.path.exists(path):
+        def write(temp_path):
+            with open(temp_path, "wb") as f:
+                f.write(data)
+
+        write_atomic(path, write)
+        # Les partitions ne sont jamais modifiées après leur écriture
+        os.chmod(path, 0o444)
+    return digest
+
+
+def _load_object(digest, columns=None):
+    return pq.read_table(_object_path(digest), columns=columns).to_pandas()
+
+
+def create_snapshot(tracks_df, playlists_df=None, features_df=None):
+    """
+    Enregistre un instantané immuable de la bibliothèque
+
+    Les titres sont partitionnés par playlist : une playlist inchangée depuis l'instantané précédent
+    réutilise la même partition, le stockage ne grandit qu'avec les modifications. Les attributs
+    variables des titres (hors PARTITION_COLUMNS) sont stockés à part, une ligne par titre.
+
+    Parameters:
+        tracks_df (DataFrame): Titres extraits (une ligne par couple playlist/titre)
+        playlists_df (DataFrame): Playlists retournées par l'API (optionnel, sinon déduites des titres)
+        features_df (DataFrame): Caractéristiques audio par titre (optionnel)
+
+    Returns:
+        str: Identifiant de l'instantané
+    """
+    # Une suppression concurrente ne doit pas retirer une partition référencée par cet instantané
+    with artifact_lock(SNAPSHOTS_LOCK, exclusive=True):
+        return _create_snapshot(tracks_df, playlists_df, features_df)
+
+
+def _create_snapshot(tracks_df, playlists_df, features_df):
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
+
+    if playlists_df is None or playlists_df.empty:
+        playlists_df = tracks_df[['playlist_id', 'playlist_name']].drop_duplicates(subset=['playlist_id'])
+
+    partition_columns = [col for col in PARTITION_COLUMNS if col in tracks_df.columns]
+    attribute_columns = [col for col in tracks_df.columns if col not in partition_columns and col != 'playlist_name']
+    stable_df = tracks_df[partition_columns]
+
+    partitions = dict(tuple(stable_df.groupby('playlist_id', sort=False)))
+    playlists = []
+    for _, playlist in playlists_df.iterrows():
+        partition = partitions.get(playlist['playlist_id'], stable_df.iloc[0:0])
+        playlists.append({
+            'playlist_id': playlist['playlist_id'],
+            'playlist_name': playlist['playlist_name'],
+            'snapshot_id': playlist['snapshot_id'] if pd.notna(playlist.get('snapshot_id')) else None,
+            'rows': int(len(partition)),
+            'object': _store_object(partition)
+        })
+
+    created_at = datetime.now(timezone.utc)
+    snapshot_id = created_at.strftime("%Y%m%dT%H%M%S%fZ")
+    manifest = {
+        'id': snapshot_id,
+        'created_at': created_at.isoformat(),
+        'columns': list(tracks_df.columns),
+        'playlists': playlists,
+        'attributes_object': _store_object(tracks_df[['track_id'] + attribute_columns]
+                                           .drop_duplicates(subset=['track_id'])) if attribute_columns else None,
+        'playlists_object': _store_object(playlists_df),
+        'features_object': _store_object(features_df) if features_df is not None and not features_df.empty else None
+    }
+
+    def write(temp_path):
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    write_atomic(_snapshot_path(snapshot_id), write)
+
+    print(f"Instantané de la bibliothèque enregistré: {snapshot_id} ({len(playlists)} playlists)")
+    return snapshot_id
+
+
+def list_snapshots():
+    """
+    Instantanés disponibles, du plus ancien au plus récent
+
+    Returns:
+        list: Pour chaque instantané, dict (id, created_at, nombre de playlists et de titres)
+    """
+    if not os.path.isdir(SNAPSHOTS_DIR):
+        return []
+
+    snapshots = []
+    with artifact_lock(SNAPSHOTS_LOCK):
+        for file_name in sorted(os.listdir(SNAPSHOTS_DIR)):
+            if not file_name.endswith(".json"):
+                continue
+            manifest = get_snapshot(file_name[:-len(".json")])
+            snapshots.append({
+                'id': manifest['id'],
+                'created_at': manifest['created_at'],
+                'playlists': len(manifest['playlists']),
+                'tracks': sum(playlist['rows'] for playlist in manifest['playlists'])
+            })
+    return snapshots
+
+
+def get_snapshot(snapshot_id):
+    """Manifeste d'un instantané (dict) ; FileNotFoundError s'il n'existe pas"""
+    path = _snapshot_path(snapshot_id)
+    with artifact_lock(SNAPSHOTS_LOCK):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Instantané introuvable: {snapshot_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def latest_snapshot_ids(n=2):
+    """Identifiants des n instantanés les plus récents, du plus ancien au plus récent"""
+    return [snapshot['id'] for snapshot in list_snapshots()[-n:]]
+
+
+def load_snapshot(snapshot_id, playlist_ids=None):
+    """
+    Titres d'un instantané
+
+    Parameters:
+        snapshot_id (str): Identifiant de l'instantané
+        playlist_ids (list): Playlists à charger (par défaut toutes)
+
+    Returns:
+        DataFrame: Titres, dans l'ordre des playlists de l'instantané
+    """
+    with artifact_lock(SNAPSHOTS_LOCK):
+        return _load_snapshot(snapshot_id, playlist_ids)
+
+
+def _load_snapshot(snapshot_id, playlist_ids):
+    manifest = get_snapshot(snapshot_id)
+    frames = [_load_object(playlist['object']).assign(playlist_name=playlist['playlist_name'])
+              for playlist in manifest['playlists']
+              if playlist_ids is None or playlist['playlist_id'] in playlist_ids]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    tracks = pd.concat(frames, ignore_index=True)
+
+    # Instantanés antérieurs aux attributs séparés : les partitions contiennent déjà toutes les colonnes
+    if manifest.get('attributes_object'):
+        tracks = tracks.merge(_load_object(manifest['attributes_object']), on='track_id', how='left')
+    columns = manifest.get('columns')
+    return tracks[[col for col in columns if col in tracks.columns]] if columns else tracks
+
+
+def diff_snapshots(old_id, new_id):
+    """
+    Titres ajoutés et retirés de chaque playlist entre deux instantanés
+
+    Seules les playlists dont la partition a changé sont lues.
+
+    Parameters:
+        old_id (str): Instantané de référence
+        new_id (str): Instantané comparé
+
+    Returns:
+        DataFrame: Une ligne par titre ajouté ou retiré (playlist_id, playlist_name, change, track_id,
+                   track_name, artist_name)
+    """
+    with artifact_lock(SNAPSHOTS_LOCK):
+        return _diff_snapshots(old_id, new_id)
+
+
+def _diff_snapshots(old_id, new_id):
+    old = {playlist['playlist_id']: playlist for playlist in get_snapshot(old_id)['playlists']}
+    new = {playlist['playlist_id']: playlist for playlist in get_snapshot(new_id)['playlists']}
+    columns = ['track_id', 'track_name', 'artist_name']
+
+    frames = []
+    for playlist_id in list(new) + [playlist_id for playlist_id in old if playlist_id not in new]:
+        old_playlist, new_playlist = old.get(playlist_id), new.get(playlist_id)
+        if old_playlist is not None and new_playlist is not None \
+                and old_playlist['object'] == new_playlist['object']:
+            continue
+
+        old_tracks = _load_object(old_playlist['object'], columns) if old_playlist else pd.DataFrame(columns=columns)
+        new_tracks = _load_object(new_playlist['object'], columns) if new_playlist else pd.DataFrame(columns=columns)
+        playlist_name = (new_playlist or old_playlist)['playlist_name']
+
+        for change, tracks, other in ((CHANGE_ADDED, new_tracks, old_tracks), (CHANGE_REMOVED, old_tracks, new_tracks)):
+            changed = tracks[~tracks['track_id'].isin(other['track_id'])].drop_duplicates(subset=['track_id'])
+            if not changed.empty:
+                frames.append(changed.assign(playlist_id=playlist_id, playlist_name=playlist_name, change=change))
+
+    if not frames:
+        return pd.DataFrame(columns=DIFF_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[DIFF_COLUMNS]
+
+
+def summarize_diff(diff):
+    """
+    Nombre de titres ajoutés et retirés par playlist
+
+    Returns:
+        DataFrame: playlist_id, playlist_name, ajoutés, retirés
+    """
+    counts = diff.groupby(['playlist_id', 'playlist_name', 'change']).size().unstack('change', fill_value=0)
+    counts = counts.reindex(columns=[CHANGE_ADDED, CHANGE_REMOVED], fill_value=0)
+    counts = counts.rename(columns={CHANGE_ADDED: 'ajoutés', CHANGE_REMOVED: 'retirés'}).rename_axis(columns=None)
+    return counts.reset_index()
+
+
+def delete_snapshot(snapshot_id):
+    """
+    Supprime un instantané et les partitions qui ne sont plus référencées
+
+    Returns:
+        int: Nombre de partitions supprimées
+    """
+    with artifact_lock(SNAPSHOTS_LOCK, exclusive=True):
+        return _delete_snapshot(snapshot_id)
+
+
+def _delete_snapshot(snapshot_id):
+    os.remove(_snapshot_path(snapshot_id))
+
+    referenced = set()
+    for snapshot in list_snapshots():
+        manifest = get_snapshot(snapshot['id'])
+        referenced.update(playlist['object'] for playlist in manifest['playlists'])
+        referenced.update(filter(None, [manifest['playlists_object'], manifest['features_object'],
+                                        manifest.get('attributes_object')]))
+
+    removed = 0
+    for file_name in os.listdir(OBJECTS_DIR):
+        if file_name.endswith(".parquet") and file_name[:-len(".parquet")] not in referenced:
+            path = os.path.join(OBJECTS_DIR, file_name)
+            os.chmod(path, 0o644)
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def delete_all_snapshots():
+    """
+    Supprime tous les instantanés et leurs partitions
+
+    Returns:
+        bool: True si des instantanés ont été supprimés
+    """
+    if not os.path.isdir(SNAPSHOTS_DIR):
+        return False
+
+    def make_writable_and_retry(func, path, _):
+        # Les partitions sont en lecture seule (nécessaire sous Windows pour les supprimer)
+        os.chmod(path, 0o644)
+        func(path)
+
+    with artifact_lock(SNAPSHOTS_LOCK, exclusive=True):
+        shutil.rmtree(SNAPSHOTS_DIR, onerror=make_writable_and_retry)
+    return True
@@ -1,16 +1,31 @@
 import pandas as pd
 import time
 import os
-from config import DATA_DIR
+import json
+import shutil
+import hashlib
+import multiprocessing
+from config import DATA_DIR, EXTRACTION_WORKERS
 from spotify_auth import SpotifyAuth
+from api_scheduler import LANE_BACKGROUND
+import telemetry
+from storage import artifact_exists, load_artifact, save_artifact
+from library import LIBRARY_TABLES, build_library, save_library
+from library_db import build_library_db
+from snapshots import create_snapshot
+
+# Dossier temporaire des fichiers produits par chaque processus de l'extraction parallèle
+SHARDS_DIR = os.path.join(DATA_DIR, "shards")
 
 class SpotifyConnector:
     def __init__(self, force_new_auth=False):
         """Initialise la connexion à l'API Spotify"""
         auth = SpotifyAuth.get_instance(force_new_auth)
-        self.sp = auth.get_spotify_client()
+        # L'extraction est un traitement de masse : elle cède le pas aux requêtes interactives
+        self.sp = auth.get_scheduled_client(LANE_BACKGROUND)
         self.user_id = auth.user_id
         self.user_name = auth.user_name
+        self.playlists_df = None
 
     def get_playlists(self):
         """Récupère toutes les playlists de l'utilisateur"""
@@ -29,24 +44,32 @@ class SpotifyConnector:
                 'playlist_id': playlist['id'],
                 'playlist_name': playlist['name'],
                 'playlist_tracks': playlist['tracks']['total'],
-                'playlist_owner': playlist['owner']['display_name']
+                'playlist_owner': playlist['owner']['display_name'],
+                # Change à chaque modification de la playlist (titres, ordre, nom)
+                'snapshot_id': playlist.get('snapshot_id')
             }
             for playlist in playlists
         ])
 
     def get_playlist_tracks(self, playlist_id, playlist_name):
         """Récupère tous les titres d'une playlist spécifique"""
+        started = time.time()
         results = self.sp.playlist_tracks(playlist_id)
         tracks = []
+        pages = 0
 
         while results:
+            pages += 1
             for item in results['items']:
                 # Vérifier si l'élément contient un track (pour éviter les podcasts)
                 if item['track'] and item['track']['id']:
                     track = item['track']
 
-                    # Récupérer les artistes (il peut y en avoir plusieurs)
-                    artists = ', '.join([artist['name'] for artist in track['artists']])
+                    # Récupérer les artistes (il peut y en avoir plusieurs) : le nom affiché les réunit,
+                    # les listes gardent chaque artiste pour le pont titre/artiste du traitement
+                    artist_ids = [artist['id'] for artist in track['artists']]
+                    artist_names = [artist['name'] for artist in track['artists']]
+                    artists = ', '.join(artist_names)
 
                     # Récupérer la date de sortie
                     album = track['album']
@@ -56,11 +79,16 @@ class SpotifyConnector:
                         'track_id': track['id'],
                         'track_name': track['name'],
                         'artist_name': artists,
+                        'artist_ids': artist_ids,
+                        'artist_names': artist_names,
+                        'album_id': album.get('id'),
                         'album_name': album['name'],
                         'release_date': release_date,
                         'popularity': track['popularity'],
                         'playlist_id': playlist_id,
-                        'playlist_name': playlist_name
+                        'playlist_name': playlist_name,
+                        'position': len(tracks),
+                        'added_at': item.get('added_at')
                     })
 
             if results['next']:
@@ -68,16 +96,34 @@ class SpotifyConnector:
             else:
                 results = None
 
+        run = telemetry.current_run()
+        if run is not None:
+            run.record_playlist(playlist_id, playlist_name, pages, len(tracks), time.time() - started)
+
         return pd.DataFrame(tracks)
 
-    def get_all_playlist_tracks(self):
-        """Récupère les titres de toutes les playlists de l'utilisateur"""
-        playlists_df = self.get_playlists()
+    def get_all_playlist_tracks(self, reuse=None, playlists_df=None):
+        """
+        Récupère les titres de toutes les playlists de l'utilisateur
+
+        Parameters:
+            reuse (dict): Titres déjà connus par identifiant de playlist (playlists inchangées, non relues)
+            playlists_df (DataFrame): Playlists déjà récupérées (par défaut get_playlists())
+        """
+        if playlists_df is None:
+            playlists_df = self.get_playlists()
+        # Conservé pour la table des playlists de la bibliothèque
+        self.playlists_df = playlists_df
         all_tracks = []
+        reuse = reuse or {}
 
         print(f"Récupération des titres pour {len(playlists_df)} playlists...")
 
         for index, playlist in playlists_df.iterrows():
+            if playlist['playlist_id'] in reuse:
+                all_tracks.append(reuse[playlist['playlist_id']])
+                continue
+
             print(f"Traitement de la playlist: {playlist['playlist_name']} ({playlist['playlist_tracks']} titres)")
             tracks = self.get_playlist_tracks(playlist['playlist_id'], playlist['playlist_name'])
             all_tracks.append(tracks)
@@ -92,14 +138,80 @@ class SpotifyConnector:
         else:
             return pd.DataFrame()
 
-    def get_audio_features(self, tracks_df, batch_size=50):
-        """Récupère les caractéristiques audio pour une liste de titres"""
+    def get_all_playlist_tracks_sharded(self, num_workers, reuse=None, playlists_df=None):
+        """
+        Récupère les titres de toutes les playlists en répartissant les playlists entre plusieurs processus
+
+        Chaque processus écrit son propre fichier, puis les fichiers sont fusionnés dans l'ordre des
+        playlists : le résultat est identique à celui de get_all_playlist_tracks.
+
+        Parameters:
+            num_workers (int): Nombre de processus
+            reuse (dict): Titres déjà connus par identifiant de playlist (playlists inchangées, non relues)
+            playlists_df (DataFrame): Playlists déjà récupérées (par défaut get_playlists())
+
+        Returns:
+            DataFrame: Titres de toutes les playlists
+        """
+        if playlists_df is None:
+            playlists_df = self.get_playlists()
+        self.playlists_df = playlists_df
+        reuse = reuse or {}
+
+        to_fetch = playlists_df[~playlists_df['playlist_id'].isin(list(reuse))] if not playlists_df.empty else playlists_df
+        if to_fetch.empty:
+            return assemble_playlist_tracks(playlists_df, pd.DataFrame(), reuse)
+
+        print(f"Récupération des titres pour {len(to_fetch)} playlists avec {num_workers} processus...")
+
+        shards = partition_playlists(to_fetch, num_workers)
+
+        # Repartir d'un dossier vide pour ne jamais fusionner les fichiers d'une exécution précédente
+        shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+        os.makedirs(SHARDS_DIR, exist_ok=True)
+
+        # Les processus consomment le budget API commun à toute l'application (voir api_scheduler)
+        tasks = [(index, shard, SHARDS_DIR) for index, shard in enumerate(shards) if shard]
+        with multiprocessing.Pool(len(tasks)) as pool:
+            shard_results = pool.map(_extract_shard, tasks)
+
+        # Rapatrier les mesures collectées par chaque processus
+        run = telemetry.current_run()
+        shard_paths = []
+        for shard_path, shard_metrics in shard_results:
+            shard_paths.append(shard_path)
+            if run is not None:
+                run.merge(shard_metrics)
+
+        tracks_df = merge_shards(shard_paths)
+        shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+        return assemble_playlist_tracks(playlists_df, tracks_df, reuse) if reuse else tracks_df
+
+    def get_audio_features(self, tracks_df, batch_size=50, known_features=None):
+        """
+        Récupère les caractéristiques audio pour une liste de titres
+
+        Parameters:
+            tracks_df (DataFrame): Titres
+            batch_size (int): Nombre de titres par requête
+            known_features (DataFrame): Caractéristiques déjà extraites, réutilisées sans appel à l'API
+        """
         if tracks_df.empty:
             return tracks_df
 
         # Récupérer uniquement les IDs uniques pour éviter de traiter les doublons
         unique_track_ids = tracks_df['track_id'].unique().tolist()
 
+        reused = None
+        if known_features is not None and not known_features.empty:
+            reused = known_features[known_features['track_id'].isin(unique_track_ids)]
+            known_ids = set(reused['track_id'])
+            unique_track_ids = [track_id for track_id in unique_track_ids if track_id not in known_ids]
+            if reused.empty:
+                reused = None
+            else:
+                print(f"Caractéristiques audio déjà connues pour {len(known_ids)} titres.")
+
         features = []
 
         print(f"Récupération des caractéristiques audio pour {len(unique_track_ids)} titres uniques...")
@@ -149,76 +261,280 @@ class SpotifyConnector:
             # Renommer la colonne 'id' pour faciliter la fusion
             features_df = features_df.rename(columns={'id': 'track_id'})
 
-        return features_df
+        if reused is not None:
+            features_df = pd.concat([reused, features_df], ignore_index=True) if not features_df.empty else reused
+
+        return features_df.reset_index(drop=True)
 
     def save_data(self, tracks_df, features_df=None):
         """Sauvegarde les données extraites"""
         # Sauvegarder les titres
-        tracks_path = os.path.join(DATA_DIR, "tracks.csv")
-        tracks_df.to_csv(tracks_path, index=False)
+        tracks_path = save_artifact(tracks_df, "tracks", producer="extraction")
         print(f"Titres sauvegardés dans: {tracks_path}")
 
         # Sauvegarder les caractéristiques audio si disponibles
         if features_df is not None and not features_df.empty:
-            features_path = os.path.join(DATA_DIR, "audio_features.csv")
-            features_df.to_csv(features_path, index=False)
+            features_path = save_artifact(features_df, "audio_features", producer="extraction")
             print(f"Caractéristiques audio sauvegardées dans: {features_path}")
 
             # Fusionner et sauvegarder un dataset complet
             merged_df = pd.merge(tracks_df, features_df, on='track_id', how='left')
-            merged_path = os.path.join(DATA_DIR, "tracks_with_features.csv")
-            merged_df.to_csv(merged_path, index=False)
+            merged_path = save_artifact(merged_df, "tracks_with_features", producer="extraction")
             print(f"Dataset complet sauvegardé dans: {merged_path}")
 
         return True
 
 
-def extract_spotify_data(force_new_auth=False):
+def partition_playlists(playlists_df, num_shards):
+    """
+    Répartit les playlists entre les processus de façon équilibrée et déterministe
+
+    Les playlists sont attribuées de la plus grande à la plus petite au processus le moins chargé.
+
+    Parameters:
+        playlists_df (DataFrame): Playlists retournées par get_playlists
+        num_shards (int): Nombre de processus
+
+    Returns:
+        list: Pour chaque processus, liste de dicts (ordre, id et nom de playlist)
+    """
+    shards = [[] for _ in range(num_shards)]
+    loads = [0] * num_shards
+
+    playlists = [
+        {'order': order, 'playlist_id': row['playlist_id'], 'playlist_name': row['playlist_name'],
+         'playlist_tracks': int(row['playlist_tracks'])}
+        for order, (_, row) in enumerate(playlists_df.iterrows())
+    ]
+
+    for playlist in sorted(playlists, key=lambda p: (-p['playlist_tracks'], p['order'])):
+        target = min(range(num_shards), key=lambda i: (loads[i], i))
+        shards[target].append(playlist)
+        loads[target] += max(playlist['playlist_tracks'], 1)
+
+    return shards
+
+
+def _extract_shard(task):
+    """Extrait les titres d'un groupe de playlists et les écrit dans un fichier propre au processus"""
+    shard_index, playlists, shard_dir = task
+    run = telemetry.start_run(f"extraction_shard_{shard_index}")
+    connector = SpotifyConnector()
+    frames = []
+
+    for playlist in playlists:
+        print(f"[Processus {shard_index}] Traitement de la playlist: {playlist['playlist_name']} "
+              f"({playlist['playlist_tracks']} titres)")
+        tracks = connector.get_playlist_tracks(playlist['playlist_id'], playlist['playlist_name'])
+        # Conserver la position d'origine pour une fusion déterministe
+        tracks['_playlist_order'] = playlist['order']
+        tracks['_track_order'] = range(len(tracks))
+        frames.append(tracks)
+
+    shard_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    # Format pickle : les types des colonnes sont conservés à l'identique jusqu'à la fusion
+    shard_path = os.path.join(shard_dir, f"tracks_shard_{shard_index:03d}.pkl")
+    shard_df.to_pickle(shard_path)
+    return shard_path, run.to_dict()
+
+
+def merge_shards(shard_paths):
+    """
+    Fusionne les fichiers des processus dans l'ordre original des playlists et des titres
+
+    Returns:
+        DataFrame: Titres de toutes les playlists, dans le même ordre qu'une extraction séquentielle
+    """
+    frames = [pd.read_pickle(path) for path in sorted(shard_paths)]
+    frames = [frame for frame in frames if not frame.empty]
+
+    if not frames:
+        return pd.DataFrame()
+
+    merged_df = pd.concat(frames, ignore_index=True)
+    merged_df = merged_df.sort_values(['_playlist_order', '_track_order'], kind='mergesort')
+    return merged_df.drop(columns=['_playlist_order', '_track_order']).reset_index(drop=True)
+
+
+def assemble_playlist_tracks(playlists_df, fetched_df, reuse):
+    """
+    Combine les titres relus et les titres réutilisés, dans l'ordre des playlists
+
+    Parameters:
+        playlists_df (DataFrame): Playlists de l'utilisateur, dans l'ordre de sa bibliothèque
+        fetched_df (DataFrame): Titres des playlists relues auprès de l'API
+        reuse (dict): Titres des playlists inchangées, par identifiant de playlist
+
+    Returns:
+        DataFrame: Titres de toutes les playlists
+    """
+    fetched = dict(tuple(fetched_df.groupby('playlist_id', sort=False))) if not fetched_df.empty else {}
+    frames = []
+    for playlist_id in playlists_df['playlist_id']:
+        frame = reuse.get(playlist_id, fetched.get(playlist_id))
+        if frame is not None and not frame.empty:
+            frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def playlists_fingerprint(playlists_df):
+    """
+    Empreinte de l'état des playlists (identifiants et snapshot_id, dans l'ordre)
+
+    Elle change dès qu'une playlist est ajoutée, supprimée, renommée ou modifiée.
+    """
+    state = playlists_df[['playlist_id', 'snapshot_id']].astype(str).to_numpy().tolist() \
+        if not playlists_df.empty else []
+    return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()
+
+
+# Dernière liste de playlists lue par get_source_fingerprint, reprise par l'extraction qui suit
+_source_playlists = {}
+
+
+def get_source_fingerprint(force_new_auth=False):
+    """
+    Empreinte des playlists Spotify de l'utilisateur (un seul parcours de la liste des playlists)
+
+    La liste lue est conservée pour l'extraction (voir take_source_playlists) : le pipeline ne
+    parcourt ainsi /me/playlists qu'une fois pour vérifier la source puis extraire.
+    """
+    connector = SpotifyConnector(force_new_auth=force_new_auth)
+    playlists_df = connector.get_playlists()
+    _source_playlists[connector.user_id] = playlists_df
+    return playlists_fingerprint(playlists_df)
+
+
+def take_source_playlists():
+    """
+    Playlists lues par le dernier get_source_fingerprint de l'utilisateur courant (une seule fois)
+
+    Returns:
+        DataFrame: Playlists, ou None si aucune n'est en attente
+    """
+    return _source_playlists.pop(SpotifyAuth.get_instance().user_id, None)
+
+
+def load_previous_extraction():
+    """
+    Titres et caractéristiques audio de l'extraction précédente, réutilisables par une extraction incrémentale
+
+    Returns:
+        tuple: (titres par playlist, snapshot_id par playlist, caractéristiques audio), ou None
+    """
+    if not (artifact_exists("tracks") and artifact_exists(LIBRARY_TABLES['playlists'])):
+        return None
+
+    playlists = load_artifact(LIBRARY_TABLES['playlists'])
+    if 'snapshot_id' not in playlists.columns:
+        # Extraction antérieure aux snapshot_id : impossible de savoir ce qui a changé
+        return None
+
+    tracks_df = load_artifact("tracks")
+    tracks_by_playlist = {playlist_id: frame.reset_index(drop=True)
+                          for playlist_id, frame in tracks_df.groupby('playlist_id', sort=False)}
+    snapshots = dict(zip(playlists['playlist_id'], playlists['snapshot_id']))
+    features_df = load_artifact("audio_features") if artifact_exists("audio_features") else None
+    return tracks_by_playlist, snapshots, features_df
+
+
+def plan_reuse(playlists_df, previous):
+    """
+    Titres réutilisables pour les playlists dont le snapshot_id n'a pas changé
+
+    Returns:
+        dict: Titres par identifiant de playlist
+    """
+    if previous is None or playlists_df.empty:
+        return {}
+    tracks_by_playlist, snapshots, _ = previous
+    return {
+        row['playlist_id']: tracks_by_playlist[row['playlist_id']]
+        for _, row in playlists_df.iterrows()
+        if row['snapshot_id'] and snapshots.get(row['playlist_id']) == row['snapshot_id']
+        and row['playlist_id'] in tracks_by_playlist
+    }
+
+
+def record_snapshot(tracks_df, playlists_df, features_df):
+    """Enregistre l'instantané de l'extraction ; un échec n'interrompt pas l'extraction"""
+    try:
+        return create_snapshot(tracks_df, playlists_df, features_df)
+    except Exception as e:
+        print(f"Erreur lors de l'enregistrement de l'instantané: {e}")
+        return None
+
+
+def extract_spotify_data(force_new_auth=False, num_workers=None, incremental=False, playlists_df=None):
     """
     Fonction principale pour extraire les données depuis Spotify
 
     Parameters:
         force_new_auth (bool): Si True, force une nouvelle authentification
+        num_workers (int): Nombre de processus d'extraction (par défaut EXTRACTION_WORKERS)
+        incremental (bool): Ne relire que les playlists modifiées depuis l'extraction précédente
+                            (snapshot_id différent) et les caractéristiques des nouveaux titres
+        playlists_df (DataFrame): Playlists déjà récupérées (par défaut get_playlists())
     """
+    if num_workers is None:
+        num_workers = EXTRACTION_WORKERS
+
+    telemetry.start_run("extraction")
     try:
         connector = SpotifyConnector(force_new_auth=force_new_auth)
 
+        previous = load_previous_extraction() if incremental else None
+        reuse = {}
+        if previous is not None:
+            if playlists_df is None:
+                playlists_df = connector.get_playlists()
+            reuse = plan_reuse(playlists_df, previous)
+            print(f"Extraction incrémentale: {len(reuse)} playlist(s) inchangée(s) réutilisée(s) "
+                  f"sur {len(playlists_df)}.")
+
         # Récupérer toutes les playlists et leurs titres
-        tracks_df = connector.get_all_playlist_tracks()
+        if num_workers > 1:
+            tracks_df = connector.get_all_playlist_tracks_sharded(num_workers, reuse=reuse, playlists_df=playlists_df)
+        else:
+            tracks_df = connector.get_all_playlist_tracks(reuse=reuse, playlists_df=playlists_df)
 
         if not tracks_df.empty:
             print(f"Récupéré {len(tracks_df)} titres au total.")
 
             # Sauvegarder les titres même si nous n'avons pas encore les caractéristiques audio
             # Cela nous permettra de continuer même si l'extraction des caractéristiques échoue
-            tracks_path = os.path.join(DATA_DIR, "tracks.csv")
-            tracks_df.to_csv(tracks_path, index=False)
+            tracks_path = save_artifact(tracks_df, "tracks", producer="extraction")
             print(f"Titres sauvegardés dans: {tracks_path}")
+            save_library(build_library(tracks_df, playlists_df=connector.playlists_df))
 
             try:
                 # Récupérer les caractéristiques audio
-                features_df = connector.get_audio_features(tracks_df)
+                features_df = connector.get_audio_features(
+                    tracks_df, known_features=previous[2] if previous is not None else None)
 
                 # Sauvegarder les caractéristiques audio et le dataset complet
                 if features_df is not None and not features_df.empty:
-                    features_path = os.path.join(DATA_DIR, "audio_features.csv")
-                    features_df.to_csv(features_path, index=False)
+                    features_path = save_artifact(features_df, "audio_features", producer="extraction")
                     print(f"Caractéristiques audio sauvegardées dans: {features_path}")
 
                     # Fusionner et sauvegarder un dataset complet
                     merged_df = pd.merge(tracks_df, features_df, on='track_id', how='left')
-                    merged_path = os.path.join(DATA_DIR, "tracks_with_features.csv")
-                    merged_df.to_csv(merged_path, index=False)
+                    merged_path = save_artifact(merged_df, "tracks_with_features", producer="extraction")
                     print(f"Dataset complet sauvegardé dans: {merged_path}")
+
+                    # Ajouter les caractéristiques audio à la base de recherche
+                    build_library_db()
                 else:
                     print(
                         "Avertissement: Caractéristiques audio non récupérées. Seules les informations de base des titres sont disponibles.")
 
+                record_snapshot(tracks_df, connector.playlists_df, features_df)
                 return tracks_df, features_df
 
             except Exception as audio_error:
                 print(f"Erreur lors de la récupération des caractéristiques audio: {audio_error}")
                 print("Continuation avec uniquement les informations de base des titres.")
+                record_snapshot(tracks_df, connector.playlists_df, None)
                 return tracks_df, None
         else:
             print("Aucun titre trouvé. Vérifiez vos playlists.")
@@ -227,6 +543,9 @@ def extract_spotify_data(force_new_auth=False):
     except Exception as e:
         print(f"Erreur lors de l'extraction des données Spotify: {e}")
         return None, None
+    finally:
+        # Bilan par endpoint et par playlist, comparé à l'exécution précédente
+        telemetry.finish_run()
 
 
 if __name__ == "__main__":
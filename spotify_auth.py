@@ -1,11 +1,39 @@
+import requests
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import os
+from api_scheduler import ScheduledSpotify, LANE_BACKGROUND
 from config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, DATA_DIR
 
 # Scope complet pour toutes les fonctionnalités
 SPOTIFY_FULL_SCOPE = "user-library-read user-top-read playlist-read-private playlist-modify-private user-read-recently-played"
 
+# Erreurs serveur réessayées par la session HTTP. Les réponses 429 ne le sont pas : elles remontent à
+# l'ordonnanceur (api_scheduler), qui suspend les appels de tous les processus le temps demandé par Spotify
+SERVER_ERROR_STATUSES = (500, 502, 503, 504)
+
+# Clients hérités du processus parent lors d'un fork (voir _reset_after_fork)
+_inherited = []
+
+
+def _reset_after_fork():
+    """
+    Processus enfant (fork, ex: processus d'extraction) : ne pas partager la session HTTP du parent
+
+    Le jeton (auth_manager et son cache) est conservé ; seules les sessions requests (client et
+    renouvellement du jeton) sont recréées. Les anciennes sont gardées sans être fermées : leurs
+    sockets appartiennent aussi au parent.
+    """
+    instance = SpotifyAuth._instance
+    if instance is not None:
+        _inherited.append(instance.sp)
+        session = getattr(instance.auth_manager, '_session', None)
+        if isinstance(session, requests.Session):
+            _inherited.append(session)
+            instance.auth_manager._session = requests.Session()
+        instance.sp = instance._create_client()
+
+
 class SpotifyAuth:
     _instance = None
 
@@ -45,7 +73,7 @@ class SpotifyAuth:
             open_browser=True
         )
 
-        self.sp = spotipy.Spotify(auth_manager=self.auth_manager)
+        self.sp = self._create_client()
 
         # Récupérer les informations de l'utilisateur pour confirmer l'authentification
         try:
@@ -57,10 +85,26 @@ class SpotifyAuth:
             print(f"Erreur lors de la récupération des informations utilisateur: {e}")
             raise
 
+    def _create_client(self):
+        sp = spotipy.Spotify(auth_manager=self.auth_manager, status_forcelist=SERVER_ERROR_STATUSES)
+        # urllib3 réessaie aussi une réponse 429 portant Retry-After : la laisser remonter à l'ordonnanceur
+        adapter = sp._session.get_adapter("https://")
+        adapter.max_retries = adapter.max_retries.new(respect_retry_after_header=False)
+        return sp
+
     def get_spotify_client(self):
         """Retourne le client Spotify connecté"""
         return self.sp
 
+    def get_scheduled_client(self, lane=LANE_BACKGROUND):
+        """
+        Retourne le client Spotify dont les appels passent par l'ordonnanceur du budget API
+
+        Parameters:
+            lane (str): Voie utilisée par les appels ('interactive' ou 'background')
+        """
+        return ScheduledSpotify(self.sp, self.user_id, lane=lane)
+
     def logout(self):
         """Déconnecte l'utilisateur en supprimant le fichier cache et l'instance"""
         try:
@@ -74,4 +118,8 @@ class SpotifyAuth:
             return True
         except Exception as e:
             print(f"Erreur lors de la déconnexion: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
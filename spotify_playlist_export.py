@@ -3,6 +3,8 @@ import os
 import time
 from config import DATA_DIR
 from spotify_auth import SpotifyAuth
+from api_scheduler import LANE_INTERACTIVE
+from storage import write_atomic
 
 
 def export_playlist_to_csv(playlist_df, name="custom_playlist"):
@@ -37,7 +39,7 @@ def export_playlist_to_csv(playlist_df, name="custom_playlist"):
         export_path = os.path.join(export_dir, filename)
 
         # Exporter au format CSV
-        playlist_df.to_csv(export_path, index=False)
+        write_atomic(export_path, lambda temp_path: playlist_df.to_csv(temp_path, index=False))
         print(f"Playlist exportée: {export_path}")
 
         return export_path
@@ -64,7 +66,7 @@ def create_spotify_playlist(playlist_name, playlist_description, track_ids, is_p
     try:
         # Obtenir une instance du client Spotify
         auth = SpotifyAuth.get_instance()
-        sp = auth.get_spotify_client()
+        sp = auth.get_scheduled_client(LANE_INTERACTIVE)
         user_id = auth.user_id
 
         # Créer la playlist
@@ -0,0 +1,624 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import APP_VERSION, EXPORT_CSV
+from data_lock import artifact_lock
+from generations import generation_path
+
+# Artefacts produits par les différentes étapes du pipeline (dans l'ordre de production)
+ARTIFACTS = [
+    "tracks",
+    "audio_features",
+    "tracks_with_features",
+    "cleaned_tracks",
+    "categorized_tracks",
+    # Bibliothèque normalisée (voir library.py)
+    "library_tracks",
+    "library_playlists",
+    "library_playlist_membership",
+    "library_artists",
+    # Index des lignes de la matrice des caractéristiques (voir feature_matrix.py)
+    "feature_matrix_index",
+    # Empreinte des données sources des titres nettoyés (voir data_processing.py)
+    "processed_rows",
+    # Codes des playlists de la colonne playlist_codes des titres nettoyés (voir data_processing.py)
+    "playlist_codes",
+    # Ordre des titres de l'index d'appartenance aux playlists (voir membership_index.py)
+    "membership_index_tracks",
+    # Pont titre/artiste et codes des artistes (voir data_processing.py)
+    "track_artists",
+    "artist_codes"
+]
+
+# Compression des fichiers Parquet (bon compromis taille/vitesse de lecture)
+PARQUET_COMPRESSION = "zstd"
+
+# Types explicites des colonnes connues du pipeline ; les colonnes inconnues gardent le type déduit
+_CATEGORY = pa.dictionary(pa.int8(), pa.string(), ordered=True)
+COLUMN_TYPES = {
+    # Titres et playlists
+    'track_id': pa.string(),
+    'track_name': pa.string(),
+    'artist_name': pa.string(),
+    'artist_ids': pa.list_(pa.string()),
+    'artist_names': pa.list_(pa.string()),
+    'album_name': pa.string(),
+    'release_date': pa.string(),
+    'popularity': pa.int64(),
+    'playlist_id': pa.string(),
+    'playlist_name': pa.string(),
+    'album_id': pa.string(),
+    'position': pa.int64(),
+    'playlist_owner': pa.string(),
+    'playlist_tracks': pa.int64(),
+    'snapshot_id': pa.string(),
+    'track_count': pa.int64(),
+    # Caractéristiques audio
+    'danceability': pa.float64(),
+    'energy': pa.float64(),
+    'key': pa.int64(),
+    'loudness': pa.float64(),
+    'mode': pa.int64(),
+    'speechiness': pa.float64(),
+    'acousticness': pa.float64(),
+    'instrumentalness': pa.float64(),
+    'liveness': pa.float64(),
+    'valence': pa.float64(),
+    'tempo': pa.float64(),
+    # Colonnes ajoutées par le nettoyage
+    'release_date_parsed': pa.timestamp('ns'),
+    'release_date_precision': pa.string(),
+    'release_year': pa.float64(),
+    'decade': pa.float64(),
+    'tempo_normalized': pa.float64(),
+    'energy_category': _CATEGORY,
+    'mood': _CATEGORY,
+    'playlist_codes': pa.list_(pa.int32()),
+    'playlist_count': pa.int64(),
+    'first_added_at': pa.timestamp('ns', tz='UTC'),
+    'playlist_code': pa.int64(),
+    # Pont titre/artiste
+    'artist_code': pa.int32(),
+    'artist_position': pa.int16(),
+    'artist_key': pa.string(),
+    'artist_id': pa.string(),
+    # Colonnes ajoutées par la catégorisation
+    'energy_dance_category': pa.string(),
+    'mood_category': _CATEGORY,
+    'acoustic_category': pa.string(),
+    'acoustic_mood_category': pa.string()
+}
+
+
+# Colonnes dont le nombre de valeurs distinctes est enregistré dans le manifeste
+MANIFEST_DISTINCT_COLUMNS = ['track_id', 'artist_name', 'album_name', 'playlist_id', 'playlist_name']
+
+# Dates conservées au format texte (leur précision varie : année, mois ou jour)
+_TEXT_DATE_COLUMNS = {'release_date', 'added_at', 'played_at'}
+
+
+def artifact_path(name, fmt="parquet"):
+    """
+    Chemin du fichier d'un artefact
+
+    Parameters:
+        name (str): Nom de l'artefact (ex: 'tracks')
+        fmt (str): 'parquet' ou 'csv'
+    """
+    return generation_path(f"{name}.{fmt}")
+
+
+def artifact_exists(name):
+    """Indique si un artefact est disponible (Parquet ou ancien fichier CSV)"""
+    return os.path.exists(artifact_path(name)) or os.path.exists(artifact_path(name, "csv"))
+
+
+def write_atomic(path, write):
+    """
+    Écrit un fichier dans un fichier temporaire puis le substitue à l'ancien (os.replace)
+
+    Un lecteur voit l'ancienne ou la nouvelle version, jamais un fichier partiellement écrit.
+
+    Parameters:
+        path (str): Chemin du fichier
+        write (callable): Fonction recevant le chemin temporaire à écrire
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def build_schema(df):
+    """
+    Construit le schéma Arrow d'un DataFrame à partir des types connus
+
+    Les colonnes déjà typées par pandas (numériques, dates, catégories, y compris après optimize_dtypes)
+    gardent leur type ; le type connu s'applique aux colonnes objet (chaînes, valeurs manquantes).
+
+    Parameters:
+        df (DataFrame): Données à sauvegarder
+
+    Returns:
+        pyarrow.Schema: Schéma explicite pour les colonnes connues, déduit pour les autres
+    """
+    inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    fields = []
+    for field in inferred:
+        untyped = df[field.name].dtype == object or pd.api.types.is_string_dtype(df[field.name].dtype)
+        if field.name in COLUMN_TYPES and (untyped or pa.types.is_null(field.type)):
+            field = pa.field(field.name, COLUMN_TYPES[field.name])
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def save_artifact(df, name, export_csv=None, producer=None):
+    """
+    Sauvegarde un artefact au format Parquet, avec son manifeste
+
+    Parameters:
+        df (DataFrame): Données à sauvegarder
+        name (str): Nom de l'artefact
+        export_csv (bool): Écrire aussi une copie CSV (par défaut MELODIA_EXPORT_CSV)
+        producer (str): Étape du pipeline qui produit l'artefact (ex: 'extraction')
+
+    Returns:
+        str: Chemin du fichier Parquet
+    """
+    if export_csv is None:
+        export_csv = EXPORT_CSV
+
+    try:
+        table = pa.Table.from_pandas(df, schema=build_schema(df), preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError) as e:
+        # Une colonne ne respecte pas son type attendu : conserver les types déduits plutôt que de perdre les données
+        print(f"Avertissement: schéma explicite non applicable pour {name} ({e}), types déduits utilisés.")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+    path = artifact_path(name)
+    csv_path = artifact_path(name, "csv")
+    # Verrou exclusif : les lecteurs attendent que le fichier, la copie CSV et le manifeste soient à jour
+    with artifact_lock(name, exclusive=True):
+        write_atomic(path, lambda temp_path: pq.write_table(table, temp_path, compression=PARQUET_COMPRESSION))
+
+        if export_csv:
+            write_atomic(csv_path, lambda temp_path: df.to_csv(temp_path, index=False))
+        elif os.path.exists(csv_path):
+            # Supprimer l'ancien CSV pour qu'il ne soit pas relu à la place du Parquet
+            os.remove(csv_path)
+
+        write_manifest(name, df, table.schema, producer=producer)
+    return path
+
+
+def save_artifact_batches(batches, name, export_csv=None, producer=None):
+    """
+    Sauvegarde un artefact lot par lot, sans jamais le charger entièrement en mémoire
+
+    Le schéma est celui du premier lot non vide ; le manifeste (lignes, valeurs distinctes) est calculé
+    au fil des lots. Le fichier n'est substitué à l'ancien qu'une fois tous les lots écrits.
+
+    Parameters:
+        batches (iterable): DataFrames à écrire, dans l'ordre
+        name (str): Nom de l'artefact
+        export_csv (bool): Écrire aussi une copie CSV (par défaut MELODIA_EXPORT_CSV)
+        producer (str): Étape du pipeline qui produit l'artefact
+
+    Returns:
+        str: Chemin du fichier Parquet
+    """
+    if export_csv is None:
+        export_csv = EXPORT_CSV
+
+    path = artifact_path(name)
+    csv_path = artifact_path(name, "csv")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    writer = None
+    schema = None
+    first_batch = None
+    rows = 0
+    distinct = {}
+
+    try:
+        for df in batches:
+            if first_batch is None:
+                first_batch = df
+            if df.empty:
+                continue
+            if writer is None:
+                schema = build_schema(df)
+                writer = pq.ParquetWriter(temp_path, schema, compression=PARQUET_COMPRESSION)
+                distinct = {column: set() for column in MANIFEST_DISTINCT_COLUMNS if column in df.columns}
+
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            rows += len(df)
+            for column, values in distinct.items():
+                values.update(df[column].dropna().unique())
+
+        if writer is None:
+            # Aucune ligne : artefact vide, avec les colonnes du premier lot
+            return save_artifact(first_batch if first_batch is not None else pd.DataFrame(), name,
+                                 export_csv=export_csv, producer=producer)
+        writer.close()
+        writer = None
+
+        def write_csv(temp_csv_path):
+            for i, batch in enumerate(pq.ParquetFile(path).iter_batches()):
+                batch.to_pandas().to_csv(temp_csv_path, mode="a" if i else "w", header=i == 0, index=False)
+
+        with artifact_lock(name, exclusive=True):
+            os.replace(temp_path, path)
+            if export_csv:
+                write_atomic(csv_path, write_csv)
+            elif os.path.exists(csv_path):
+                os.remove(csv_path)
+            _write_manifest(name, rows, {column: len(values) for column, values in distinct.items()},
+                            schema, producer)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path
+
+
+def iter_artifact_batches(name, batch_size, columns=None):
+    """
+    Lit un artefact par lots, sans charger le fichier entier
+
+    Parameters:
+        name (str): Nom de l'artefact
+        batch_size (int): Nombre de lignes par lot
+        columns (list): Colonnes à lire (par défaut toutes) ; les colonnes absentes sont ignorées
+
+    Yields:
+        DataFrame: Lot d'au plus batch_size lignes
+    """
+    path = artifact_path(name)
+    csv_path = artifact_path(name, "csv")
+    with artifact_lock(name):
+        if os.path.exists(path):
+            parquet_file = pq.ParquetFile(path)
+            if columns is not None:
+                columns = [col for col in columns if col in parquet_file.schema_arrow.names]
+            for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+                yield batch.to_pandas()
+        elif os.path.exists(csv_path):
+            usecols = (lambda col: col in columns) if columns is not None else None
+            for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=batch_size, low_memory=False):
+                yield chunk
+        else:
+            raise FileNotFoundError(f"Artefact introuvable: {name}")
+
+
+def load_artifact(name, columns=None, optimize=False):
+    """
+    Charge un artefact, en ne lisant que les colonnes demandées
+
+    Parameters:
+        name (str): Nom de l'artefact
+        columns (list): Colonnes à charger (par défaut toutes) ; les colonnes absentes sont ignorées
+        optimize (bool): Réduire la mémoire occupée (voir optimize_dtypes)
+
+    Returns:
+        DataFrame: Données de l'artefact
+    """
+    path = artifact_path(name)
+    csv_path = artifact_path(name, "csv")
+    with artifact_lock(name):
+        if os.path.exists(path):
+            if columns is not None:
+                available = set(pq.read_schema(path).names)
+                columns = [col for col in columns if col in available]
+            df = pq.read_table(path, columns=columns).to_pandas()
+        elif os.path.exists(csv_path):
+            # Fichier CSV produit par une version précédente
+            usecols = (lambda col: col in columns) if columns is not None else None
+            df = pd.read_csv(csv_path, usecols=usecols, low_memory=False)
+        else:
+            raise FileNotFoundError(f"Artefact introuvable: {name}")
+
+    return optimize_dtypes(df) if optimize else df
+
+
+def project_columns(df, columns=None):
+    """
+    Ne garde d'un DataFrame déjà chargé que les colonnes demandées, comme load_artifact
+
+    Utile lorsque les données viennent d'un calcul (ex: analyse relancée) plutôt que d'un fichier.
+
+    Parameters:
+        df (DataFrame): Données complètes (ou None)
+        columns (list): Colonnes à garder (par défaut toutes) ; les colonnes absentes sont ignorées
+
+    Returns:
+        DataFrame: Données limitées aux colonnes demandées
+    """
+    if df is None or columns is None:
+        return df
+    return df[[col for col in columns if col in df.columns]]
+
+
+def optimize_dtypes(df, categorical_ratio=0.5, report=False):
+    """
+    Réduit la mémoire occupée par un DataFrame
+
+    - chaînes répétées (artistes, albums, playlists, catégories) -> category
+    - flottants -> float32
+    - entiers -> plus petit type entier suffisant (ex: popularité -> int8)
+
+    Les identifiants (*_id) et les dates au format texte restent des chaînes.
+
+    Parameters:
+        df (DataFrame): Données à optimiser
+        categorical_ratio (float): Proportion maximale de valeurs distinctes pour passer en category
+        report (bool): Afficher la mémoire par colonne avant et après
+
+    Returns:
+        DataFrame: Données optimisées (nouvel objet)
+    """
+    if df is None or df.empty:
+        return df
+
+    before = df
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        dtype = series.dtype
+
+        if dtype == object or pd.api.types.is_string_dtype(dtype):
+            if column.endswith('_id') or column in _TEXT_DATE_COLUMNS:
+                continue
+            if series.map(type).isin([str, type(None), float]).all():
+                if series.nunique(dropna=True) <= categorical_ratio * len(series):
+                    df[column] = series.astype('category')
+        elif pd.api.types.is_float_dtype(dtype) and dtype != np.float32:
+            df[column] = series.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            df[column] = pd.to_numeric(series, downcast='integer')
+
+    if report:
+        print_memory_report(memory_report(before, df))
+
+    return df
+
+
+def memory_report(before, after):
+    """
+    Mémoire occupée par colonne avant et après optimisation
+
+    Returns:
+        DataFrame: Une ligne par colonne (types et octets avant/après), plus une ligne TOTAL
+    """
+    bytes_before = before.memory_usage(index=False, deep=True)
+    bytes_after = after.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after
+    })
+    report.loc['TOTAL'] = ['', '', bytes_before.sum(), bytes_after.sum()]
+    report['ratio'] = report['bytes_before'] / report['bytes_after'].where(report['bytes_after'] > 0)
+    return report
+
+
+def print_memory_report(report):
+    """Affiche un rapport produit par memory_report"""
+    for column, row in report.iterrows():
+        if column == 'TOTAL':
+            continue
+        print(f"  {column}: {row['dtype_before']} -> {row['dtype_after']}, "
+              f"{row['bytes_before'] / 1024:.1f} Ko -> {row['bytes_after'] / 1024:.1f} Ko")
+    total = report.loc['TOTAL']
+    print(f"Mémoire totale: {total['bytes_before'] / (1024 * 1024):.2f} Mo -> "
+          f"{total['bytes_after'] / (1024 * 1024):.2f} Mo")
+
+
+def manifest_path(name):
+    """Chemin du manifeste d'un artefact"""
+    return generation_path(f"{name}.manifest.json")
+
+
+def _file_signature(path):
+    """Taille et date de modification d'un fichier, pour savoir si un manifeste le décrit encore"""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _file_hash(path):
+    """Empreinte SHA-256 du contenu d'un fichier"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(name, df, schema=None, producer=None):
+    """
+    Écrit le manifeste d'un artefact : nombre de lignes, valeurs distinctes, schéma, empreinte et producteur
+
+    Les tableaux de bord et les clés de cache lisent ce petit fichier au lieu des données.
+
+    Parameters:
+        name (str): Nom de l'artefact (déjà sauvegardé)
+        df (DataFrame): Données de l'artefact
+        schema (pyarrow.Schema): Schéma écrit (par défaut déduit de df)
+        producer (str): Étape du pipeline qui a produit l'artefact
+
+    Returns:
+        dict: Manifeste écrit
+    """
+    if schema is None:
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+
+    distinct = {column: int(df[column].nunique()) for column in MANIFEST_DISTINCT_COLUMNS if column in df.columns}
+    return _write_manifest(name, len(df), distinct, schema, producer)
+
+
+def _write_manifest(name, rows, distinct, schema, producer):
+    """Écrit le manifeste d'un artefact à partir de statistiques déjà calculées (voir write_manifest)"""
+    path = artifact_path(name)
+    if not os.path.exists(path):
+        path = artifact_path(name, "csv")
+
+    manifest = {
+        'name': name,
+        'file': os.path.basename(path),
+        'rows': int(rows),
+        'distinct': distinct,
+        'schema': {field.name: str(field.type) for field in schema},
+        'content_hash': _file_hash(path),
+        'file_signature': _file_signature(path),
+        'producer': {'stage': producer, 'version': APP_VERSION},
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+
+    def write(temp_path):
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    with artifact_lock(name, exclusive=True):
+        write_atomic(manifest_path(name), write)
+    return manifest
+
+
+def load_manifest(name):
+    """
+    Manifeste d'un artefact
+
+    Si le manifeste manque ou ne correspond plus au fichier (artefact d'une version précédente,
+    fichier remplacé à la main), il est reconstruit une fois à partir des données.
+
+    Returns:
+        dict: Manifeste, ou None si l'artefact n'existe pas
+    """
+    with artifact_lock(name):
+        if not artifact_exists(name):
+            return None
+        manifest, current = _read_manifest(name)
+        if current:
+            return manifest
+
+    with artifact_lock(name, exclusive=True):
+        # Un autre processus a pu reconstruire le manifeste entre-temps
+        if not artifact_exists(name):
+            return None
+        manifest, current = _read_manifest(name)
+        if current:
+            return manifest
+
+        print(f"Manifeste absent ou périmé pour {name}, reconstruction...")
+        producer = manifest.get('producer', {}).get('stage')
+        return write_manifest(name, load_artifact(name), producer=producer)
+
+
+def _read_manifest(name):
+    """
+    Lit le manifeste d'un artefact existant
+
+    Returns:
+        tuple: (manifeste ou dict vide, True si le manifeste décrit le fichier actuel)
+    """
+    path = artifact_path(name)
+    if not os.path.exists(path):
+        path = artifact_path(name, "csv")
+
+    try:
+        with open(manifest_path(name), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}, False
+    return manifest, (manifest.get('file') == os.path.basename(path)
+                      and manifest.get('file_signature') == _file_signature(path))
+
+
+def artifact_row_count(name):
+    """Nombre de lignes d'un artefact (0 s'il n'existe pas), lu dans son manifeste"""
+    manifest = load_manifest(name)
+    return manifest['rows'] if manifest is not None else 0
+
+
+def artifact_distinct_count(name, column):
+    """
+    Nombre de valeurs distinctes d'une colonne d'un artefact, lu dans son manifeste
+
+    Returns:
+        int: Nombre de valeurs distinctes (0 si l'artefact ou la colonne est absent)
+    """
+    manifest = load_manifest(name)
+    if manifest is None:
+        return 0
+    if column in manifest['distinct']:
+        return manifest['distinct'][column]
+    if column not in manifest['schema']:
+        return 0
+    # Colonne non suivie par le manifeste
+    return int(load_artifact(name, columns=[column])[column].nunique())
+
+
+def artifact_fingerprint(name):
+    """Empreinte du contenu d'un artefact (pour les clés de cache), ou None s'il n'existe pas"""
+    manifest = load_manifest(name)
+    return manifest['content_hash'] if manifest is not None else None
+
+
+def preview_artifact(name, n=5, columns=None):
+    """
+    Premières lignes d'un artefact, sans lire le reste du fichier
+
+    Parameters:
+        name (str): Nom de l'artefact
+        n (int): Nombre de lignes
+        columns (list): Colonnes à lire (par défaut toutes) ; les colonnes absentes sont ignorées
+
+    Returns:
+        DataFrame: Au plus n lignes
+    """
+    path = artifact_path(name)
+    with artifact_lock(name):
+        if not os.path.exists(path):
+            df = pd.read_csv(artifact_path(name, "csv"), nrows=n)
+            return df[[col for col in columns if col in df.columns]] if columns is not None else df
+
+        parquet_file = pq.ParquetFile(path)
+        if columns is not None:
+            columns = [col for col in columns if col in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=n, columns=columns):
+            return pa.Table.from_batches([batch]).to_pandas()
+        schema = parquet_file.schema_arrow
+        return schema.empty_table().select(columns if columns is not None else schema.names).to_pandas()
+
+
+def artifact_columns(name):
+    """Liste des colonnes d'un artefact sans charger les données"""
+    path = artifact_path(name)
+    with artifact_lock(name):
+        if os.path.exists(path):
+            return pq.read_schema(path).names
+        return pd.read_csv(artifact_path(name, "csv"), nrows=0).columns.tolist()
+
+
+def delete_artifact(name):
+    """
+    Supprime toutes les versions d'un artefact
+
+    Returns:
+        list: Chemins des fichiers supprimés
+    """
+    removed = []
+    with artifact_lock(name, exclusive=True):
+        for path in (artifact_path(name), artifact_path(name, "csv"), manifest_path(name)):
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+    return removed
@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import glob
+import time
+import datetime
+import threading
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from config import DATA_DIR
+
+# Les bilans de chaque exécution sont écrits à côté des logs de l'application
+METRICS_DIR = os.path.join(DATA_DIR, "logs")
+
+# Bornes supérieures (ms) des classes de l'histogramme de latence ; la dernière classe est ouverte
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000]
+
+# Identifiants Spotify (base62, 22 caractères) remplacés dans les URLs pour regrouper par endpoint
+_SPOTIFY_ID_PATTERN = re.compile(r'/[0-9A-Za-z]{22}(?=/|$)')
+
+# Exécution mesurée dans le contexte courant (thread ou tâche) : les appels faits au même moment par
+# d'autres threads du processus (pages, synchronisation de l'historique) n'y sont pas comptés
+_current_run = contextvars.ContextVar('telemetry_run', default=None)
+
+
+def _empty_endpoint_stats():
+    return {
+        'calls': 0,
+        'errors': 0,
+        'total_latency': 0.0,
+        'max_latency': 0.0,
+        'latency_histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+        'response_bytes': 0,
+        'retries': 0,
+        'total_wait': 0.0,
+        'max_wait': 0.0
+    }
+
+
+def endpoint_name(method_name, args):
+    """
+    Nom d'endpoint utilisé pour regrouper les mesures
+
+    Les appels de pagination (next/previous) sont rattachés à l'URL qu'ils suivent.
+    """
+    if method_name in ('next', 'previous') and args and isinstance(args[0], dict) and args[0].get('href'):
+        path = _SPOTIFY_ID_PATTERN.sub('/{id}', urlparse(args[0]['href']).path)
+        return f"{method_name} {path}"
+    return method_name
+
+
+class ExtractionTelemetry:
+    """Mesures collectées pendant une exécution (latence, volume, nouvelles tentatives, attente)"""
+
+    def __init__(self, name="extraction"):
+        self.name = name
+        self.started_at = time.time()
+        self.finished_at = None
+        self.endpoints = {}
+        self.playlists = {}
+        self._lock = threading.Lock()
+
+    def record_call(self, endpoint, latency, response_bytes=0, retries=0, wait=0.0, error=False):
+        """
+        Enregistre un appel à l'API
+
+        Parameters:
+            endpoint (str): Nom de l'endpoint
+            latency (float): Durée de l'appel (secondes)
+            response_bytes (int): Taille de la réponse
+            retries (int): Nombre de nouvelles tentatives
+            wait (float): Temps passé à attendre l'ordonnanceur (secondes)
+            error (bool): L'appel a échoué
+        """
+        latency_ms = latency * 1000
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound),
+                      len(LATENCY_BUCKETS_MS))
+
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, _empty_endpoint_stats())
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+            stats['latency_histogram'][bucket] += 1
+            stats['response_bytes'] += response_bytes
+            stats['retries'] += retries
+            stats['total_wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+
+    def record_playlist(self, playlist_id, playlist_name, pages, tracks, duration):
+        """Enregistre le nombre de pages lues pour une playlist et le temps passé"""
+        with self._lock:
+            self.playlists[playlist_id] = {
+                'playlist_name': playlist_name,
+                'pages': pages,
+                'tracks': tracks,
+                'duration': duration
+            }
+
+    def merge(self, other):
+        """Ajoute les mesures d'une autre exécution (dict produit par to_dict, ex: processus d'extraction)"""
+        with self._lock:
+            for endpoint, other_stats in other.get('endpoints', {}).items():
+                stats = self.endpoints.setdefault(endpoint, _empty_endpoint_stats())
+                for key, value in other_stats.items():
+                    if key == 'latency_histogram':
+                        stats[key] = [a + b for a, b in zip(stats[key], value)]
+                    elif key.startswith('max_'):
+                        stats[key] = max(stats[key], value)
+                    elif key in stats:
+                        stats[key] += value
+            self.playlists.update(other.get('playlists', {}))
+
+    def to_dict(self):
+        with self._lock:
+            finished_at = self.finished_at or time.time()
+            endpoints = {}
+            for endpoint, stats in self.endpoints.items():
+                endpoints[endpoint] = dict(stats, latency_histogram=list(stats['latency_histogram']))
+                endpoints[endpoint]['avg_latency'] = stats['total_latency'] / stats['calls'] if stats['calls'] else 0.0
+
+            return {
+                'name': self.name,
+                'started_at': datetime.datetime.fromtimestamp(self.started_at).isoformat(),
+                'duration': finished_at - self.started_at,
+                'total_calls': sum(stats['calls'] for stats in self.endpoints.values()),
+                'latency_buckets_ms': LATENCY_BUCKETS_MS,
+                'endpoints': endpoints,
+                'playlists': dict(self.playlists)
+            }
+
+
+def start_run(name="extraction"):
+    """Démarre la collecte des mesures d'une nouvelle exécution dans le contexte courant"""
+    run = ExtractionTelemetry(name)
+    _current_run.set(run)
+    return run
+
+
+def current_run():
+    """Exécution mesurée dans le contexte courant, ou None (aucune mesure n'est alors collectée)"""
+    return _current_run.get()
+
+
+@contextmanager
+def use_run(run):
+    """
+    Rattache les appels du thread courant à une exécution démarrée dans un autre thread
+
+    Les threads ne reprennent pas le contexte de leur créateur : un thread de travail lancé par une
+    exécution mesurée doit recevoir l'exécution explicitement (ex: with telemetry.use_run(run): ...).
+    """
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+def finish_run(save=True):
+    """
+    Termine la collecte et écrit le bilan de l'exécution
+
+    Returns:
+        dict: Bilan de l'exécution, avec la comparaison à l'exécution précédente
+    """
+    run = _current_run.get()
+    _current_run.set(None)
+
+    if run is None:
+        return None
+
+    run.finished_at = time.time()
+    summary = run.to_dict()
+    previous = _load_previous_summary(run.name)
+    summary['comparison'] = compare_summaries(previous, summary) if previous else None
+
+    if save:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        timestamp = datetime.datetime.fromtimestamp(run.started_at).strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(METRICS_DIR, f"{run.name}_metrics_{timestamp}.json")
+        # Importation différée : storage dépend de pyarrow, inutile pour mesurer les appels
+        from storage import write_atomic
+
+        def write(temp_path):
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+
+        # Le bilan le plus récent est relu par l'exécution suivante : jamais de fichier partiel
+        write_atomic(path, write)
+        print(f"Bilan des appels API sauvegardé dans: {path}")
+
+    print_summary(summary)
+    return summary
+
+
+def _load_previous_summary(name):
+    paths = sorted(glob.glob(os.path.join(METRICS_DIR, f"{name}_metrics_*.json")))
+    if not paths:
+        return None
+    try:
+        with open(paths[-1], "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Impossible de lire le bilan précédent {paths[-1]}: {e}")
+        return None
+
+
+def compare_summaries(previous, current):
+    """
+    Compare deux bilans d'exécution
+
+    Returns:
+        dict: Écarts de durée totale et, par endpoint, du nombre d'appels et de la latence moyenne
+    """
+    comparison = {
+        'previous_started_at': previous.get('started_at'),
+        'duration_delta': current['duration'] - previous.get('duration', 0.0),
+        'total_calls_delta': current['total_calls'] - previous.get('total_calls', 0),
+        'endpoints': {}
+    }
+
+    previous_endpoints = previous.get('endpoints', {})
+    for endpoint in sorted(set(previous_endpoints) | set(current['endpoints'])):
+        before = previous_endpoints.get(endpoint, {})
+        after = current['endpoints'].get(endpoint, {})
+        comparison['endpoints'][endpoint] = {
+            'calls_delta': after.get('calls', 0) - before.get('calls', 0),
+            'avg_latency_delta': after.get('avg_latency', 0.0) - before.get('avg_latency', 0.0),
+            'total_latency_delta': after.get('total_latency', 0.0) - before.get('total_latency', 0.0)
+        }
+
+    return comparison
+
+
+def print_summary(summary, top_n=5):
+    """Affiche les endpoints et les playlists qui dominent la durée de l'exécution"""
+    print(f"\nAppels API: {summary['total_calls']} en {summary['duration']:.1f}s")
+
+    endpoints = sorted(summary['endpoints'].items(), key=lambda item: item[1]['total_latency'], reverse=True)
+    for endpoint, stats in endpoints[:top_n]:
+        print(f"  {endpoint}: {stats['calls']} appels, {stats['total_latency']:.1f}s "
+              f"(moy. {stats['avg_latency'] * 1000:.0f} ms, attente {stats['total_wait']:.1f}s, "
+              f"{stats['retries']} nouvelles tentatives, {stats['response_bytes'] / 1024:.0f} Ko)")
+
+    playlists = sorted(summary['playlists'].values(), key=lambda p: p['duration'], reverse=True)
+    if playlists:
+        print("Playlists les plus longues à extraire:")
+        for playlist in playlists[:top_n]:
+            print(f"  {playlist['playlist_name']}: {playlist['pages']} pages, "
+                  f"{playlist['tracks']} titres, {playlist['duration']:.1f}s")
+
+    comparison = summary.get('comparison')
+    if comparison:
+        print(f"Par rapport à l'exécution précédente: {comparison['duration_delta']:+.1f}s, "
+              f"{comparison['total_calls_delta']:+d} appels")
@@ -1,16 +1,142 @@
 import pandas as pd
 import os
-from config import DATA_DIR
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import DATA_DIR, TOP_DATA_CACHE_TTL, SPOTIFY_MARKET
 from spotify_auth import SpotifyAuth
+from api_scheduler import LANE_INTERACTIVE
+from storage import write_atomic
+
+TIME_RANGES = ['short_term', 'medium_term', 'long_term']
+
+# Nombre maximum d'éléments renvoyés par les endpoints top/recently-played :
+# on récupère toujours la liste complète, les appels plus courts sont servis depuis le cache
+API_ITEMS_LIMIT = 50
+
+# Les écoutes récentes évoluent plus vite que les tops
+RECENTLY_PLAYED_CACHE_TTL = min(TOP_DATA_CACHE_TTL, 300)
+
+# Réponses de l'API par (utilisateur, type, période) : {clé: (horodatage, éléments)}
+_api_cache = {}
+_api_cache_lock = threading.Lock()
+
+# Meilleurs titres par (artiste, marché) : indépendants de l'utilisateur, partagés par tous
+_artist_tracks_cache = {}
+
+# Nombre maximum de requêtes artist_top_tracks simultanées
+ARTIST_TRACKS_WORKERS = 15
+
+
+def clear_top_data_cache(user_id=None):
+    """Vide le cache des tops (pour un utilisateur ou pour tous)"""
+    with _api_cache_lock:
+        for key in list(_api_cache):
+            if user_id is None or key[0] == user_id:
+                del _api_cache[key]
+        if user_id is None:
+            _artist_tracks_cache.clear()
+
 
 class TopArtistsAnalyzer:
     def __init__(self, force_new_auth=False):
         """Initialise l'analyseur des artistes les plus écoutés"""
         auth = SpotifyAuth.get_instance(force_new_auth)
-        self.sp = auth.get_spotify_client()
+        # Les pages affichées attendent ces réponses : voie interactive prioritaire
+        self.sp = auth.get_scheduled_client(LANE_INTERACTIVE)
         self.user_id = auth.user_id
         self.user_name = auth.user_name
 
+    def _fetch_items(self, kind, time_range=None, force_refresh=False):
+        """
+        Récupère les éléments bruts d'un endpoint, en passant par le cache
+
+        Parameters:
+            kind (str): 'top_artists', 'top_tracks' ou 'recently_played'
+            time_range (str): Période d'analyse (ignorée pour 'recently_played')
+            force_refresh (bool): Si True, ignore le cache
+
+        Returns:
+            list: Éléments renvoyés par l'API
+        """
+        key = (self.user_id, kind, time_range)
+        ttl = RECENTLY_PLAYED_CACHE_TTL if kind == 'recently_played' else TOP_DATA_CACHE_TTL
+
+        if not force_refresh:
+            with _api_cache_lock:
+                cached = _api_cache.get(key)
+            if cached and time.time() - cached[0] < ttl:
+                return cached[1]
+
+        if kind == 'top_artists':
+            results = self.sp.current_user_top_artists(time_range=time_range, limit=API_ITEMS_LIMIT)
+        elif kind == 'top_tracks':
+            results = self.sp.current_user_top_tracks(time_range=time_range, limit=API_ITEMS_LIMIT)
+        elif kind == 'recently_played':
+            results = self.sp.current_user_recently_played(limit=API_ITEMS_LIMIT)
+        else:
+            raise ValueError(f"Type de données inconnu: {kind}")
+
+        items = results['items']
+        with _api_cache_lock:
+            _api_cache[key] = (time.time(), items)
+        return items
+
+    def prefetch(self, requests, force_refresh=False):
+        """
+        Récupère en parallèle plusieurs listes (chaque requête distincte n'est émise qu'une fois)
+
+        Une requête en échec n'est pas mise en cache : l'accesseur correspondant renverra
+        une liste vide comme s'il avait été appelé directement.
+
+        Parameters:
+            requests (list): Couples (type, période) à récupérer
+            force_refresh (bool): Si True, ignore le cache
+        """
+        requests = list(dict.fromkeys(requests))
+        if not requests:
+            return
+        with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            futures = [executor.submit(self._fetch_items, kind, time_range, force_refresh)
+                       for kind, time_range in requests]
+            for (kind, time_range), future in zip(requests, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Erreur lors de la récupération des données {kind} ({time_range or 'récentes'}): {e}")
+
+    def _fetch_artist_top_tracks(self, artist_id, market):
+        key = (artist_id, market)
+        with _api_cache_lock:
+            cached = _artist_tracks_cache.get(key)
+        if cached and time.time() - cached[0] < TOP_DATA_CACHE_TTL:
+            return cached[1]
+
+        tracks = self.sp.artist_top_tracks(artist_id, country=market)['tracks']
+        with _api_cache_lock:
+            _artist_tracks_cache[key] = (time.time(), tracks)
+        return tracks
+
+    def get_artists_top_tracks(self, artist_ids, market=None):
+        """
+        Récupère en parallèle les meilleurs titres de plusieurs artistes
+
+        Parameters:
+            artist_ids (list): Identifiants Spotify des artistes
+            market (str): Code pays du marché (par défaut SPOTIFY_MARKET)
+
+        Returns:
+            dict: Liste des titres par identifiant d'artiste
+        """
+        market = market or SPOTIFY_MARKET
+        artist_ids = list(dict.fromkeys(artist_ids))
+        if not artist_ids:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=min(ARTIST_TRACKS_WORKERS, len(artist_ids))) as executor:
+            results = executor.map(lambda artist_id: self._fetch_artist_top_tracks(artist_id, market), artist_ids)
+            return dict(zip(artist_ids, results))
+
     def get_top_artists(self, time_range='medium_term', limit=10):
         """
         Récupère les artistes les plus écoutés
@@ -23,11 +149,11 @@ class TopArtistsAnalyzer:
             list: Liste des artistes les plus écoutés
         """
         try:
-            results = self.sp.current_user_top_artists(time_range=time_range, limit=limit)
+            items = self._fetch_items('top_artists', time_range)[:limit]
 
             # Créer une liste d'artistes
             artists = []
-            for i, item in enumerate(results['items']):
+            for i, item in enumerate(items):
                 artist = {
                     'position': i + 1,
                     'id': item['id'],
@@ -56,11 +182,11 @@ class TopArtistsAnalyzer:
             list: Liste des titres les plus écoutés
         """
         try:
-            results = self.sp.current_user_top_tracks(time_range=time_range, limit=limit)
+            items = self._fetch_items('top_tracks', time_range)[:limit]
 
             # Créer une liste de titres
             tracks = []
-            for i, item in enumerate(results['items']):
+            for i, item in enumerate(items):
                 track = {
                     'position': i + 1,
                     'id': item['id'],
@@ -78,7 +204,7 @@ class TopArtistsAnalyzer:
             print(f"Erreur lors de la récupération des titres les plus écoutés: {e}")
             return []
 
-    def create_top_artists_playlist(self, time_range='medium_term', tracks_per_artist=2, total_limit=30):
+    def create_top_artists_playlist(self, time_range='medium_term', tracks_per_artist=2, total_limit=30, market=None):
         """
         Crée une playlist avec les titres des artistes les plus écoutés
 
@@ -86,6 +212,7 @@ class TopArtistsAnalyzer:
             time_range (str): Période d'analyse
             tracks_per_artist (int): Nombre de titres à inclure par artiste
             total_limit (int): Limite totale de titres dans la playlist
+            market (str): Code pays du marché (par défaut SPOTIFY_MARKET)
 
         Returns:
             dict: Informations sur la playlist créée
@@ -97,10 +224,12 @@ class TopArtistsAnalyzer:
             if not top_artists:
                 return None
 
-            # Pour chaque artiste, récupérer ses meilleurs titres
+            # Récupérer simultanément les meilleurs titres de chaque artiste
+            top_tracks_by_artist = self.get_artists_top_tracks([artist['id'] for artist in top_artists], market)
+
             track_uris = []
             for artist in top_artists:
-                artist_tracks = self.sp.artist_top_tracks(artist['id'], country='FR')['tracks']
+                artist_tracks = top_tracks_by_artist.get(artist['id'], [])
                 # Prendre les N meilleurs titres de chaque artiste
                 for track in artist_tracks[:tracks_per_artist]:
                     track_uris.append(track['uri'])
@@ -153,11 +282,11 @@ class TopArtistsAnalyzer:
             list: Liste des titres récemment écoutés
         """
         try:
-            results = self.sp.current_user_recently_played(limit=limit)
+            items = self._fetch_items('recently_played')[:limit]
 
             # Créer une liste de titres
             tracks = []
-            for i, item in enumerate(results['items']):
+            for i, item in enumerate(items):
                 track = item['track']
                 played_at = item['played_at']
                 track_info = {
@@ -208,15 +337,15 @@ class TopArtistsAnalyzer:
             recent_path = os.path.join(top_dir, "recently_played.csv")
 
             if not artists_df.empty:
-                artists_df.to_csv(artists_path, index=False)
+                write_atomic(artists_path, lambda temp_path: artists_df.to_csv(temp_path, index=False))
                 print(f"Top artistes sauvegardés dans: {artists_path}")
 
             if not tracks_df.empty:
-                tracks_df.to_csv(tracks_path, index=False)
+                write_atomic(tracks_path, lambda temp_path: tracks_df.to_csv(temp_path, index=False))
                 print(f"Top titres sauvegardés dans: {tracks_path}")
 
             if not recent_df.empty:
-                recent_df.to_csv(recent_path, index=False)
+                write_atomic(recent_path, lambda temp_path: recent_df.to_csv(temp_path, index=False))
                 print(f"Titres récemment écoutés sauvegardés dans: {recent_path}")
 
             return artists_path, tracks_path, recent_path
@@ -225,12 +354,13 @@ class TopArtistsAnalyzer:
             return None, None, None
 
 
-def analyze_top_artists(force_new_auth=False):
+def analyze_top_artists(force_new_auth=False, force_refresh=False):
     """
     Fonction principale pour analyser les artistes les plus écoutés
 
     Parameters:
         force_new_auth (bool): Si True, force une nouvelle authentification
+        force_refresh (bool): Si True, ignore les données en cache
 
     Returns:
         dict: Résultats de l'analyse
@@ -238,6 +368,12 @@ def analyze_top_artists(force_new_auth=False):
     try:
         analyzer = TopArtistsAnalyzer(force_new_auth=force_new_auth)
 
+        # Toutes les données nécessaires en un seul aller-retour : les 3 périodes d'artistes,
+        # plus les titres et les écoutes récentes utilisés pour la sauvegarde
+        analyzer.prefetch([('top_artists', time_range) for time_range in TIME_RANGES] +
+                          [('top_tracks', 'medium_term'), ('recently_played', None)],
+                          force_refresh=force_refresh)
+
         # Récupérer les artistes les plus écoutés pour différentes périodes
         short_term = analyzer.get_top_artists(time_range='short_term', limit=10)
         medium_term = analyzer.get_top_artists(time_range='medium_term', limit=10)
@@ -4,9 +4,16 @@ import seaborn as sns
 import os
 import numpy as np
 from config import DATA_DIR
-from data_processing import load_data, process_data
+from storage import artifact_exists, load_artifact, project_columns
+from feature_matrix import load_aligned_feature_matrix
+from data_processing import artist_track_counts, explode_playlists, load_data, process_data
 from data_analysis import analyze_data
 
+# Colonnes lues pour les graphiques (track_id aligne les titres sur la matrice des caractéristiques)
+VISUALIZATION_COLUMNS = ['track_id', 'artist_name', 'playlist_name', 'playlist_codes', 'danceability', 'energy',
+                         'valence', 'acousticness', 'instrumentalness', 'energy_dance_category',
+                         'acoustic_mood_category']
+
 # Configuration du style de visualisation
 sns.set_style("whitegrid")
 plt.rcParams['figure.figsize'] = (12, 8)
@@ -32,7 +39,8 @@ def plot_top_artists(df, top_n=15):
     if df is None or df.empty:
         return None
 
-    top_artists = df['artist_name'].value_counts().head(top_n)
+    # Un titre compte pour chacun de ses artistes (pont titre/artiste, voir data_processing)
+    top_artists = artist_track_counts(df).head(top_n)
 
     fig, ax = plt.subplots(figsize=(12, 8))
     bars = sns.barplot(x=top_artists.values, y=top_artists.index, ax=ax)
@@ -63,8 +71,12 @@ def plot_audio_features_distribution(df):
     fig, axes = plt.subplots(2, 2, figsize=(14, 10))
     axes = axes.flatten()
 
+    # Lire les colonnes dans la matrice float32 (sans copie) si elle correspond aux données
+    matrix = load_aligned_feature_matrix(df, audio_features)
+
     for i, feature in enumerate(audio_features):
-        sns.histplot(df[feature], kde=True, ax=axes[i])
+        values = matrix.column(feature) if matrix is not None else df[feature]
+        sns.histplot(values, kde=True, ax=axes[i])
         axes[i].set_title(f"Distribution de {feature}", fontsize=14)
         axes[i].set_xlabel(feature, fontsize=12)
         axes[i].set_ylabel("Nombre de titres", fontsize=12)
@@ -84,9 +96,13 @@ def plot_energy_valence_scatter(df):
         print("Colonnes manquantes pour le nuage de points Énergie/Valence.")
         return None
 
-    # Limiter le nombre de playlists pour la lisibilité
-    top_playlists = df['playlist_name'].value_counts().head(10).index.tolist()
-    plot_df = df[df['playlist_name'].isin(top_playlists)]
+    # Limiter le nombre de playlists pour la lisibilité (un titre est affiché dans chacune de ses playlists)
+    plot_df = explode_playlists(df, ['energy', 'valence'])
+    top_playlists = plot_df['playlist_name'].value_counts().head(10).index.tolist()
+    plot_df = plot_df[plot_df['playlist_name'].isin(top_playlists)]
+    if isinstance(plot_df['playlist_name'].dtype, pd.CategoricalDtype):
+        # Ne pas afficher dans la légende les playlists écartées
+        plot_df = plot_df.assign(playlist_name=plot_df['playlist_name'].cat.remove_unused_categories())
 
     fig, ax = plt.subplots(figsize=(14, 10))
     scatter = sns.scatterplot(
@@ -136,11 +152,12 @@ def plot_playlist_profiles(df):
         print("Caractéristiques manquantes pour les profils de playlist.")
         return None
 
-    # Calculer la moyenne des caractéristiques par playlist
-    playlist_profiles = df.groupby('playlist_name')[features].mean()
+    # Calculer la moyenne des caractéristiques par playlist (un titre compte dans chacune de ses playlists)
+    playlists = explode_playlists(df, features)
+    playlist_profiles = playlists.groupby('playlist_name', observed=True)[features].mean()
 
     # Limiter à un nombre raisonnable de playlists
-    top_playlists = df['playlist_name'].value_counts().head(6).index
+    top_playlists = playlists['playlist_name'].value_counts().head(6).index
     playlist_profiles = playlist_profiles.loc[top_playlists]
 
     # Nombre de variables
@@ -215,13 +232,12 @@ def plot_categorized_tracks(df):
 def create_visualizations():
     """Fonction principale pour créer toutes les visualisations"""
     # Charger les données catégorisées si disponibles
-    categorized_path = os.path.join(DATA_DIR, "categorized_tracks.csv")
-
-    if os.path.exists(categorized_path):
-        df = pd.read_csv(categorized_path)
+    if artifact_exists("categorized_tracks"):
+        df = load_artifact("categorized_tracks", columns=VISUALIZATION_COLUMNS, optimize=True)
     else:
         # Si les données catégorisées ne sont pas disponibles, exécuter l'analyse
         _, _, df = analyze_data()
+        df = project_columns(df, VISUALIZATION_COLUMNS)
 
     if df is not None:
         print("Création des visualisations...")